@@ -1,16 +1,128 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import event, inspect as sqlalchemy_inspect
+from sqlalchemy.engine import make_url
 
 db = SQLAlchemy()
 
+
+def _sqlite_su_file(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def _configura_sqlite(app):
+    """Applica il profilo SQLITE_PROFILO (PRAGMA) a ogni nuova connessione SQLite."""
+    from config import SQLITE_PROFILI
+    engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return
+    profilo = app.config.get('SQLITE_PROFILO', 'produzione')
+    if profilo not in SQLITE_PROFILI:
+        raise ValueError(f'SQLITE_PROFILO sconosciuto: {profilo!r} (disponibili: {", ".join(SQLITE_PROFILI)})')
+    pragma = dict(SQLITE_PROFILI[profilo])
+    if app.config.get('SQLITE_BUSY_TIMEOUT_MS') is not None:
+        pragma['busy_timeout'] = app.config['SQLITE_BUSY_TIMEOUT_MS']
+    if not _sqlite_su_file(app.config['SQLALCHEMY_DATABASE_URI']):
+        pragma.pop('journal_mode', None)  # WAL non si applica ai DB in memoria
+    if not pragma:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _imposta_pragma(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for nome, valore in pragma.items():
+            cursor.execute(f'PRAGMA {nome}={valore}')
+        cursor.close()
+
+
+_INDICI_OBSOLETI = (
+    'ix_codici_prenotazione_email',
+    'ix_prenotazioni_email_stato_timestamp',
+    'ix_prenotazioni_stato_timestamp',
+    'ix_modifiche_posti_versione',
+)
+
+# Indici su cui si basa la correttezza (non solo la velocità): senza, l'avvio fallisce
+_INDICI_OBBLIGATORI = {
+    # _prenota si affida a questo indice (IntegrityError) per escludere le doppie prenotazioni
+    'uq_prenotazioni_posto_confermata': (
+        'Indice uq_prenotazioni_posto_confermata non creato ({e}): il DB contiene più prenotazioni '
+        "confermate per lo stesso posto (SELECT posto_id FROM prenotazioni WHERE stato = 'confermata' "
+        'GROUP BY posto_id HAVING count(*) > 1). Cancellare i doppioni prima di avviare.'),
+}
+
+_FTS_PRENOTAZIONI = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS prenotazioni_fts USING fts5("
+    "nome, nome_allieva, email, content='prenotazioni', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS prenotazioni_fts_ai AFTER INSERT ON prenotazioni BEGIN "
+    "INSERT INTO prenotazioni_fts(rowid, nome, nome_allieva, email) VALUES (new.id, new.nome, new.nome_allieva, new.email); END",
+    "CREATE TRIGGER IF NOT EXISTS prenotazioni_fts_ad AFTER DELETE ON prenotazioni BEGIN "
+    "INSERT INTO prenotazioni_fts(prenotazioni_fts, rowid, nome, nome_allieva, email) "
+    "VALUES ('delete', old.id, old.nome, old.nome_allieva, old.email); END",
+    "CREATE TRIGGER IF NOT EXISTS prenotazioni_fts_au AFTER UPDATE OF nome, nome_allieva, email ON prenotazioni BEGIN "
+    "INSERT INTO prenotazioni_fts(prenotazioni_fts, rowid, nome, nome_allieva, email) "
+    "VALUES ('delete', old.id, old.nome, old.nome_allieva, old.email); "
+    "INSERT INTO prenotazioni_fts(rowid, nome, nome_allieva, email) VALUES (new.id, new.nome, new.nome_allieva, new.email); END",
+]
+
+
+def _configura_fts_prenotazioni(app):
+    """Indice full-text (FTS5, tabella a contenuto esterno aggiornata da trigger) su nome, allieva ed email.
+    Ritorna False se non disponibile (altro DB o SQLite senza FTS5): la ricerca usa LIKE.
+
+    I worker gunicorn avviano l'app insieme: controllo e creazione avvengono sotto il lock di
+    scrittura (BEGIN IMMEDIATE), così un solo worker crea la tabella e la popola; gli altri la
+    trovano già creata e non ripetono il 'rebuild', che riscriverebbe l'intero indice."""
+    from sqlalchemy import text
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    try:
+        db.session.rollback()
+        db.session.execute(text('BEGIN IMMEDIATE'))
+        esiste = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'prenotazioni_fts'")).first()
+        for ddl in _FTS_PRENOTAZIONI:
+            db.session.execute(text(ddl))
+        if esiste is None:
+            # Indicizza le prenotazioni già presenti
+            db.session.execute(text("INSERT INTO prenotazioni_fts(prenotazioni_fts) VALUES ('rebuild')"))
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        app.logger.warning('Ricerca full-text non disponibile: %s', e)
+        return False
+
+
 def create_app():
     app = Flask(__name__)
     app.config.from_object('config.Config')
+    from config import limiti_worker
+    stream_max, pool_max_overflow = limiti_worker()
+    if app.config.get('SSE_STREAM_MAX') is None:
+        app.config['SSE_STREAM_MAX'] = stream_max
+    if app.config.get('SQLITE_POOL_MAX_OVERFLOW') is None:
+        app.config['SQLITE_POOL_MAX_OVERFLOW'] = pool_max_overflow
+    if _sqlite_su_file(app.config['SQLALCHEMY_DATABASE_URI']):
+        # Pool per worker: ogni thread (gthread, stream SSE, reaper) usa la propria connessione
+        opzioni = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+        opzioni.setdefault('pool_size', app.config.get('SQLITE_POOL_SIZE', 5))
+        opzioni.setdefault('max_overflow', app.config.get('SQLITE_POOL_MAX_OVERFLOW', 10))
+        opzioni.setdefault('pool_timeout', app.config.get('SQLITE_POOL_TIMEOUT', 10))
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = opzioni
     db.init_app(app)
     CORS(app, origins=app.config.get('CORS_ORIGINS', ['http://localhost:5173', 'http://127.0.0.1:5173']), supports_credentials=True)
 
     with app.app_context():
+        _configura_sqlite(app)
+        from metriche import configura_metriche
+        configura_metriche(app, db.engine)
+        from attesa import configura_attesa
+        configura_attesa(app)
+        from limiti import configura_limiti
+        configura_limiti(app)
         import models  # register models with db
         db.create_all()
         # Migrazione: aggiungi colonna disponibile se mancante (DB esistenti)
@@ -31,10 +143,75 @@ def create_app():
                 db.session.commit()
         except Exception:
             db.session.rollback()
+        # Migrazione: settore e coordinate dei posti (layout sala)
+        try:
+            cols = [row[1] for row in db.session.execute(text("PRAGMA table_info(posti)")).fetchall()]
+            for colonna, tipo in (('settore', 'VARCHAR(40)'), ('x', 'FLOAT'), ('y', 'FLOAT')):
+                if colonna not in cols:
+                    db.session.execute(text(f"ALTER TABLE posti ADD COLUMN {colonna} {tipo}"))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+        # Migrazione: versione delle impostazioni (cache per worker, vedi impostazioni.py)
+        try:
+            cols = [row[1] for row in db.session.execute(text("PRAGMA table_info(impostazioni)")).fetchall()]
+            if 'versione' not in cols:
+                db.session.execute(text("ALTER TABLE impostazioni ADD COLUMN versione INTEGER NOT NULL DEFAULT 0"))
+                db.session.commit()
+        except Exception:
+            db.session.rollback()
+        # Migrazione: eventi: le righe esistenti appartengono all'evento 1
+        for tabella in ('posti', 'blocchi', 'prenotazioni', 'codici_prenotazione', 'modifiche_posti'):
+            try:
+                cols = [row[1] for row in db.session.execute(text(f"PRAGMA table_info({tabella})")).fetchall()]
+                if 'evento_id' not in cols:
+                    db.session.execute(text(f"ALTER TABLE {tabella} ADD COLUMN evento_id INTEGER NOT NULL DEFAULT 1"))
+                    db.session.commit()
+            except Exception:
+                db.session.rollback()
+        # Indici sostituiti dalle versioni per evento (e codice unico per email ora per evento)
+        for indice in _INDICI_OBSOLETI:
+            try:
+                db.session.execute(text(f'DROP INDEX IF EXISTS {indice}'))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+        # Migrazione: crea sui DB esistenti gli indici dichiarati nei modelli (create_all li crea solo con le tabelle nuove)
+        for table in db.metadata.sorted_tables:
+            for indice in table.indexes:
+                try:
+                    indice.create(db.engine, checkfirst=True)
+                except Exception as e:
+                    if indice.name not in _INDICI_OBBLIGATORI:
+                        app.logger.warning('Indice %s non creato: %s', indice.name, e)
+                    elif not sqlalchemy_inspect(db.engine).has_index(table.name, indice.name):  # non creato da un altro worker
+                        raise RuntimeError(_INDICI_OBBLIGATORI[indice.name].format(e=e)) from e
+        app.extensions['teatro_fts_prenotazioni'] = _configura_fts_prenotazioni(app)
+        if db.session.get(models.Evento, 1) is None:
+            try:
+                db.session.add(models.Evento(id=1))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+        if db.session.get(models.VersioneMappa, 1) is None:
+            try:
+                db.session.add(models.VersioneMappa(id=1, versione=0))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
         from seed import init_seats_if_empty
         init_seats_if_empty()
-        from routes import api_bp
+        from routes import api_bp, eventi_bp
         app.register_blueprint(api_bp, url_prefix='/api')
+        # Le stesse route per un evento specifico: /api/eventi/<id>/posti, ...
+        app.register_blueprint(api_bp, url_prefix='/api/eventi/<int:evento_id>', name='api_evento')
+        app.register_blueprint(eventi_bp, url_prefix='/api')
+        if app.config.get('SCRITTORE'):
+            from scrittore import avvia_scrittore
+            avvia_scrittore(app)
+        if app.config.get('REAPER_BLOCCHI'):
+            from scadenze import avvia_reaper
+            avvia_reaper(app)
 
     return app
 
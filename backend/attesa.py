@@ -0,0 +1,219 @@
+"""Sala d'attesa per le aperture delle vendite molto richieste (SALA_ATTESA=1).
+
+Chi arriva riceve un numero progressivo (POST /api/coda) in un token firmato con
+SECRET_KEY, anche prima dell'apertura delle vendite. L'apertura è fissata dall'admin per
+evento (PUT /api/admin/coda); prima nessuno è ammesso, poi le ammissioni procedono a ritmo
+costante: sono ammessi i numeri fino a
+
+    iniziali + (ora - apertura) * al_minuto / 60
+
+con al_minuto proporzionale ai posti prenotabili dell'evento (SALA_ATTESA_PER_POSTO,
+almeno SALA_ATTESA_MINIMO_AL_MINUTO) e iniziali pari ad al_minuto. Chi è arrivato prima
+dell'apertura ha i numeri più bassi ed entra per primo. GET /api/coda/stato restituisce
+questo limite, uguale per tutti e calcolato senza DB (apertura e numero di posti in cache
+nel processo): è servito con Cache-Control pubblico e il client confronta da sé il proprio
+numero. Quando tocca a lui, POST /api/coda/ammissione scambia il token della coda con un
+token di ammissione legato alla session_id, richiesto (header X-Ammissione) da
+POST/PUT/DELETE /api/blocchi e POST /api/prenotazioni: la verifica è solo la firma, senza
+accessi al DB.
+
+Numeri e aperture sono condivisi tra i worker in un file SQLite accanto al DB (<db>.coda),
+separato dal DB delle prenotazioni; con il DB in memoria restano nel processo.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from flask import current_app, g, jsonify, request
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+# View che richiedono il token di ammissione quando la sala d'attesa è attiva
+ROUTE_AMMISSIONE = ('blocca_posti', 'rinnova_blocchi', 'rilascio_blocchi', 'crea_prenotazione')
+POSTI_CACHE_SECONDI = 60
+APERTURA_CACHE_SECONDI = 2  # come il max-age di GET /api/coda/stato
+
+
+class ArchivioCodaMemoria:
+    """Numeri e aperture nel processo (DB in memoria: un solo processo)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._numeri = {}
+        self._aperture = {}
+
+    def prendi_numero(self, evento_id):
+        with self._lock:
+            self._numeri[evento_id] = self._numeri.get(evento_id, 0) + 1
+            return self._numeri[evento_id]
+
+    def apertura(self, evento_id):
+        return self._aperture.get(evento_id)
+
+    def imposta_apertura(self, evento_id, apertura):
+        self._aperture[evento_id] = apertura
+
+
+class ArchivioCodaSQLite:
+    """Numeri e aperture in un file SQLite condiviso dai worker: un UPSERT ... RETURNING per ingresso."""
+
+    def __init__(self, percorso):
+        self.percorso = percorso
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connessione(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.percorso, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS coda_eventi '
+                         '(evento_id INTEGER PRIMARY KEY, ultimo INTEGER NOT NULL DEFAULT 0, apertura REAL)')
+            self._conn = conn
+        return self._conn
+
+    def prendi_numero(self, evento_id):
+        with self._lock:
+            return self._connessione().execute(
+                'INSERT INTO coda_eventi (evento_id, ultimo) VALUES (?, 1) '
+                'ON CONFLICT (evento_id) DO UPDATE SET ultimo = ultimo + 1 RETURNING ultimo',
+                (evento_id,)).fetchone()[0]
+
+    def apertura(self, evento_id):
+        with self._lock:
+            riga = self._connessione().execute(
+                'SELECT apertura FROM coda_eventi WHERE evento_id = ?', (evento_id,)).fetchone()
+            return riga[0] if riga else None
+
+    def imposta_apertura(self, evento_id, apertura):
+        with self._lock:
+            self._connessione().execute(
+                'INSERT INTO coda_eventi (evento_id, apertura) VALUES (?, ?) '
+                'ON CONFLICT (evento_id) DO UPDATE SET apertura = excluded.apertura', (evento_id, apertura))
+
+
+def _stato():
+    app = current_app._get_current_object()
+    stato = app.extensions.get('teatro_attesa')
+    if stato is None:
+        from app import db
+        percorso_db = db.engine.url.database
+        if percorso_db and percorso_db != ':memory:':
+            archivio = ArchivioCodaSQLite(app.config.get('SALA_ATTESA_FILE') or f'{os.path.abspath(percorso_db)}.coda')
+        else:
+            archivio = ArchivioCodaMemoria()
+        stato = app.extensions['teatro_attesa'] = {
+            'archivio': archivio,
+            'aperture': {},  # evento_id -> (apertura o None, letta alle)
+            'posti': {},     # evento_id -> (posti prenotabili, letto alle)
+            'coda': URLSafeTimedSerializer(app.config['SECRET_KEY'], salt='teatro-coda'),
+            'ammissione': URLSafeTimedSerializer(app.config['SECRET_KEY'], salt='teatro-ammissione'),
+        }
+    return stato
+
+
+def _al_minuto(stato, evento_id):
+    """Ammissioni al minuto per l'evento, dai posti prenotabili (riletti al più ogni minuto)."""
+    posti, letto = stato['posti'].get(evento_id, (None, 0))
+    if posti is None or time.monotonic() - letto > POSTI_CACHE_SECONDI:
+        from app import db
+        from models import Posto
+        posti = Posto.query.filter_by(evento_id=evento_id, disponibile=True, riservato_staff=False).count()
+        db.session.rollback()
+        stato['posti'][evento_id] = (posti, time.monotonic())
+    config = current_app.config
+    return max(config.get('SALA_ATTESA_MINIMO_AL_MINUTO', 10), math.ceil(posti * config.get('SALA_ATTESA_PER_POSTO', 0.2)))
+
+
+def _apertura(stato, evento_id):
+    """Apertura delle vendite dell'evento (secondi epoch) o None, riletta al più ogni APERTURA_CACHE_SECONDI."""
+    apertura, letta = stato['aperture'].get(evento_id, (None, None))
+    if letta is None or time.monotonic() - letta > APERTURA_CACHE_SECONDI:
+        apertura = stato['archivio'].apertura(evento_id)
+        stato['aperture'][evento_id] = (apertura, time.monotonic())
+    return apertura
+
+
+def stato_coda(evento_id):
+    """Limite di ammissione corrente: {'attiva', 'apertura', 'ammessi_fino_a', 'al_minuto'}.
+    Prima dell'apertura (o senza apertura fissata) ammessi_fino_a è 0."""
+    if not current_app.config.get('SALA_ATTESA'):
+        return {'attiva': False}
+    stato = _stato()
+    apertura = _apertura(stato, evento_id)
+    al_minuto = _al_minuto(stato, evento_id)
+    ora = time.time()
+    ammessi = 0
+    if apertura is not None and ora >= apertura:
+        ammessi = al_minuto + int((ora - apertura) * al_minuto / 60)
+    return {'attiva': True, 'apertura': apertura, 'ammessi_fino_a': ammessi, 'al_minuto': al_minuto}
+
+
+def attesa_stimata(numero, stato):
+    """Secondi stimati prima che il numero sia ammesso (per Retry-After)."""
+    mancano = max(0, numero - stato['ammessi_fino_a'])
+    if stato['apertura'] is None:
+        return 60
+    prima = max(0.0, stato['apertura'] - time.time())
+    if prima > 0:
+        mancano = max(0, numero - stato['al_minuto'])
+    return prima + mancano * 60 / stato['al_minuto']
+
+
+def imposta_apertura(evento_id, apertura):
+    """Fissa (o annulla con None) l'apertura delle vendite dell'evento, per tutti i worker."""
+    stato = _stato()
+    stato['archivio'].imposta_apertura(evento_id, apertura)
+    stato['aperture'][evento_id] = (apertura, time.monotonic())
+
+
+def entra_in_coda(evento_id):
+    """Assegna il prossimo numero: ritorna (token, numero)."""
+    stato = _stato()
+    numero = stato['archivio'].prendi_numero(evento_id)
+    return stato['coda'].dumps({'e': evento_id, 'n': numero}), numero
+
+
+def numero_da_token(token, evento_id):
+    """Numero del token della coda, None se non valido o di un altro evento."""
+    try:
+        dati = _stato()['coda'].loads(token, max_age=current_app.config.get('SALA_ATTESA_DURATA_CODA_SECONDI', 6 * 3600))
+    except (BadSignature, SignatureExpired):
+        return None
+    if not isinstance(dati, dict) or dati.get('e') != evento_id or not isinstance(dati.get('n'), int):
+        return None
+    return dati['n']
+
+
+def emetti_ammissione(evento_id, session_id):
+    return _stato()['ammissione'].dumps({'e': evento_id, 's': session_id})
+
+
+def ammissione_valida(token, evento_id, session_id):
+    durata = current_app.config.get('SALA_ATTESA_DURATA_AMMISSIONE_SECONDI', 1800)
+    try:
+        dati = _stato()['ammissione'].loads(token, max_age=durata)
+    except (BadSignature, SignatureExpired):
+        return False
+    return isinstance(dati, dict) and dati.get('e') == evento_id and dati.get('s') == session_id
+
+
+def _verifica_ammissione():
+    if not current_app.config.get('SALA_ATTESA') or request.endpoint is None:
+        return None
+    if request.endpoint.rsplit('.', 1)[-1] not in ROUTE_AMMISSIONE:
+        return None
+    from limiti import _session_id
+    token = request.headers.get('X-Ammissione', '')
+    if token and ammissione_valida(token, g.get('evento_id'), _session_id()):
+        return None
+    from metriche import incrementa
+    incrementa('coda_rifiutate')
+    resp = jsonify({'error': "Accesso non ancora consentito: entra dalla sala d'attesa.", 'coda': True})
+    resp.status_code = 403
+    return resp
+
+
+def configura_attesa(app):
+    """Registra la verifica del token di ammissione (attiva se SALA_ATTESA, letto a ogni richiesta)."""
+    app.before_request(_verifica_ammissione)
@@ -0,0 +1,68 @@
+"""Accesso admin: login con password (hash verificato una volta) e token firmati a scadenza.
+
+POST /api/admin/login confronta la password con l'hash (ADMIN_PASSWORD_HASH, oppure
+ADMIN_PASSWORD trasformata in hash al primo login) e restituisce un token firmato con
+SECRET_KEY; le richieste admin lo inviano come "Authorization: Bearer <token>" e la
+verifica è solo un HMAC a tempo costante, senza leggere il corpo né il DB.
+Il sale della firma dipende dalla password configurata: cambiarla invalida i token emessi.
+L'header X-Admin-Password resta accettato per script e curl (confronto a tempo costante).
+"""
+import hashlib
+import hmac
+
+from flask import current_app, request
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+def _stato():
+    """Hash e serializer dell'app, ricalcolati se cambiano password o SECRET_KEY."""
+    config = current_app.config
+    hash_configurato = config.get('ADMIN_PASSWORD_HASH') or ''
+    password = config.get('ADMIN_PASSWORD') or ''
+    chiave = (config['SECRET_KEY'], hash_configurato, password)
+    stato = current_app.extensions.get('teatro_admin')
+    if stato is None or stato['chiave'] != chiave:
+        impronta = hashlib.sha256(f'{hash_configurato}\0{password}'.encode()).hexdigest()[:16]
+        stato = {
+            'chiave': chiave,
+            'hash': hash_configurato or None,
+            'serializer': URLSafeTimedSerializer(config['SECRET_KEY'], salt=f'teatro-admin-{impronta}'),
+        }
+        current_app.extensions['teatro_admin'] = stato
+    return stato
+
+
+def verifica_password(password):
+    """Confronta la password con l'hash configurato (calcolato una sola volta da ADMIN_PASSWORD)."""
+    stato = _stato()
+    if stato['hash'] is None:
+        if not current_app.config.get('ADMIN_PASSWORD'):
+            return False
+        stato['hash'] = generate_password_hash(current_app.config['ADMIN_PASSWORD'])
+    return bool(password) and check_password_hash(stato['hash'], password)
+
+
+def emetti_token():
+    return _stato()['serializer'].dumps({'ruolo': 'admin'})
+
+
+def verifica_token(token):
+    durata = current_app.config.get('ADMIN_TOKEN_DURATA_SECONDI', 3600)
+    try:
+        dati = _stato()['serializer'].loads(token, max_age=durata)
+    except (BadSignature, SignatureExpired):
+        return False
+    return isinstance(dati, dict) and dati.get('ruolo') == 'admin'
+
+
+def richiesta_admin():
+    """True se la richiesta porta un token admin valido (o la password nell'header X-Admin-Password)."""
+    autorizzazione = request.headers.get('Authorization', '')
+    if autorizzazione[:7].lower() == 'bearer ':
+        return verifica_token(autorizzazione[7:].strip())
+    password = request.headers.get('X-Admin-Password')
+    attesa = current_app.config.get('ADMIN_PASSWORD')
+    if password and attesa:
+        return hmac.compare_digest(password.encode(), attesa.encode())
+    return False
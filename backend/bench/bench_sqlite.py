@@ -0,0 +1,132 @@
+"""
+Confronta i profili SQLite (config.SQLITE_PROFILI) con letture e scritture concorrenti.
+
+Per ogni profilo crea un DB su file temporaneo e avvia P processi (come i worker
+gunicorn): in ognuno N thread lettori chiamano GET /api/posti (senza ETag) e M thread
+scrittori prenotano e cancellano posti (BEGIN IMMEDIATE) per la durata indicata.
+Stampa operazioni al secondo ed errori di lock per profilo, in tabella o JSON.
+
+Eseguire dalla cartella backend con:
+    python bench/bench_sqlite.py [--durata 5] [--processi 2] [--lettori 4] [--scrittori 2] [--json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def _esegui_profilo(durata, lettori, scrittori, indice, processi):
+    """Corpo del processo figlio: l'ambiente (DATABASE_URL, SQLITE_PROFILO) è già impostato."""
+    from app import application as app
+
+    client = app.test_client()
+    posti = [p['id'] for p in client.get('/api/posti').get_json() if p['stato'] == 'disponibile']
+    contatori = {'letture': 0, 'scritture': 0, 'errori_lock': 0, 'errori_altri': 0}
+    lock = threading.Lock()
+    fine = time.monotonic() + durata
+
+    def conta(chiave):
+        with lock:
+            contatori[chiave] += 1
+
+    def esito(r):
+        if r.status_code < 400:
+            return None
+        testo = r.get_data(as_text=True).lower()
+        return 'errori_lock' if 'locked' in testo or 'busy' in testo else 'errori_altri'
+
+    def lettore():
+        c = app.test_client()
+        while time.monotonic() < fine:
+            errore = esito(c.get('/api/posti'))
+            conta(errore or 'letture')
+
+    def scrittore(i):
+        c = app.test_client()
+        miei = posti[indice * scrittori + i::scrittori * processi]
+        n = 0
+        while time.monotonic() < fine:
+            pid = miei[n % len(miei)]
+            n += 1
+            r = c.post('/api/prenotazioni', json={'nome': f'Bench {indice}.{i}', 'email': f'bench{indice}.{i}@test.it', 'posto_ids': [pid]})
+            errore = esito(r)
+            if errore:
+                conta(errore)
+                continue
+            pren_id = r.get_json()['prenotazioni'][0]['id']
+            errore = esito(c.delete(f'/api/prenotazioni/{pren_id}'))
+            conta(errore or 'scritture')
+
+    threads = [threading.Thread(target=lettore) for _ in range(lettori)]
+    threads += [threading.Thread(target=scrittore, args=(i,)) for i in range(scrittori)]
+    inizio = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    trascorso = time.monotonic() - inizio
+    contatori['secondi'] = trascorso
+    print(json.dumps(contatori))
+
+
+def run():
+    from config import SQLITE_PROFILI
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--durata', type=float, default=5.0, help='secondi per profilo')
+    parser.add_argument('--processi', type=int, default=2, help='processi concorrenti (worker)')
+    parser.add_argument('--lettori', type=int, default=4)
+    parser.add_argument('--scrittori', type=int, default=2)
+    parser.add_argument('--profili', nargs='*', default=list(SQLITE_PROFILI))
+    parser.add_argument('--json', action='store_true', help='stampa i risultati in JSON')
+    parser.add_argument('--figlio', type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.figlio is not None:
+        _esegui_profilo(args.durata, args.lettori, args.scrittori, args.figlio, args.processi)
+        return
+
+    risultati = {}
+    for profilo in args.profili:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ)
+            env.pop('TESTING', None)
+            env.update({
+                'DATABASE_URL': f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                'SQLITE_PROFILO': profilo,
+                'REAPER_BLOCCHI': '0',
+            })
+            def figlio(indice, durata, lettori, scrittori):
+                return subprocess.Popen(
+                    [sys.executable, os.path.abspath(__file__), '--figlio', str(indice), '--durata', str(durata),
+                     '--processi', str(args.processi), '--lettori', str(lettori), '--scrittori', str(scrittori)],
+                    env=env, cwd=BACKEND_DIR, stdout=subprocess.PIPE, text=True,
+                )
+
+            # Crea schema e posti una volta sola, poi avvia i processi concorrenti
+            figlio(0, 0, 0, 0).communicate()
+            procs = [figlio(i, args.durata, args.lettori, args.scrittori) for i in range(args.processi)]
+            parziali = [json.loads(p.communicate()[0].strip().splitlines()[-1]) for p in procs]
+            totale = {k: sum(r[k] for r in parziali) for k in ('letture', 'scritture', 'errori_lock', 'errori_altri')}
+            secondi = max(r['secondi'] for r in parziali)
+            totale['letture_al_secondo'] = round(totale['letture'] / secondi, 1)
+            totale['scritture_al_secondo'] = round(totale['scritture'] / secondi, 1)
+            risultati[profilo] = totale
+
+    if args.json:
+        print(json.dumps(risultati, indent=2))
+        return
+    print(f"{'profilo':<14}{'letture/s':>12}{'scritture/s':>14}{'errori lock':>14}{'altri errori':>14}")
+    for profilo, r in risultati.items():
+        print(f"{profilo:<14}{r['letture_al_secondo']:>12}{r['scritture_al_secondo']:>14}{r['errori_lock']:>14}{r['errori_altri']:>14}")
+
+
+if __name__ == '__main__':
+    run()
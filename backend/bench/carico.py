@@ -0,0 +1,397 @@
+"""
+Test di carico "apertura vendite": N famiglie aprono la pagina nello stesso momento.
+
+Avvia gunicorn (o usa un server già in esecuzione con --url) su un DB SQLite temporaneo
+con una sala generata come in seed_example_data.py, poi simula i client come App.tsx:
+  - GET /api/posti ogni --poll secondi (con If-None-Match, come la cache del browser);
+  - selezione di 1-4 posti con POST /api/blocchi, preferendo le prime file (posti contesi);
+  - PUT /api/blocchi/rinnovo ogni --rinnovo secondi finché il form è aperto;
+  - POST /api/prenotazioni dopo un tempo di compilazione casuale; in caso di conflitto
+    la selezione viene rilasciata (DELETE /api/blocchi) e si riprova con altri posti.
+Ogni famiglia ha il proprio IP (header X-Real-IP, come dietro nginx). Con --script N si
+aggiungono N client che bloccano e rilasciano posti delle prime file senza pause da un
+solo IP (endpoint "(script)"), per misurare l'effetto dei limiti di limiti.py
+(confrontare con --env LIMITI=0).
+
+Per endpoint riporta p50/p95/p99 della latenza, richieste al secondo, errori di lock
+("database is locked") e conflitti; i risultati sono salvati in JSON per confrontarli
+tra esecuzioni con bench/confronta.py. Solo libreria standard, funziona offline.
+
+Eseguire dalla cartella backend con:
+    python bench/carico.py --clienti 500 --durata 60 --output risultati.json
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def prepara_sala(database_url, numero_file, posti_per_fila):
+    """Crea schema, impostazioni e posti (come seed_example_data.py, senza prenotazioni) in un processo separato."""
+    codice = (
+        'from app import application as app, db\n'
+        'from models import Impostazioni, Posto, Prenotazione, Blocco\n'
+        'import string\n'
+        'with app.app_context():\n'
+        '    imp = db.session.get(Impostazioni, 1) or Impostazioni(id=1)\n'
+        '    imp.nome_teatro = "Teatro Verdi"\n'
+        '    imp.nome_spettacolo = "Test di carico"\n'
+        f'    imp.numero_file = {numero_file}\n'
+        f'    imp.posti_per_fila = {posti_per_fila}\n'
+        '    db.session.add(imp)\n'
+        '    Blocco.query.delete()\n'
+        '    Prenotazione.query.delete()\n'
+        '    Posto.query.delete()\n'
+        f'    for letter in string.ascii_uppercase[:{numero_file}]:\n'
+        f'        for n in range(1, {posti_per_fila} + 1):\n'
+        '            db.session.add(Posto(fila=letter, numero=n, disponibile=True, riservato_staff=False))\n'
+        '    db.session.commit()\n'
+    )
+    env = _env_server(database_url)
+    subprocess.run([sys.executable, '-c', codice], env=env, cwd=BACKEND_DIR, check=True)
+
+
+def _env_server(database_url, ambiente=None):
+    env = dict(os.environ)
+    env.pop('TESTING', None)
+    env['DATABASE_URL'] = database_url
+    env.update(ambiente or {})
+    return env
+
+
+def _porta_libera():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def avvia_server(database_url, workers, gunicorn_args, ambiente=None):
+    """Avvia gunicorn su una porta libera e attende che risponda. Ritorna (processo, url).
+    La modalità dei worker è quella di gunicorn.conf.py (SERVER_MODALITA in `ambiente`)."""
+    if shutil.which('gunicorn') is None:
+        raise SystemExit('gunicorn non trovato: installalo (pip install gunicorn) o usa --url')
+    porta = _porta_libera()
+    cmd = ['gunicorn', '-b', f'127.0.0.1:{porta}', '-w', str(workers), '--timeout', '120', '--log-level', 'warning']
+    cmd += gunicorn_args + ['app:application']
+    proc = subprocess.Popen(cmd, env=_env_server(database_url, ambiente), cwd=BACKEND_DIR)
+    url = f'http://127.0.0.1:{porta}'
+    fine = time.monotonic() + 30
+    while time.monotonic() < fine:
+        try:
+            c = http.client.HTTPConnection('127.0.0.1', porta, timeout=2)
+            c.request('GET', '/api/spettacolo')
+            c.getresponse().read()
+            return proc, url
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit('gunicorn non risponde')
+
+
+class Statistiche:
+    """Latenze ed esiti per endpoint (chiave 'METODO /percorso')."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latenze = {}
+        self.esiti = {}
+
+    def registra(self, endpoint, secondi, esito):
+        with self._lock:
+            self.latenze.setdefault(endpoint, []).append(secondi)
+            conteggi = self.esiti.setdefault(endpoint, {})
+            conteggi[esito] = conteggi.get(esito, 0) + 1
+
+    def riepilogo(self, durata):
+        out = {}
+        for endpoint, valori in sorted(self.latenze.items()):
+            valori = sorted(valori)
+            esiti = self.esiti[endpoint]
+            totale = len(valori)
+            out[endpoint] = {
+                'richieste': totale,
+                'al_secondo': round(totale / durata, 2),
+                'p50_ms': round(_percentile(valori, 50) * 1000, 1),
+                'p95_ms': round(_percentile(valori, 95) * 1000, 1),
+                'p99_ms': round(_percentile(valori, 99) * 1000, 1),
+                'max_ms': round(valori[-1] * 1000, 1),
+                'esiti': esiti,
+                'tasso_errori_lock': round(esiti.get('errore_lock', 0) / totale, 4),
+                'tasso_errori': round(sum(v for k, v in esiti.items() if k.startswith('errore')) / totale, 4),
+            }
+        return out
+
+
+def _percentile(valori_ordinati, p):
+    if not valori_ordinati:
+        return 0.0
+    k = (len(valori_ordinati) - 1) * p / 100
+    i = int(k)
+    j = min(i + 1, len(valori_ordinati) - 1)
+    return valori_ordinati[i] + (valori_ordinati[j] - valori_ordinati[i]) * (k - i)
+
+
+class Famiglia(threading.Thread):
+    """Un browser aperto sulla pagina di prenotazione."""
+
+    def __init__(self, indice, url, stats, args, posti_caldi, posti_tutti, fine):
+        super().__init__(daemon=True)
+        self.indice = indice
+        parti = urlsplit(url)
+        self.host, self.porta = parti.hostname, parti.port or 80
+        self.stats = stats
+        self.args = args
+        self.rng = random.Random(args.seed * 100003 + indice)
+        self.session_id = str(uuid.UUID(int=self.rng.getrandbits(128)))
+        self.posti_caldi = posti_caldi
+        self.posti_tutti = posti_tutti
+        self.fine = fine
+        self.etag = None
+        self.conn = None
+        self.prenotato = False
+        self.ip = f'10.{indice >> 16 & 255}.{indice >> 8 & 255}.{indice & 255}'
+
+    def _richiesta(self, metodo, percorso, endpoint, corpo=None, headers=None):
+        h = {'X-Session-Id': self.session_id, 'X-Real-IP': self.ip}
+        if headers:
+            h.update(headers)
+        dati = None
+        if corpo is not None:
+            dati = json.dumps(corpo)
+            h['Content-Type'] = 'application/json'
+        inizio = time.perf_counter()
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.porta, timeout=self.args.timeout)
+            self.conn.request(metodo, percorso, body=dati, headers=h)
+            r = self.conn.getresponse()
+            testo = r.read()
+            stato = r.status
+            etag = r.getheader('ETag')
+        except (OSError, http.client.HTTPException):
+            self.conn = None
+            self.stats.registra(endpoint, time.perf_counter() - inizio, 'errore_connessione')
+            return None, None, None
+        trascorso = time.perf_counter() - inizio
+        if stato >= 500:
+            esito = 'errore_lock' if b'locked' in testo.lower() or b'busy' in testo.lower() else 'errore_server'
+        elif stato in (400, 409):
+            esito = 'conflitto'
+        elif stato == 304:
+            esito = 'non_modificato'
+        elif stato == 429:
+            esito = 'rifiutato'
+        else:
+            esito = 'ok'
+        self.stats.registra(endpoint, trascorso, esito)
+        try:
+            payload = json.loads(testo) if testo else None
+        except ValueError:
+            payload = None
+        return stato, payload, etag
+
+    def poll(self):
+        headers = {'If-None-Match': self.etag} if self.etag else None
+        stato, _, etag = self._richiesta('GET', f'/api/posti?session_id={self.session_id}', 'GET /api/posti', headers=headers)
+        if stato in (200, 304) and etag:
+            self.etag = etag
+
+    def _attendi(self, secondi):
+        """Attende facendo polling come App.tsx; False se il test è finito."""
+        limite = min(time.monotonic() + secondi, self.fine)
+        while True:
+            resto = limite - time.monotonic()
+            if resto <= 0:
+                return time.monotonic() < self.fine
+            pausa = min(resto, self.prossimo_poll - time.monotonic())
+            if pausa > 0:
+                time.sleep(pausa)
+            if time.monotonic() >= self.prossimo_poll:
+                self.poll()
+                self.prossimo_poll = time.monotonic() + self.args.poll
+
+    def _scegli_posti(self):
+        n = self.rng.randint(1, 4)
+        sorgente = self.posti_caldi if self.rng.random() < self.args.contesa else self.posti_tutti
+        return self.rng.sample(sorgente, min(n, len(sorgente)))
+
+    def run(self):
+        # Arrivo quasi simultaneo all'apertura delle vendite
+        time.sleep(self.rng.uniform(0, self.args.rampa))
+        self.prossimo_poll = time.monotonic()
+        self.poll()
+        self.prossimo_poll = time.monotonic() + self.args.poll
+        tentativi = 0
+        while time.monotonic() < self.fine and not self.prenotato and tentativi < 5:
+            tentativi += 1
+            if not self._attendi(self.rng.uniform(1, 5) * self.args.scala_tempo):
+                break
+            scelti = self._scegli_posti()
+            stato, payload, _ = self._richiesta('POST', '/api/blocchi', 'POST /api/blocchi',
+                                                {'session_id': self.session_id, 'posto_ids': scelti})
+            if stato is None:
+                continue
+            bloccati = (payload or {}).get('bloccati', [])
+            if not bloccati:
+                continue
+            # Compilazione del form con rinnovi periodici
+            compilazione = self.rng.uniform(20, 90) * self.args.scala_tempo
+            inizio = time.monotonic()
+            while time.monotonic() - inizio < compilazione:
+                passo = min(self.args.rinnovo * self.args.scala_tempo, compilazione - (time.monotonic() - inizio))
+                if not self._attendi(passo):
+                    return
+                if time.monotonic() - inizio < compilazione:
+                    self._richiesta('PUT', '/api/blocchi/rinnovo', 'PUT /api/blocchi/rinnovo',
+                                    {'session_id': self.session_id, 'posto_ids': bloccati})
+            stato, _, _ = self._richiesta('POST', '/api/prenotazioni', 'POST /api/prenotazioni', {
+                'nome': f'Famiglia {self.indice}', 'email': f'famiglia{self.indice}@test.it',
+                'posto_ids': bloccati, 'session_id': self.session_id,
+            })
+            if stato == 200:
+                self.prenotato = True
+            else:
+                self._richiesta('DELETE', '/api/blocchi', 'DELETE /api/blocchi',
+                                {'session_id': self.session_id, 'posto_ids': bloccati})
+        # Dopo la prenotazione (o la rinuncia) la pagina resta aperta e continua il polling
+        self._attendi(self.fine - time.monotonic())
+
+
+class Script(Famiglia):
+    """Client automatico: blocca e rilascia posti contesi in ciclo, da un solo IP,
+    cambiando session_id ogni 10 richieste."""
+
+    def __init__(self, indice, url, stats, args, posti_caldi, posti_tutti, fine):
+        super().__init__(indice, url, stats, args, posti_caldi, posti_tutti, fine)
+        self.ip = f'192.168.0.{indice % 250 + 1}'
+
+    def run(self):
+        n = 0
+        while time.monotonic() < self.fine:
+            if n % 10 == 0:
+                self.session_id = str(uuid.UUID(int=self.rng.getrandbits(128)))
+            n += 1
+            scelti = self.rng.sample(self.posti_caldi, min(2, len(self.posti_caldi)))
+            stato, _, _ = self._richiesta('POST', '/api/blocchi', 'POST /api/blocchi (script)',
+                                          {'session_id': self.session_id, 'posto_ids': scelti})
+            if stato == 200:
+                self._richiesta('DELETE', '/api/blocchi', 'DELETE /api/blocchi (script)',
+                                {'session_id': self.session_id, 'posto_ids': scelti})
+
+
+def esegui(args, url):
+    c = http.client.HTTPConnection(urlsplit(url).hostname, urlsplit(url).port or 80, timeout=10)
+    c.request('GET', '/api/posti')
+    posti = json.loads(c.getresponse().read())
+    liberi = [p for p in posti if p['stato'] == 'disponibile']
+    if not liberi:
+        raise SystemExit('nessun posto disponibile nella sala')
+    file_ordinate = sorted({p['fila'] for p in liberi})
+    prime_file = set(file_ordinate[:max(1, len(file_ordinate) // 5)])
+    posti_caldi = [p['id'] for p in liberi if p['fila'] in prime_file]
+    posti_tutti = [p['id'] for p in liberi]
+
+    stats = Statistiche()
+    inizio = time.monotonic()
+    fine = inizio + args.durata
+    famiglie = [Famiglia(i, url, stats, args, posti_caldi, posti_tutti, fine) for i in range(args.clienti)]
+    script = [Script(args.clienti + i, url, stats, args, posti_caldi, posti_tutti, fine) for i in range(args.script)]
+    for f in famiglie + script:
+        f.start()
+    for f in famiglie + script:
+        f.join(timeout=max(0.0, fine - time.monotonic()) + args.timeout + 5)
+    durata = time.monotonic() - inizio
+    return {
+        'endpoint': stats.riepilogo(durata),
+        'prenotazioni_riuscite': sum(1 for f in famiglie if f.prenotato),
+        'posti_totali': len(posti),
+        'durata_s': round(durata, 1),
+    }
+
+
+def _commit_git():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def stampa(risultati):
+    print(f"{'endpoint':<28}{'req':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'lock %':>8}{'err %':>8}")
+    for endpoint, r in risultati['endpoint'].items():
+        print(f"{endpoint:<28}{r['richieste']:>8}{r['al_secondo']:>9}{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}"
+              f"{r['tasso_errori_lock'] * 100:>8.2f}{r['tasso_errori'] * 100:>8.2f}")
+    print(f"Prenotazioni riuscite: {risultati['prenotazioni_riuscite']} su {risultati['configurazione']['clienti']} famiglie "
+          f"({risultati['posti_totali']} posti)")
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clienti', type=int, default=500, help='famiglie (browser) simultanee')
+    parser.add_argument('--durata', type=float, default=60, help='durata del test in secondi')
+    parser.add_argument('--rampa', type=float, default=5, help='secondi in cui arrivano tutti i client')
+    parser.add_argument('--poll', type=float, default=4, help='intervallo polling GET /api/posti (POLL_INTERVAL_MS)')
+    parser.add_argument('--rinnovo', type=float, default=120, help='intervallo rinnovo blocchi (RINNOVO_BLOCCHI_MS)')
+    parser.add_argument('--scala-tempo', type=float, default=0.25,
+                        help='fattore sui tempi umani (scelta, compilazione, rinnovo) per comprimere la serata')
+    parser.add_argument('--contesa', type=float, default=0.7, help='probabilità di scegliere tra le prime file')
+    parser.add_argument('--script', type=int, default=0, help='client automatici che bloccano posti senza pause')
+    parser.add_argument('--file', type=int, default=15, help='file della sala generata')
+    parser.add_argument('--posti-per-fila', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=2, help='worker gunicorn')
+    parser.add_argument('--gunicorn-arg', action='append', default=[], help='argomento extra per gunicorn (ripetibile)')
+    parser.add_argument('--env', action='append', default=[], metavar='NOME=VALORE',
+                        help='variabile d\'ambiente per il server (ripetibile), es. LIMITI=0')
+    parser.add_argument('--url', help='usa un server già avviato invece di gunicorn locale (la sala non viene rigenerata)')
+    parser.add_argument('--timeout', type=float, default=30, help='timeout HTTP per richiesta')
+    parser.add_argument('--seed', type=int, default=1, help='seme per comportamenti riproducibili')
+    parser.add_argument('--output', help='file JSON dove salvare i risultati')
+    args = parser.parse_args()
+
+    tmp = None
+    proc = None
+    try:
+        if args.url:
+            url = args.url.rstrip('/')
+        else:
+            tmp = tempfile.mkdtemp(prefix='teatro-carico-')
+            database_url = f"sqlite:///{os.path.join(tmp, 'carico.db')}"
+            prepara_sala(database_url, args.file, args.posti_per_fila)
+            ambiente = {'LIMITI_PROXY_FIDATO': '1'}
+            ambiente.update(v.split('=', 1) for v in args.env)
+            proc, url = avvia_server(database_url, args.workers, args.gunicorn_arg, ambiente)
+        risultati = esegui(args, url)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    risultati['configurazione'] = {k: v for k, v in vars(args).items() if k != 'output'}
+    risultati['commit'] = _commit_git()
+    risultati['eseguito_il'] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    stampa(risultati)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(risultati, f, indent=2)
+        print(f'Risultati salvati in {args.output}')
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,124 @@
+"""
+Costo di assegnazione dei codici prenotazione al crescere dei codici già usati.
+
+Confronta il metodo precedente ("casuale": 10 candidati random.randint verificati con
+una query, fallisce se sono tutti usati) con il contatore permutato di codici.py
+("permutazione": UPDATE ... RETURNING del contatore + INSERT ON CONFLICT DO NOTHING).
+Per ogni livello di riempimento dello spazio (900000 codici) la tabella
+codici_prenotazione di un DB SQLite temporaneo viene riempita fino a quel livello e
+si misurano --prove assegnazioni, ognuna in BEGIN IMMEDIATE annullata con rollback
+(il riempimento resta costante): il tempo misurato è quello tra BEGIN IMMEDIATE e
+rollback. Riporta p50/p95 in microsecondi e fallimenti.
+
+Eseguire dalla cartella backend con:
+    python bench/codici.py [--livelli 0,0.5,0.9,0.99,0.999] [--prove 2000] [--output codici.json]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from carico import _commit_git, _percentile  # noqa: E402
+
+
+def _casuale(db, CodicePrenotazione, email):
+    """Algoritmo precedente di routes._assegna_codice."""
+    candidati = {str(random.randint(100000, 999999)) for _ in range(10)}
+    usati = {c for (c,) in db.session.query(CodicePrenotazione.codice).filter(CodicePrenotazione.codice.in_(candidati))}
+    liberi = sorted(candidati - usati)
+    if not liberi:
+        return None
+    codice = random.choice(liberi)
+    db.session.add(CodicePrenotazione(evento_id=1, email=email, codice=codice))
+    db.session.flush()
+    return codice
+
+
+def _riempi(db, codici, ContatoreCodici, CodicePrenotazione, livello):
+    """Porta la tabella a livello * CODICI_TOTALI codici assegnati dal contatore."""
+    from sqlalchemy import delete, insert
+    db.session.execute(delete(CodicePrenotazione))
+    db.session.execute(delete(ContatoreCodici))
+    chiave = os.urandom(16)
+    n = int(livello * codici.CODICI_TOTALI)
+    db.session.add(ContatoreCodici(id=1, prossimo=n, chiave=chiave.hex()))
+    for inizio in range(0, n, 50000):
+        db.session.execute(insert(CodicePrenotazione), [
+            {'evento_id': 1, 'email': f'r{i}@bench.it', 'codice': codici.codice_da_indice(chiave, i)}
+            for i in range(inizio, min(n, inizio + 50000))
+        ])
+    db.session.commit()
+    return n
+
+
+def misura(metodo, prove, db, text):
+    tempi = []
+    fallimenti = 0
+    for i in range(prove):
+        db.session.execute(text('BEGIN IMMEDIATE'))
+        inizio = time.perf_counter()
+        codice = metodo(f'nuovo{i}@bench.it')
+        tempi.append(time.perf_counter() - inizio)
+        db.session.rollback()
+        if codice is None:
+            fallimenti += 1
+    tempi.sort()
+    return {
+        'p50_us': round(_percentile(tempi, 50) * 1e6, 1),
+        'p95_us': round(_percentile(tempi, 95) * 1e6, 1),
+        'fallimenti_percento': round(fallimenti / prove * 100, 2),
+    }
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--livelli', default='0,0.5,0.9,0.99,0.999', help='frazioni dello spazio dei codici già usate')
+    parser.add_argument('--prove', type=int, default=2000, help='assegnazioni misurate per livello e metodo')
+    parser.add_argument('--output', help='file JSON dove salvare i risultati')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='teatro-codici-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'codici.db')}"
+    os.environ['REAPER_BLOCCHI'] = '0'
+    try:
+        from sqlalchemy import text
+        from app import create_app, db
+        import codici
+        from models import CodicePrenotazione, ContatoreCodici
+
+        app = create_app()
+        risultati = {'livelli': {}}
+        print(f"{'riempimento':>12}{'metodo':>14}{'p50 µs':>10}{'p95 µs':>10}{'falliti %':>11}")
+        with app.app_context():
+            for livello in [float(v) for v in args.livelli.split(',') if v.strip()]:
+                n = _riempi(db, codici, ContatoreCodici, CodicePrenotazione, livello)
+                riga = {'codici_usati': n}
+                for nome, metodo in (
+                    ('casuale', lambda email: _casuale(db, CodicePrenotazione, email)),
+                    ('permutazione', lambda email: codici.nuovo_codice(1, email)),
+                ):
+                    r = riga[nome] = misura(metodo, args.prove, db, text)
+                    print(f"{livello:>12.1%}{nome:>14}{r['p50_us']:>10}{r['p95_us']:>10}{r['fallimenti_percento']:>11}")
+                risultati['livelli'][str(livello)] = riga
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    risultati['configurazione'] = {k: v for k, v in vars(args).items() if k != 'output'}
+    risultati['commit'] = _commit_git()
+    risultati['eseguito_il'] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(risultati, f, indent=2)
+        print(f'Risultati salvati in {args.output}')
+
+
+if __name__ == '__main__':
+    run()
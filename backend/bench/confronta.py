@@ -0,0 +1,70 @@
+"""
+Confronta due risultati JSON di bench/carico.py (base e nuova esecuzione) per endpoint.
+
+Segnala come regressione un p95 peggiore oltre la soglia (default 20%) o un tasso
+di errori di lock in aumento; esce con codice 1 se ce ne sono, utile in CI.
+
+    python bench/confronta.py base.json nuovo.json [--soglia 0.2]
+"""
+import argparse
+import json
+import sys
+
+
+def _variazione(prima, dopo):
+    if not prima:
+        return None
+    return (dopo - prima) / prima
+
+
+def confronta(base, nuovo, soglia):
+    """Ritorna (righe, regressioni) per gli endpoint presenti in entrambe le esecuzioni."""
+    righe = []
+    regressioni = []
+    for endpoint in sorted(set(base['endpoint']) | set(nuovo['endpoint'])):
+        a = base['endpoint'].get(endpoint)
+        b = nuovo['endpoint'].get(endpoint)
+        if a is None or b is None:
+            righe.append((endpoint, a, b, None))
+            continue
+        var_p95 = _variazione(a['p95_ms'], b['p95_ms'])
+        righe.append((endpoint, a, b, var_p95))
+        if var_p95 is not None and var_p95 > soglia:
+            regressioni.append(f'{endpoint}: p95 {a["p95_ms"]} -> {b["p95_ms"]} ms ({var_p95:+.0%})')
+        if b['tasso_errori_lock'] > a['tasso_errori_lock']:
+            regressioni.append(f'{endpoint}: errori lock {a["tasso_errori_lock"]:.2%} -> {b["tasso_errori_lock"]:.2%}')
+    return righe, regressioni
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base')
+    parser.add_argument('nuovo')
+    parser.add_argument('--soglia', type=float, default=0.2, help='peggioramento relativo del p95 tollerato')
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.nuovo) as f:
+        nuovo = json.load(f)
+
+    print(f"base: {base.get('commit')} ({base.get('eseguito_il')})  nuovo: {nuovo.get('commit')} ({nuovo.get('eseguito_il')})")
+    righe, regressioni = confronta(base, nuovo, args.soglia)
+    print(f"{'endpoint':<28}{'req/s':>16}{'p50 ms':>16}{'p95 ms':>16}{'p99 ms':>16}{'Δp95':>8}")
+    for endpoint, a, b, var_p95 in righe:
+        if a is None or b is None:
+            print(f"{endpoint:<28}{'solo in ' + ('nuovo' if a is None else 'base'):>16}")
+            continue
+        colonne = ''.join(f"{f'{a[k]} → {b[k]}':>16}" for k in ('al_secondo', 'p50_ms', 'p95_ms', 'p99_ms'))
+        variazione = f'{var_p95:+.0%}' if var_p95 is not None else '-'
+        print(f'{endpoint:<28}{colonne}{variazione:>8}')
+    print(f"prenotazioni riuscite: {base.get('prenotazioni_riuscite')} → {nuovo.get('prenotazioni_riuscite')}")
+    if regressioni:
+        print('\nRegressioni:')
+        for r in regressioni:
+            print(f'  - {r}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    run()
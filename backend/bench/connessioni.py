@@ -0,0 +1,214 @@
+"""
+Capacità di connessioni concorrenti per modalità dei worker gunicorn (sync, gthread, gevent).
+
+Per ogni modalità avvia gunicorn (gunicorn.conf.py con SERVER_MODALITA) su un DB SQLite
+temporaneo, apre --stream connessioni lunghe (GET /api/posti/stream, come il browser con
+EventSource) e, mentre restano aperte, misura le richieste normali: --sonde client che
+ripetono GET /api/posti e ogni tanto bloccano e rilasciano un posto.
+
+Riporta quanti stream ricevono risposta entro --attesa secondi (tempo al primo byte),
+latenza p50/p95 ed errori delle richieste normali e, per le modalità con stream attivi,
+quanti eventi di modifica arrivano agli stream. Solo libreria standard.
+
+Eseguire dalla cartella backend con:
+    python bench/connessioni.py --stream 500 --durata 20 --output connessioni.json
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from carico import Statistiche, _commit_git, _percentile, avvia_server, prepara_sala  # noqa: E402
+
+
+class Stream(threading.Thread):
+    """Connessione SSE che resta aperta fino a `fine`, contando gli eventi ricevuti."""
+
+    def __init__(self, url, attesa, fine):
+        super().__init__(daemon=True)
+        self.host, self.porta = urlsplit(url).hostname, urlsplit(url).port
+        self.attesa = attesa
+        self.fine = fine
+        self.primo_byte = None
+        self.eventi = 0
+        self.errore = None
+
+    def run(self):
+        inizio = time.monotonic()
+        try:
+            c = http.client.HTTPConnection(self.host, self.porta, timeout=self.attesa)
+            c.connect()
+            sock = c.sock  # getresponse() lo stacca dalla connessione
+            c.request('GET', '/api/posti/stream?since=0', headers={'Accept': 'text/event-stream'})
+            r = c.getresponse()
+            if r.status != 200:
+                self.errore = f'http_{r.status}'
+                return
+            r.fp.readline()
+            self.primo_byte = time.monotonic() - inizio
+            # Il server invia un heartbeat ogni secondo (SSE_HEARTBEAT_SECONDI=1): readline non resta bloccata
+            sock.settimeout(self.attesa + 1)
+            while time.monotonic() < self.fine:
+                riga = r.fp.readline()
+                if not riga:
+                    break  # lo stream si è chiuso (SSE_DURATA_MAX_SECONDI): il browser si riconnetterebbe
+                if riga.startswith(b'event: posti'):
+                    self.eventi += 1
+            c.close()
+        except (OSError, http.client.HTTPException) as e:
+            self.errore = 'timeout' if isinstance(e, socket.timeout) else type(e).__name__
+
+
+class Sonda(threading.Thread):
+    """Client normale: GET /api/posti in ciclo, ogni 5 richieste blocca e rilascia un posto."""
+
+    def __init__(self, url, posti, stats, timeout, fine):
+        super().__init__(daemon=True)
+        self.host, self.porta = urlsplit(url).hostname, urlsplit(url).port
+        self.posti = posti
+        self.stats = stats
+        self.timeout = timeout
+        self.fine = fine
+        self.session_id = str(uuid.uuid4())
+
+    def _richiesta(self, metodo, percorso, corpo=None):
+        inizio = time.monotonic()
+        try:
+            c = http.client.HTTPConnection(self.host, self.porta, timeout=self.timeout)
+            c.request(metodo, percorso, body=json.dumps(corpo) if corpo is not None else None,
+                      headers={'Content-Type': 'application/json'})
+            r = c.getresponse()
+            r.read()
+            c.close()
+            esito = 'ok' if r.status < 400 else ('conflitto' if r.status == 409 else f'errore_{r.status}')
+        except (OSError, http.client.HTTPException):
+            esito = 'errore_timeout'
+        self.stats.registra(f'{metodo} {percorso.split("?")[0]}', time.monotonic() - inizio, esito)
+
+    def run(self):
+        i = 0
+        while time.monotonic() < self.fine:
+            self._richiesta('GET', '/api/posti')
+            i += 1
+            if i % 5 == 0:
+                posto = self.posti[(hash(self.session_id) + i) % len(self.posti)]
+                self._richiesta('POST', '/api/blocchi', {'session_id': self.session_id, 'posto_ids': [posto]})
+                self._richiesta('DELETE', '/api/blocchi', {'session_id': self.session_id, 'posto_ids': [posto]})
+            time.sleep(0.05)
+
+
+def misura(args, url):
+    c = http.client.HTTPConnection(urlsplit(url).hostname, urlsplit(url).port, timeout=10)
+    c.request('GET', '/api/posti')
+    posti = [p['id'] for p in json.loads(c.getresponse().read()) if p['stato'] == 'disponibile']
+
+    inizio = time.monotonic()
+    fine = inizio + args.durata
+    stream = [Stream(url, args.attesa, fine) for _ in range(args.stream)]
+    for s in stream:
+        s.start()
+    # Le sonde partono quando gli stream hanno avuto il tempo di connettersi
+    time.sleep(min(args.attesa, args.durata / 4))
+    stats = Statistiche()
+    sonde = [Sonda(url, posti, stats, args.timeout, fine) for _ in range(args.sonde)]
+    for s in sonde:
+        s.start()
+    for t in sonde + stream:
+        t.join(timeout=max(0.0, fine - time.monotonic()) + args.timeout + 5)
+    durata_sonde = max(0.1, fine - inizio - min(args.attesa, args.durata / 4))
+    primi = sorted(s.primo_byte for s in stream if s.primo_byte is not None)
+    errori = {}
+    for s in stream:
+        if s.errore:
+            errori[s.errore] = errori.get(s.errore, 0) + 1
+    return {
+        'stream_richiesti': args.stream,
+        'stream_serviti': len(primi),
+        'stream_primo_byte_p95_ms': round(_percentile(primi, 95) * 1000, 1) if primi else None,
+        'stream_errori': errori,
+        'stream_con_eventi': sum(1 for s in stream if s.eventi),
+        'richieste': stats.riepilogo(durata_sonde),
+    }
+
+
+def stampa(risultati):
+    print(f"{'modalità':<10}{'stream':>14}{'1° byte p95':>13}{'GET p50':>10}{'GET p95':>10}{'req/s':>9}{'err %':>8}")
+    for modalita, r in risultati['modalita'].items():
+        get = r['richieste'].get('GET /api/posti', {})
+        totale = sum(e['richieste'] for e in r['richieste'].values()) or 1
+        errori = sum(v for e in r['richieste'].values() for k, v in e['esiti'].items() if k.startswith('errore'))
+        richieste_s = sum(e['al_secondo'] for e in r['richieste'].values())
+        primo = r['stream_primo_byte_p95_ms']
+        print(f"{modalita:<10}{r['stream_serviti']:>7}/{r['stream_richiesti']:<6}"
+              f"{(f'{primo} ms' if primo is not None else '-'):>13}"
+              f"{get.get('p50_ms', '-'):>10}{get.get('p95_ms', '-'):>10}{richieste_s:>9.1f}{errori / totale * 100:>8.2f}")
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modalita', default='sync,gthread,gevent', help='modalità da confrontare, separate da virgola')
+    parser.add_argument('--stream', type=int, default=500, help='connessioni SSE aperte contemporaneamente')
+    parser.add_argument('--sonde', type=int, default=10, help='client che fanno richieste normali durante il test')
+    parser.add_argument('--durata', type=float, default=20, help='secondi per modalità')
+    parser.add_argument('--attesa', type=float, default=5, help='secondi entro cui uno stream deve ricevere risposta')
+    parser.add_argument('--workers', type=int, default=2, help='worker gunicorn')
+    parser.add_argument('--threads', type=int, default=None, help='SERVER_THREADS per gthread (default di Config)')
+    parser.add_argument('--env', action='append', default=[], metavar='NOME=VALORE',
+                        help='variabile d\'ambiente per il server (ripetibile), es. SSE_STREAM_MAX=1000')
+    parser.add_argument('--timeout', type=float, default=10, help='timeout HTTP delle richieste normali')
+    parser.add_argument('--file', type=int, default=15, help='file della sala generata')
+    parser.add_argument('--posti-per-fila', type=int, default=10)
+    parser.add_argument('--output', help='file JSON dove salvare i risultati')
+    args = parser.parse_args()
+
+    risultati = {'modalita': {}}
+    for modalita in [m.strip() for m in args.modalita.split(',') if m.strip()]:
+        tmp = tempfile.mkdtemp(prefix='teatro-connessioni-')
+        proc = None
+        try:
+            database_url = f"sqlite:///{os.path.join(tmp, 'connessioni.db')}"
+            prepara_sala(database_url, args.file, args.posti_per_fila)
+            ambiente = {
+                'SERVER_MODALITA': modalita,
+                # Gli stream restano aperti per tutta la misura (il default chiude dopo 55 s)
+                'SSE_DURATA_MAX_SECONDI': str(args.durata + 30),
+                'SSE_HEARTBEAT_SECONDI': '1',
+                'REAPER_BLOCCHI': '0',
+            }
+            ambiente.update(v.split('=', 1) for v in args.env)
+            if args.threads:
+                ambiente['SERVER_THREADS'] = str(args.threads)
+            proc, url = avvia_server(database_url, args.workers, [], ambiente)
+            print(f'{modalita}: {args.stream} stream, {args.sonde} client per {args.durata:.0f} s...', flush=True)
+            risultati['modalita'][modalita] = misura(args, url)
+        finally:
+            if proc is not None:
+                proc.terminate()
+                try:
+                    proc.wait(timeout=30)
+                except Exception:
+                    proc.kill()
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    risultati['configurazione'] = {k: v for k, v in vars(args).items() if k != 'output'}
+    risultati['commit'] = _commit_git()
+    risultati['eseguito_il'] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    stampa(risultati)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(risultati, f, indent=2)
+        print(f'Risultati salvati in {args.output}')
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,91 @@
+"""Codici prenotazione a 6 cifre senza tentativi casuali.
+
+Il codice n-esimo è 100000 + P(n), dove P è una permutazione pseudo-casuale di
+[0, 900000) con chiave segreta: una rete di Feistel su 20 bit (2^20 > 900000) con
+"cycle walking" (si riapplica finché il risultato cade nell'intervallo, in media
+1,17 volte). Essendo una biiezione, contatori diversi danno codici diversi: non
+serve cercare collisioni nel DB e il costo è costante anche con lo spazio quasi pieno.
+
+Il contatore e la chiave stanno nella riga di contatore_codici, incrementata con
+UPDATE ... RETURNING dentro la transazione della prenotazione (già in BEGIN IMMEDIATE).
+I codici assegnati prima (casuali) possono coincidere con un valore della
+permutazione: l'INSERT usa ON CONFLICT DO NOTHING e in quel caso passa al contatore
+successivo, quindi le collisioni sono al massimo quante i codici preesistenti.
+"""
+import functools
+import hashlib
+import secrets
+
+from sqlalchemy import text
+
+from app import db
+from models import ContatoreCodici
+
+CODICE_MIN = 100000
+CODICI_TOTALI = 900000
+_BIT_META = 10
+_MASCHERA = (1 << _BIT_META) - 1
+_ROUND = 8
+
+
+@functools.lru_cache(maxsize=8)
+def _tabelle(chiave):
+    """Funzioni di round della chiave, precalcolate (8 x 1024 valori) una volta per processo."""
+    return tuple(
+        tuple(int.from_bytes(hashlib.blake2b(bytes((giro,)) + v.to_bytes(2, 'big'), key=chiave, digest_size=2).digest(), 'big') & _MASCHERA
+              for v in range(1 << _BIT_META))
+        for giro in range(_ROUND)
+    )
+
+
+def _feistel(tabelle, x):
+    sinistra, destra = x >> _BIT_META, x & _MASCHERA
+    for f in tabelle:
+        sinistra, destra = destra, sinistra ^ f[destra]
+    return (sinistra << _BIT_META) | destra
+
+
+def permuta(chiave, n):
+    """Immagine di n in [0, CODICI_TOTALI) secondo la permutazione di chiave `chiave` (bytes)."""
+    if not 0 <= n < CODICI_TOTALI:
+        raise ValueError('indice fuori intervallo')
+    tabelle = _tabelle(chiave)
+    x = _feistel(tabelle, n)
+    while x >= CODICI_TOTALI:
+        x = _feistel(tabelle, x)
+    return x
+
+
+def codice_da_indice(chiave, n):
+    return str(CODICE_MIN + permuta(chiave, n))
+
+
+# Istruzioni fisse in SQL testuale: con l'UPDATE/INSERT ORM la preparazione costava più
+# dell'esecuzione (circa 0,8 ms contro 0,1 ms per istruzione)
+_INCREMENTA = text('UPDATE contatore_codici SET prossimo = prossimo + 1 WHERE id = 1 RETURNING prossimo, chiave')
+_INSERISCI = text('INSERT INTO codici_prenotazione (evento_id, email, codice) VALUES (:evento_id, :email, :codice) '
+                  'ON CONFLICT (codice) DO NOTHING RETURNING id')
+
+
+def _riserva_indice():
+    """Incrementa il contatore e ritorna (indice, chiave); crea la riga al primo uso."""
+    riga = db.session.execute(_INCREMENTA).first()
+    if riga is None:
+        chiave = secrets.token_hex(16)
+        db.session.add(ContatoreCodici(id=1, prossimo=1, chiave=chiave))
+        db.session.flush()
+        return 0, bytes.fromhex(chiave)
+    return riga.prossimo - 1, bytes.fromhex(riga.chiave)
+
+
+def nuovo_codice(evento_id, email_lower):
+    """Assegna all'email un nuovo codice (da chiamare nella transazione di scrittura).
+    Ritorna il codice, o None se lo spazio dei codici è esaurito."""
+    while True:
+        indice, chiave = _riserva_indice()
+        if indice >= CODICI_TOTALI:
+            return None
+        codice = codice_da_indice(chiave, indice)
+        if db.session.execute(_INSERISCI, {'evento_id': evento_id, 'email': email_lower, 'codice': codice}).first():
+            return codice
+        # Collisione con un codice casuale assegnato prima del contatore: indice successivo
@@ -1,5 +1,39 @@
+import json
 import os
 
+# PRAGMA applicati a ogni nuova connessione SQLite (vedi app._configura_sqlite).
+# 'predefinito' lascia le impostazioni di SQLite (rollback journal, synchronous=FULL).
+SQLITE_PROFILI = {
+    'predefinito': {},
+    'produzione': {
+        'journal_mode': 'WAL',       # i lettori non si bloccano dietro a BEGIN IMMEDIATE
+        'synchronous': 'NORMAL',     # sicuro con WAL, fsync solo ai checkpoint
+        'busy_timeout': 5000,        # ms di attesa sul lock invece di "database is locked"
+        'cache_size': -20000,        # KiB di page cache per connessione
+        'mmap_size': 134217728,      # 128 MiB di I/O mappato in memoria
+        'temp_store': 'MEMORY',
+    },
+}
+
+
+def limiti_worker():
+    """(SSE_STREAM_MAX, SQLITE_POOL_MAX_OVERFLOW) di default per il worker che esegue l'app.
+
+    Il worker effettivo è in SERVER_WORKER, impostato da gunicorn.conf.py dopo il fork dalla
+    classe del worker (quindi anche con -k o --threads da riga di comando), con i suoi thread e
+    connessioni. Con sync ogni stream occupa un worker, con gthread un thread (un quarto resta
+    alle altre richieste), con gevent una greenlet. Worker sconosciuto: nessuno stream, solo polling.
+    """
+    worker = os.environ.get('SERVER_WORKER', '')
+    threads = int(os.environ.get('SERVER_THREADS', '32'))
+    connessioni = int(os.environ.get('SERVER_CONNESSIONI', '1000'))
+    return {
+        'sync': (0, 10),
+        'gthread': (threads * 3 // 4, max(10, threads)),
+        'gevent': (connessioni - 100, 50),
+    }.get(worker, (0, 10))
+
+
 class Config:
     # CORS: in Docker usare es. ALLOWED_ORIGINS=http://localhost:8080,http://localhost
     _cors = os.environ.get('ALLOWED_ORIGINS', '')
@@ -14,5 +48,72 @@ class Config:
         SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or f'sqlite:///{_base}'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
-    ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'admin123')
-    BLOCCO_DURATA_MINUTI = 5
\ No newline at end of file
+    # In alternativa alla password in chiaro: hash werkzeug (generate_password_hash); login con POST /api/admin/login
+    ADMIN_PASSWORD_HASH = os.environ.get('ADMIN_PASSWORD_HASH', '')
+    ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', '' if ADMIN_PASSWORD_HASH else 'admin123')
+    ADMIN_TOKEN_DURATA_SECONDI = int(os.environ.get('ADMIN_TOKEN_DURATA_SECONDI', '3600'))
+    BLOCCO_DURATA_MINUTI = 5
+    # Modalità dei worker gunicorn (gunicorn.conf.py): 'sync' una richiesta alla volta per worker,
+    # 'gthread' SERVER_THREADS thread per worker, 'gevent' fino a SERVER_CONNESSIONI greenlet per worker
+    SERVER_MODALITA = os.environ.get('SERVER_MODALITA', 'gthread')
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', '2'))
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS', '32'))
+    SERVER_CONNESSIONI = int(os.environ.get('SERVER_CONNESSIONI', '1000'))
+    # Versioni della mappa posti conservate nel registro modifiche (GET /api/posti/changes)
+    MODIFICHE_MAX_VERSIONI = int(os.environ.get('MODIFICHE_MAX_VERSIONI', '1000'))
+    # Stream SSE /api/posti/stream: heartbeat, durata massima di una connessione, frequenza di controllo versione
+    SSE_HEARTBEAT_SECONDI = float(os.environ.get('SSE_HEARTBEAT_SECONDI', '15'))
+    SSE_DURATA_MAX_SECONDI = float(os.environ.get('SSE_DURATA_MAX_SECONDI', '55'))
+    SSE_INTERVALLO_CONTROLLO = float(os.environ.get('SSE_INTERVALLO_CONTROLLO', '0.5'))
+    # Stream SSE aperti contemporaneamente per processo; None = dal worker effettivo (limiti_worker)
+    SSE_STREAM_MAX = int(os.environ['SSE_STREAM_MAX']) if os.environ.get('SSE_STREAM_MAX') else None
+    # Reaper dei blocchi scaduti in background (un solo worker, lock su file accanto al DB)
+    REAPER_BLOCCHI = os.environ.get('REAPER_BLOCCHI', '1') == '1' and not os.environ.get('TESTING')
+    REAPER_INTERVALLO_MAX_SECONDI = float(os.environ.get('REAPER_INTERVALLO_MAX_SECONDI', '30'))
+    REAPER_LOCK_FILE = os.environ.get('REAPER_LOCK_FILE', '')
+    # Profilo SQLite (chiave di SQLITE_PROFILI) e pool di connessioni per worker (solo DB su file)
+    SQLITE_PROFILO = os.environ.get('SQLITE_PROFILO', 'produzione')
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ['SQLITE_BUSY_TIMEOUT_MS']) if os.environ.get('SQLITE_BUSY_TIMEOUT_MS') else None
+    SQLITE_POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE', '5'))
+    # Connessioni oltre pool_size; None = dal worker effettivo (limiti_worker)
+    SQLITE_POOL_MAX_OVERFLOW = int(os.environ['SQLITE_POOL_MAX_OVERFLOW']) if os.environ.get('SQLITE_POOL_MAX_OVERFLOW') else None
+    SQLITE_POOL_TIMEOUT = float(os.environ.get('SQLITE_POOL_TIMEOUT', '10'))
+    # Controllo di ammissione (limiti.py): token bucket per classe di route, per session_id e per IP,
+    # come (richieste al secondo, raffica); LIMITI_REGOLE in JSON nell'ambiente per cambiarli
+    LIMITI = os.environ.get('LIMITI', '1') == '1' and not os.environ.get('TESTING')
+    LIMITI_REGOLE = json.loads(os.environ['LIMITI_REGOLE']) if os.environ.get('LIMITI_REGOLE') else {
+        'blocchi': {'sessione': (2, 10), 'ip': (5, 50)},
+        'rinnovi': {'ip': (10, 100)},      # rinnovi e rilasci: solo contro le raffiche di uno script
+        'prenotazioni': {'sessione': (0.5, 5), 'ip': (5, 30)},
+        'recupero': {'ip': (0.2, 10)},     # codici a 6 cifre: contro i tentativi a ripetizione
+        'login': {'ip': (0.1, 5)},
+        'coda': {'ip': (1, 20)},           # numeri della sala d'attesa: niente raffiche di ingressi dallo stesso IP
+    }
+    LIMITI_FILE = os.environ.get('LIMITI_FILE', '')
+    # Dietro nginx: IP del client da X-Real-IP (senza proxy lasciare 0, l'header è falsificabile)
+    LIMITI_PROXY_FIDATO = os.environ.get('LIMITI_PROXY_FIDATO', '0') == '1'
+    # Richieste di scrittura (blocchi, prenotazioni) eseguite insieme per processo, oltre si attende
+    # fino a SCRITTURE_ATTESA_MAX_SECONDI e poi 429 (0 = nessun varco)
+    SCRITTURE_CONCORRENTI = int(os.environ.get('SCRITTURE_CONCORRENTI', '4'))
+    SCRITTURE_ATTESA_MAX_SECONDI = float(os.environ.get('SCRITTURE_ATTESA_MAX_SECONDI', '2'))
+    # Scrittore unico (scrittore.py): blocchi e prenotazioni applicati da un solo thread del worker che
+    # ottiene il lock <db>.scrittore.lock, a lotti di al massimo SCRITTORE_LOTTO_MAX comandi per commit;
+    # un comando non avviato entro SCRITTORE_ATTESA_MAX_SECONDI riceve 503
+    SCRITTORE = os.environ.get('SCRITTORE', '0') == '1'
+    SCRITTORE_LOTTO_MAX = int(os.environ.get('SCRITTORE_LOTTO_MAX', '64'))
+    SCRITTORE_ATTESA_MAX_SECONDI = float(os.environ.get('SCRITTORE_ATTESA_MAX_SECONDI', '10'))
+    SCRITTORE_LOCK_FILE = os.environ.get('SCRITTORE_LOCK_FILE', '')
+    SCRITTORE_SOCKET = os.environ.get('SCRITTORE_SOCKET', '')
+    # Sala d'attesa per le aperture delle vendite (attesa.py): ammissioni al minuto pari a
+    # SALA_ATTESA_PER_POSTO per posto prenotabile dell'evento, almeno SALA_ATTESA_MINIMO_AL_MINUTO
+    SALA_ATTESA = os.environ.get('SALA_ATTESA', '0') == '1'
+    SALA_ATTESA_PER_POSTO = float(os.environ.get('SALA_ATTESA_PER_POSTO', '0.2'))
+    SALA_ATTESA_MINIMO_AL_MINUTO = int(os.environ.get('SALA_ATTESA_MINIMO_AL_MINUTO', '10'))
+    SALA_ATTESA_FILE = os.environ.get('SALA_ATTESA_FILE', '')
+    SALA_ATTESA_DURATA_CODA_SECONDI = int(os.environ.get('SALA_ATTESA_DURATA_CODA_SECONDI', str(6 * 3600)))
+    SALA_ATTESA_DURATA_AMMISSIONE_SECONDI = int(os.environ.get('SALA_ATTESA_DURATA_AMMISSIONE_SECONDI', '1800'))
+    # max-age di GET /api/spettacolo (Cache-Control pubblico, cache di nginx); 0 = no-cache
+    SPETTACOLO_CACHE_SECONDI = int(os.environ.get('SPETTACOLO_CACHE_SECONDI', '30'))
+    # Metriche per route e SQL (GET /api/admin/metrics); richieste più lente della soglia nel log (0 = mai)
+    METRICHE = os.environ.get('METRICHE', '1') == '1'
+    METRICHE_RICHIESTA_LENTA_MS = float(os.environ.get('METRICHE_RICHIESTA_LENTA_MS', '0'))
@@ -7,10 +7,14 @@ os.environ['TESTING'] = '1'
 if 'DATABASE_URL' not in os.environ:
     os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
 
+# Il client di test serve le richieste come un worker a thread (stream SSE attivi)
+os.environ.setdefault('SERVER_WORKER', 'gthread')
+
 # Assicura che backend sia nel path quando si lancia pytest dalla root
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 import pytest
+from sqlalchemy import event
 from app import create_app, db
 
 
@@ -24,3 +28,38 @@ def app():
 @pytest.fixture
 def client(app):
     return app.test_client()
+
+
+class ContatoreQuery:
+    """Istruzioni SQL eseguite sull'engine dell'app dentro il blocco `with`."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.istruzioni = []
+
+    def _registra(self, conn, cursor, statement, parameters, context, executemany):
+        self.istruzioni.append(statement)
+
+    def __enter__(self):
+        self.istruzioni = []
+        event.listen(self.engine, 'before_cursor_execute', self._registra)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._registra)
+
+    @property
+    def numero(self):
+        return len(self.istruzioni)
+
+    def __repr__(self):
+        return f'{self.numero} istruzioni SQL:\n' + '\n'.join(f'  {" ".join(s.split())[:160]}' for s in self.istruzioni)
+
+
+@pytest.fixture
+def conta_query(app):
+    """Conta le istruzioni SQL di un blocco: `with conta_query() as q: client.get(...)`, poi `q.numero`.
+    Per i limiti sul numero di query (regressioni N+1)."""
+    with app.app_context():
+        engine = db.engine
+    return lambda: ContatoreQuery(engine)
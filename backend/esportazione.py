@@ -0,0 +1,132 @@
+"""Export delle prenotazioni confermate (admin) in streaming.
+
+Le prenotazioni sono lette con una sola query unita ai posti e consumate a lotti
+(yield_per): l'elenco per posto esce già ordinato per fila e numero, quello per
+persona arriva raggruppato e ordinato dal DB (numero di posti decrescente, poi
+nome ed email) così l'aggregazione è una singola passata con una persona in memoria.
+Formati: json (stessa forma {byPerson, bySeat} di prima), csv e ndjson.
+"""
+import csv
+import io
+import json
+
+from sqlalchemy import func, select
+from app import db
+from models import Posto, Prenotazione
+
+FORMATI = {
+    'json': 'application/json',
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+VISTE = ('posti', 'persone')
+COLONNE = {
+    'posti': ['fila', 'numero', 'posto', 'nome', 'nome_allieva', 'email'],
+    'persone': ['nome', 'nome_allieva', 'email', 'count', 'posti', 'timestamp'],
+}
+RIGHE_PER_LOTTO = 500
+
+
+def righe_posti(evento_id):
+    """Una riga per posto prenotato dell'evento, ordinate per fila e numero."""
+    stmt = (
+        select(Posto.fila, Posto.numero, Prenotazione.nome, Prenotazione.nome_allieva, Prenotazione.email)
+        .join(Posto, Posto.id == Prenotazione.posto_id)
+        .where(Prenotazione.evento_id == evento_id, Prenotazione.stato == 'confermata')
+        .order_by(Posto.fila, Posto.numero)
+        .execution_options(yield_per=RIGHE_PER_LOTTO)
+    )
+    for fila, numero, nome, nome_allieva, email in db.session.execute(stmt):
+        yield {'fila': fila, 'numero': numero, 'posto': f'{fila}{numero}', 'nome': nome,
+               'nome_allieva': nome_allieva or '', 'email': email}
+
+
+def righe_persone(evento_id):
+    """Una riga per persona (nome, email) dell'evento con i suoi posti, dalla più numerosa."""
+    chiave = (Prenotazione.nome, Prenotazione.email)
+    conteggio = func.count().over(partition_by=chiave).label('conteggio')
+    stmt = (
+        select(Prenotazione.nome, Prenotazione.email, Prenotazione.nome_allieva, Prenotazione.timestamp,
+               Posto.fila, Posto.numero, conteggio)
+        .join(Posto, Posto.id == Prenotazione.posto_id)
+        .where(Prenotazione.evento_id == evento_id, Prenotazione.stato == 'confermata')
+        .order_by(conteggio.desc(), Prenotazione.nome, Prenotazione.email, Posto.fila, Posto.numero)
+        .execution_options(yield_per=RIGHE_PER_LOTTO)
+    )
+    corrente = None
+    for nome, email, nome_allieva, timestamp, fila, numero, _ in db.session.execute(stmt):
+        if corrente is None or (corrente['nome'], corrente['email']) != (nome, email):
+            if corrente is not None:
+                yield _chiudi_persona(corrente)
+            corrente = {'nome': nome, 'nome_allieva': nome_allieva or '', 'email': email,
+                        'count': 0, 'posti': [], 'timestamp': timestamp}
+        elif timestamp and (corrente['timestamp'] is None or timestamp < corrente['timestamp']):
+            corrente['timestamp'] = timestamp
+        corrente['count'] += 1
+        corrente['posti'].append(f'{fila}{numero}')
+    if corrente is not None:
+        yield _chiudi_persona(corrente)
+
+
+def _chiudi_persona(rec):
+    timestamp = rec.pop('timestamp')
+    if timestamp:
+        rec['timestamp'] = timestamp.isoformat()
+    return rec
+
+
+def _a_lotti(pezzi):
+    """Raggruppa i pezzi di testo in chunk da circa RIGHE_PER_LOTTO righe."""
+    lotto = []
+    for pezzo in pezzi:
+        lotto.append(pezzo)
+        if len(lotto) >= RIGHE_PER_LOTTO:
+            yield ''.join(lotto)
+            lotto = []
+    if lotto:
+        yield ''.join(lotto)
+
+
+def _elenco_json(righe, dumps):
+    yield '['
+    for i, riga in enumerate(righe):
+        yield (',' if i else '') + dumps(riga)
+    yield ']'
+
+
+def genera_json(evento_id, dumps=None):
+    """Documento {byPerson, bySeat} (chiavi in ordine alfabetico come jsonify)."""
+    dumps = dumps or (lambda o: json.dumps(o, sort_keys=True))
+
+    def pezzi():
+        yield '{"byPerson":'
+        yield from _elenco_json(righe_persone(evento_id), dumps)
+        yield ',"bySeat":'
+        yield from _elenco_json(righe_posti(evento_id), dumps)
+        yield '}\n'
+    return _a_lotti(pezzi())
+
+
+def genera_ndjson(evento_id, vista, dumps=None):
+    dumps = dumps or (lambda o: json.dumps(o, sort_keys=True))
+    righe = righe_posti(evento_id) if vista == 'posti' else righe_persone(evento_id)
+    return _a_lotti(dumps(r) + '\n' for r in righe)
+
+
+def genera_csv(evento_id, vista):
+    colonne = COLONNE[vista]
+    righe = righe_posti(evento_id) if vista == 'posti' else righe_persone(evento_id)
+
+    def pezzi():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(colonne)
+        for riga in righe:
+            if vista == 'persone':
+                riga = dict(riga, posti=' '.join(riga['posti']))
+            writer.writerow([riga.get(c, '') for c in colonne])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    return _a_lotti(pezzi())
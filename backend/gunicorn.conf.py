@@ -0,0 +1,52 @@
+"""Configurazione gunicorn, letta da ./gunicorn.conf.py all'avvio nella cartella backend.
+
+La modalità dei worker si sceglie con SERVER_MODALITA (vedi config.Config):
+  - gthread (default, anche in Docker): SERVER_THREADS thread per worker; uno stream SSE o
+    un client lento occupa un thread invece dell'intero worker. SQLite rilascia il GIL
+    durante le query;
+  - gevent: greenlet per connessione, adatto a molti stream SSE aperti, ma solo con poche
+    scritture concorrenti. Le chiamate SQLite non cedono il controllo: una query, e
+    soprattutto l'attesa del lock di scrittura (busy_timeout, fino a 5 s), ferma tutto il
+    worker con i suoi stream. Lo stesso vale per il commit di un lotto dello scrittore unico
+    (SCRITTORE=1) e per il reaper, che girano in greenlet dello stesso worker;
+  - sync: un worker = una richiesta, come nelle versioni precedenti.
+Gli argomenti da riga di comando (es. -w 4, -k gevent) hanno la precedenza: post_fork passa
+all'app il worker effettivo (SERVER_WORKER), da cui derivano i limiti di default di stream
+SSE e pool di connessioni (config.limiti_worker).
+"""
+import os
+
+from config import Config
+
+MODALITA = ('sync', 'gthread', 'gevent')
+
+if Config.SERVER_MODALITA not in MODALITA:
+    raise ValueError(f'SERVER_MODALITA sconosciuta: {Config.SERVER_MODALITA!r} (disponibili: {", ".join(MODALITA)})')
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = Config.SERVER_WORKERS
+worker_class = Config.SERVER_MODALITA
+threads = Config.SERVER_THREADS if worker_class == 'gthread' else 1
+worker_connections = Config.SERVER_CONNESSIONI
+# Con sync il timeout limita anche la durata delle richieste (gli stream SSE si chiudono prima,
+# SSE_DURATA_MAX_SECONDI); con gthread e gevent serve solo a rilevare i worker bloccati
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+# L'app viene creata in ogni worker dopo il fork (e dopo il monkey patching di gevent)
+preload_app = False
+
+# Modulo della classe del worker -> SERVER_WORKER (altri worker: sconosciuto, nessuno stream SSE)
+WORKER_PER_MODULO = {
+    'gunicorn.workers.sync': 'sync',
+    'gunicorn.workers.gthread': 'gthread',
+    'gunicorn.workers.ggevent': 'gevent',
+}
+
+
+def post_fork(server, worker):
+    # Nel worker, prima di creare l'app: la classe tiene conto di -k e di --threads (sync con
+    # più thread diventa gthread), che possono differire da SERVER_MODALITA
+    os.environ['SERVER_WORKER'] = WORKER_PER_MODULO.get(type(worker).__module__, '')
+    os.environ['SERVER_THREADS'] = str(server.cfg.threads)
+    os.environ['SERVER_CONNESSIONI'] = str(server.cfg.worker_connections)
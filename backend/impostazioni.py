@@ -0,0 +1,83 @@
+"""Cache in processo di impostazioni ed eventi (dati dello spettacolo).
+
+Impostazioni ed eventi cambiano poche volte a stagione ma sono letti a ogni apertura
+della pagina pubblica (/api/spettacolo), dal pannello admin e dall'elenco eventi.
+Ogni worker ne tiene una copia già pronta (gruppi_file decodificato una volta), valida
+finché non cambia impostazioni.versione: le scritture la incrementano con
+invalida_impostazioni() nella propria transazione e ogni lettura la confronta con una
+SELECT di un intero, come versione_mappa per la mappa posti. La parte statica della
+sala (file, id dei posti, coordinate) è nello snapshot della mappa in routes.py.
+
+I dizionari restituiti sono condivisi tra le richieste: non vanno modificati.
+"""
+import hashlib
+import threading
+
+from flask import current_app
+from sqlalchemy import text
+
+from app import db
+from models import Evento, Impostazioni
+
+_lock = threading.Lock()
+
+
+def versione_impostazioni():
+    return db.session.execute(text('SELECT versione FROM impostazioni WHERE id = 1')).scalar() or 0
+
+
+def _carica(versione):
+    row = db.session.get(Impostazioni, 1)
+    eventi = [e.to_dict(row) for e in Evento.query.order_by(Evento.data_ora, Evento.id)]
+    return {
+        'versione': versione,
+        'impostazioni': {
+            'nome_teatro': (row.nome_teatro if row else '') or '',
+            'indirizzo_teatro': (row.indirizzo_teatro if row else '') or '',
+            'nome_spettacolo': (row.nome_spettacolo if row else '') or '',
+            'data_ora_evento': row.data_ora_evento.isoformat() if row and row.data_ora_evento else None,
+            'numero_file': row.numero_file if row else None,
+            'posti_per_fila': row.posti_per_fila if row else None,
+            'gruppi_file': row.get_gruppi_file() if row else [],
+        },
+        'eventi': eventi,
+        'eventi_per_id': {e['id']: e for e in eventi},
+        'spettacolo': {},  # evento_id -> (body, etag) di /api/spettacolo
+    }
+
+
+def impostazioni_correnti():
+    """Impostazioni ed eventi della versione in DB, ricaricati solo quando la versione cambia."""
+    versione = versione_impostazioni()
+    dati = current_app.extensions.get('teatro_impostazioni')
+    if dati is not None and dati['versione'] == versione:
+        return dati
+    with _lock:
+        dati = current_app.extensions.get('teatro_impostazioni')
+        if dati is None or dati['versione'] != versione:
+            dati = current_app.extensions['teatro_impostazioni'] = _carica(versione)
+        return dati
+
+
+def spettacolo(evento_id):
+    """Corpo JSON ed ETag di /api/spettacolo per l'evento, serializzati una volta per versione."""
+    dati = impostazioni_correnti()
+    risposta = dati['spettacolo'].get(evento_id)
+    if risposta is None:
+        evento = dati['eventi_per_id'].get(evento_id) or {'nome': '', 'data_ora': None}
+        body = current_app.json.response({
+            'evento_id': evento_id,
+            'nome_teatro': dati['impostazioni']['nome_teatro'],
+            'nome_spettacolo': evento['nome'],
+            'data_ora_evento': evento['data_ora'],
+            'gruppi_file': dati['impostazioni']['gruppi_file'],
+        }).get_data()
+        risposta = dati['spettacolo'][evento_id] = (body, f"{dati['versione']}-{hashlib.sha1(body).hexdigest()[:16]}")
+    return risposta
+
+
+def invalida_impostazioni():
+    """Incrementa la versione nella transazione corrente (commit a carico del chiamante):
+    dopo il commit ogni worker ricarica impostazioni ed eventi alla lettura successiva."""
+    if db.session.execute(text('UPDATE impostazioni SET versione = versione + 1 WHERE id = 1')).rowcount == 0:
+        db.session.add(Impostazioni(id=1, versione=1))
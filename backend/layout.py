@@ -0,0 +1,167 @@
+"""Layout della sala: definizione JSON riutilizzabile e generazione dei posti in blocco.
+
+Una definizione elenca le file nell'ordine dal palco:
+
+    {"nome": "Teatro Verdi", "larghezza_corridoio": 1,
+     "file": [{"fila": "A", "posti": 12, "settore": "Platea", "corridoi": [6],
+               "offset": 1, "y": 0, "non_disponibili": [1]}, ...]}
+
+- posti: numero di posti della fila (le file possono avere lunghezze diverse);
+- settore: se assente è ricavato da gruppi_file delle impostazioni ("A-G" -> Platea);
+- corridoi: numeri di posto dopo i quali c'è un corridoio (spostano x);
+- offset, y: posizione del primo posto e della fila (default 0 e indice della fila);
+- non_disponibili: posti creati come non disponibili (es. colonne, posti rimossi).
+
+I posti di un evento sono creati con un solo INSERT multiplo (executemany).
+"""
+import string
+from collections import Counter
+
+from sqlalchemy import insert
+from app import db
+from models import Posto
+
+MAX_POSTI_PER_FILA = 200
+MAX_POSTI_SALA = 5000
+
+
+def espandi_lettere(lettere):
+    """"A-G" -> [A..G], "A,B,C" -> [A, B, C] (come espandiLettere in AdminPanel)."""
+    s = (lettere or '').strip()
+    if not s:
+        return []
+    if '-' in s:
+        a, _, b = (x.strip() for x in s.partition('-'))
+        if len(a) != 1 or len(b) != 1 or a > b:
+            return []
+        return [chr(c) for c in range(ord(a), ord(b) + 1)]
+    return [x.strip() for x in s.split(',') if x.strip()]
+
+
+def settori_da_gruppi(gruppi_file):
+    """Mappa fila -> nome del gruppo (settore) dalle impostazioni."""
+    settori = {}
+    for gruppo in gruppi_file or []:
+        for fila in espandi_lettere(gruppo.get('lettere')):
+            settori.setdefault(fila, gruppo.get('nome') or None)
+    return settori
+
+
+def layout_rettangolare(numero_file, posti_per_fila, nome=''):
+    """Definizione equivalente alla griglia numero_file x posti_per_fila delle impostazioni."""
+    return {'nome': nome, 'file': [
+        {'fila': lettera, 'posti': posti_per_fila} for lettera in string.ascii_uppercase[:numero_file]
+    ]}
+
+
+def valida_layout(definizione):
+    """Normalizza una definizione; ValueError con messaggio se non valida."""
+    if not isinstance(definizione, dict) or not isinstance(definizione.get('file'), list) or not definizione['file']:
+        raise ValueError('Il layout deve contenere un elenco "file" non vuoto')
+    larghezza = definizione.get('larghezza_corridoio', 1)
+    if not isinstance(larghezza, (int, float)) or larghezza < 0:
+        raise ValueError('larghezza_corridoio non valida')
+    file = []
+    viste = set()
+    totale = 0
+    for i, riga in enumerate(definizione['file']):
+        if not isinstance(riga, dict):
+            raise ValueError(f'Fila {i + 1} non valida')
+        fila = str(riga.get('fila') or '').strip().upper()
+        if not fila or len(fila) > 10:
+            raise ValueError(f'Fila {i + 1}: nome fila mancante o troppo lungo')
+        if fila in viste:
+            raise ValueError(f'Fila {fila} ripetuta')
+        viste.add(fila)
+        posti = riga.get('posti')
+        if not isinstance(posti, int) or isinstance(posti, bool) or not 1 <= posti <= MAX_POSTI_PER_FILA:
+            raise ValueError(f'Fila {fila}: "posti" deve essere tra 1 e {MAX_POSTI_PER_FILA}')
+        totale += posti
+        corridoi = riga.get('corridoi') or []
+        non_disponibili = riga.get('non_disponibili') or []
+        for nome_elenco, elenco in (('corridoi', corridoi), ('non_disponibili', non_disponibili)):
+            if not isinstance(elenco, list) or not all(isinstance(n, int) and 1 <= n <= posti for n in elenco):
+                raise ValueError(f'Fila {fila}: "{nome_elenco}" deve elencare numeri di posto della fila')
+        offset = riga.get('offset', 0)
+        y = riga.get('y', i)
+        if not isinstance(offset, (int, float)) or not isinstance(y, (int, float)):
+            raise ValueError(f'Fila {fila}: coordinate non valide')
+        settore = riga.get('settore')
+        file.append({
+            'fila': fila,
+            'posti': posti,
+            'settore': str(settore).strip()[:40] if settore else None,
+            'corridoi': sorted(set(corridoi)),
+            'offset': offset,
+            'y': y,
+            'non_disponibili': sorted(set(non_disponibili)),
+        })
+    if totale > MAX_POSTI_SALA:
+        raise ValueError(f'Troppi posti ({totale}, massimo {MAX_POSTI_SALA})')
+    return {'nome': str(definizione.get('nome') or '').strip()[:120], 'larghezza_corridoio': larghezza, 'file': file}
+
+
+def righe_posti(definizione, evento_id, gruppi_file=None):
+    """Righe per INSERT dei posti di una definizione già validata."""
+    settori = settori_da_gruppi(gruppi_file)
+    larghezza = definizione.get('larghezza_corridoio', 1)
+    righe = []
+    for i, riga in enumerate(definizione['file']):
+        settore = riga.get('settore') or settori.get(riga['fila'])
+        corridoi = riga.get('corridoi') or []
+        non_disponibili = set(riga.get('non_disponibili') or [])
+        passati = 0
+        for numero in range(1, riga['posti'] + 1):
+            righe.append({
+                'evento_id': evento_id,
+                'fila': riga['fila'],
+                'numero': numero,
+                'disponibile': numero not in non_disponibili,
+                'riservato_staff': False,
+                'settore': settore,
+                'x': riga.get('offset', 0) + (numero - 1) + passati * larghezza,
+                'y': riga.get('y', i),
+            })
+            if numero in corridoi:
+                passati += 1
+    return righe
+
+
+def genera_posti(definizione, evento_id, gruppi_file=None):
+    """Crea i posti dell'evento con un unico INSERT multiplo (commit a carico del chiamante).
+    Ritorna il numero di posti creati."""
+    righe = righe_posti(definizione, evento_id, gruppi_file)
+    if righe:
+        db.session.execute(insert(Posto), righe)
+    return len(righe)
+
+
+def layout_da_posti(posti, nome=''):
+    """Definizione ricavata dai posti esistenti di un evento (export della sala attuale).
+    `posti` ordinati per fila e numero; le file mantengono l'ordine di prima comparsa.
+    La larghezza dei corridoi è ricavata dai salti di x (la più frequente, se diverse)."""
+    file = {}
+    salti = Counter()
+    for p in posti:
+        riga = file.setdefault(p.fila, {'fila': p.fila, 'posti': 0, 'settore': p.settore,
+                                        'corridoi': [], 'non_disponibili': [], '_x': []})
+        riga['posti'] = max(riga['posti'], p.numero)
+        if not p.disponibile:
+            riga['non_disponibili'].append(p.numero)
+        riga['_x'].append((p.numero, p.x, p.y))
+    out = []
+    for i, riga in enumerate(file.values()):
+        coordinate = sorted(riga.pop('_x'))
+        if coordinate and coordinate[0][1] is not None:
+            riga['offset'] = coordinate[0][1] - (coordinate[0][0] - 1)
+            riga['y'] = coordinate[0][2] if coordinate[0][2] is not None else i
+            # Un salto di x tra posti consecutivi è un corridoio dopo il primo dei due
+            for (n1, x1, _), (n2, x2, _) in zip(coordinate, coordinate[1:]):
+                if x1 is not None and x2 is not None and n2 == n1 + 1 and x2 - x1 > 1:
+                    riga['corridoi'].append(n1)
+                    salti[round(x2 - x1 - 1, 6)] += 1
+        out.append({k: v for k, v in riga.items() if v not in (None, [])})
+    larghezza = salti.most_common(1)[0][0] if salti else 1
+    if float(larghezza).is_integer():
+        larghezza = int(larghezza)
+    return {'nome': nome, 'larghezza_corridoio': larghezza, 'file': out}
@@ -0,0 +1,200 @@
+"""Controllo di ammissione per le route di scrittura: limiti di frequenza e varco di concorrenza.
+
+All'apertura delle vendite pochi client (o script) che ripetono POST /api/blocchi e
+/api/prenotazioni possono occupare l'unico lock di scrittura di SQLite a danno di tutti.
+Prima della view, per le classi di route in LIMITI_REGOLE:
+
+- token bucket per session_id e per IP (richieste al secondo e raffica), condivisi tra
+  i worker gunicorn in un file SQLite separato dal DB (accanto, con suffisso .limiti):
+  un solo UPSERT ... RETURNING per bucket, senza toccare il lock delle prenotazioni.
+  Con il DB in memoria (test, sviluppo) i bucket restano nel processo;
+- varco di concorrenza per processo sulle classi di scrittura (SCRITTURE_CONCORRENTI):
+  le richieste oltre il limite attendono al massimo SCRITTURE_ATTESA_MAX_SECONDI e poi
+  sono rifiutate, invece di accumularsi su BEGIN IMMEDIATE fino al busy_timeout.
+
+Le richieste rifiutate ricevono 429 con Retry-After e sono contate nelle metriche
+(teatro_richieste_rifiutate_total per classe e motivo). Se l'archivio dei bucket non
+risponde la richiesta passa: i limiti proteggono il servizio, non devono fermarlo.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from flask import current_app, g, jsonify, request
+
+# Classe di ogni view limitata (nome della funzione, uguale sotto /api e /api/eventi/<id>)
+CLASSI_ROUTE = {
+    'blocca_posti': 'blocchi',
+    # Rinnovi e rilasci non creano blocchi: classe propria, senza il bucket per sessione dei nuovi blocchi
+    'rinnova_blocchi': 'rinnovi',
+    'rilascio_blocchi': 'rinnovi',
+    'crea_prenotazione': 'prenotazioni',
+    'cancella_prenotazione': 'prenotazioni',
+    'recupera_prenotazioni': 'recupero',
+    'admin_login': 'login',
+    'entra_in_coda': 'coda',
+    'ammissione_coda': 'coda',
+}
+# Classi che passano dal varco di concorrenza (prendono il lock di scrittura)
+CLASSI_SCRITTURA = ('blocchi', 'rinnovi', 'prenotazioni')
+PULIZIA_OGNI = 1000
+BUCKET_INATTIVO_SECONDI = 3600
+
+_PRELEVA = (
+    'INSERT INTO bucket (chiave, gettoni, aggiornato) VALUES (:chiave, :raffica - 1, :ora) '
+    'ON CONFLICT (chiave) DO UPDATE SET '
+    'gettoni = min(:raffica, gettoni + max(0, :ora - aggiornato) * :al_secondo) - 1, aggiornato = :ora '
+    'WHERE min(:raffica, gettoni + max(0, :ora - aggiornato) * :al_secondo) >= 1 '
+    'RETURNING gettoni'
+)
+
+
+def _attesa(gettoni, aggiornato, al_secondo, raffica, ora):
+    """Secondi prima che il bucket abbia di nuovo un gettone."""
+    disponibili = min(raffica, gettoni + max(0.0, ora - aggiornato) * al_secondo)
+    return max(0.0, (1 - disponibili) / al_secondo)
+
+
+class ArchivioMemoria:
+    """Bucket nel processo (DB in memoria: un solo processo)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bucket = {}
+
+    def preleva(self, chiave, al_secondo, raffica, ora):
+        """Preleva un gettone: 0 se concesso, altrimenti i secondi da attendere."""
+        with self._lock:
+            gettoni, aggiornato = self._bucket.get(chiave, (raffica, ora))
+            attesa = _attesa(gettoni, aggiornato, al_secondo, raffica, ora)
+            if attesa > 0:
+                return attesa
+            self._bucket[chiave] = (min(raffica, gettoni + max(0.0, ora - aggiornato) * al_secondo) - 1, ora)
+            return 0.0
+
+
+class ArchivioSQLite:
+    """Bucket in un file SQLite condiviso dai worker (WAL, senza fsync: dopo un crash si riparte pieni).
+    Una connessione per processo, protetta da un lock: ogni prelievo è un'istruzione di pochi µs."""
+
+    def __init__(self, percorso):
+        self.percorso = percorso
+        self._lock = threading.Lock()
+        self._conn = None
+        self._prelievi = 0
+
+    def _connessione(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.percorso, timeout=1, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute('CREATE TABLE IF NOT EXISTS bucket '
+                         '(chiave TEXT PRIMARY KEY, gettoni REAL NOT NULL, aggiornato REAL NOT NULL) WITHOUT ROWID')
+            self._conn = conn
+        return self._conn
+
+    def preleva(self, chiave, al_secondo, raffica, ora):
+        with self._lock:
+            conn = self._connessione()
+            parametri = {'chiave': chiave, 'al_secondo': al_secondo, 'raffica': raffica, 'ora': ora}
+            if conn.execute(_PRELEVA, parametri).fetchone() is not None:
+                self._prelievi += 1
+                if self._prelievi % PULIZIA_OGNI == 0:
+                    conn.execute('DELETE FROM bucket WHERE aggiornato < ?', (ora - BUCKET_INATTIVO_SECONDI,))
+                return 0.0
+            riga = conn.execute('SELECT gettoni, aggiornato FROM bucket WHERE chiave = ?', (chiave,)).fetchone()
+            return _attesa(riga[0], riga[1], al_secondo, raffica, ora) if riga else 0.0
+
+
+def _stato(app):
+    stato = app.extensions.get('teatro_limiti')
+    if stato is None:
+        from app import db
+        percorso_db = db.engine.url.database
+        if percorso_db and percorso_db != ':memory:':
+            archivio = ArchivioSQLite(app.config.get('LIMITI_FILE') or f'{os.path.abspath(percorso_db)}.limiti')
+        else:
+            archivio = ArchivioMemoria()
+        concorrenti = app.config.get('SCRITTURE_CONCORRENTI', 4)
+        stato = app.extensions['teatro_limiti'] = {
+            'archivio': archivio,
+            'varco': threading.BoundedSemaphore(concorrenti) if concorrenti else None,
+        }
+    return stato
+
+
+def _ip():
+    if current_app.config.get('LIMITI_PROXY_FIDATO'):
+        # Dietro nginx (proxy_set_header X-Real-IP): l'indirizzo del client, non quello del proxy
+        return request.headers.get('X-Real-IP') or request.remote_addr or ''
+    return request.remote_addr or ''
+
+
+def _session_id():
+    session_id = request.headers.get('X-Session-Id') or request.args.get('session_id')
+    if not session_id and request.is_json:
+        session_id = (request.get_json(silent=True) or {}).get('session_id')
+    return str(session_id or '').strip()[:64]
+
+
+def _rifiuta(classe, motivo, attesa, messaggio):
+    from metriche import metriche_app
+    metriche = metriche_app()
+    if metriche is not None:
+        metriche.rifiuta(classe, motivo)
+    resp = jsonify({'error': messaggio})
+    resp.status_code = 429
+    resp.headers['Retry-After'] = str(max(1, math.ceil(attesa)))
+    return resp
+
+
+def _ammetti():
+    if not current_app.config.get('LIMITI') or request.endpoint is None:
+        return None
+    classe = CLASSI_ROUTE.get(request.endpoint.rsplit('.', 1)[-1])
+    if classe is None:
+        return None
+    regole = current_app.config.get('LIMITI_REGOLE', {}).get(classe, {})
+    stato = _stato(current_app)
+    ora = time.time()
+    chiavi = []
+    if 'sessione' in regole:
+        session_id = _session_id()
+        if session_id:
+            chiavi.append((f'{classe}:s:{session_id}', regole['sessione']))
+    if 'ip' in regole:
+        chiavi.append((f'{classe}:ip:{_ip()}', regole['ip']))
+    for chiave, (al_secondo, raffica) in chiavi:
+        try:
+            attesa = stato['archivio'].preleva(chiave, al_secondo, raffica, ora)
+        except sqlite3.Error as e:
+            current_app.logger.warning('Limiti non applicati (archivio non disponibile): %s', e)
+            break
+        if attesa > 0:
+            return _rifiuta(classe, 'frequenza', attesa, 'Troppe richieste: riprova tra qualche secondo.')
+    # Con lo scrittore unico le scritture attendono nella sua coda (SCRITTORE_ATTESA_MAX_SECONDI), non al varco
+    if classe in CLASSI_SCRITTURA and stato['varco'] is not None and not current_app.config.get('SCRITTORE'):
+        inizio = time.perf_counter()
+        ammessa = stato['varco'].acquire(timeout=current_app.config.get('SCRITTURE_ATTESA_MAX_SECONDI', 2))
+        from metriche import metriche_app
+        metriche = metriche_app()
+        if metriche is not None:
+            metriche.osserva_attesa_ammissione(time.perf_counter() - inizio)
+        if not ammessa:
+            return _rifiuta(classe, 'occupato', 1, 'Server occupato: riprova tra qualche secondo.')
+        g.limiti_varco = stato['varco']
+    return None
+
+
+def _rilascia(errore):
+    varco = g.pop('limiti_varco', None)
+    if varco is not None:
+        varco.release()
+
+
+def configura_limiti(app):
+    """Registra il controllo di ammissione (attivo se LIMITI, letto a ogni richiesta)."""
+    app.before_request(_ammetti)
+    app.teardown_request(_rilascia)
@@ -0,0 +1,241 @@
+"""Metriche delle richieste e del database, esposte in formato testo Prometheus.
+
+Per ogni route (regola Flask, es. /api/eventi/<int:evento_id>/posti) e metodo:
+istogramma della durata, del numero di istruzioni SQL e del tempo passato nel DB.
+Dagli eventi dell'engine SQLAlchemy: tempo di attesa del lock su BEGIN IMMEDIATE ed
+errori "database is locked"; dal reaper: blocchi scaduti eliminati.
+
+I valori sono per processo (un registro per worker gunicorn): ogni lettura di
+/api/admin/metrics vede il worker che la serve. Le richieste oltre
+METRICHE_RICHIESTA_LENTA_MS sono registrate nel log con le istruzioni SQL più lente.
+"""
+import threading
+import time
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+
+# Limiti superiori dei bucket (secondi e numero di istruzioni)
+BUCKET_SECONDI = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKET_ISTRUZIONI = (1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+ISTRUZIONI_TRACCIA = 5
+
+
+class Istogramma:
+    __slots__ = ('bucket', 'conteggi', 'somma', 'totale')
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.conteggi = [0] * len(bucket)
+        self.somma = 0.0
+        self.totale = 0
+
+    def osserva(self, valore):
+        for i, limite in enumerate(self.bucket):
+            if valore <= limite:
+                self.conteggi[i] += 1
+                break
+        self.somma += valore
+        self.totale += 1
+
+    def righe(self, nome, etichette):
+        etichette = tuple(etichette)
+        cumulato = 0
+        for limite, n in zip(self.bucket, self.conteggi):
+            cumulato += n
+            yield f'{nome}_bucket{_etichette(etichette, le=_numero(limite))} {cumulato}'
+        yield f'{nome}_bucket{_etichette(etichette, le="+Inf")} {self.totale}'
+        yield f'{nome}_sum{_etichette(etichette)} {_numero(self.somma)}'
+        yield f'{nome}_count{_etichette(etichette)} {self.totale}'
+
+
+def _numero(valore):
+    return repr(float(valore)) if isinstance(valore, float) else str(valore)
+
+
+def _etichette(etichette, **altre):
+    coppie = list(etichette) + list(altre.items())
+    if not coppie:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in coppie) + '}'
+
+
+def _escape(valore):
+    return str(valore).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metriche:
+    """Registro in memoria delle metriche di un'app (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durata = {}          # (metodo, route, stato) -> Istogramma secondi
+        self.sql_istruzioni = {}  # (metodo, route) -> Istogramma istruzioni per richiesta
+        self.sql_secondi = {}     # (metodo, route) -> Istogramma secondi nel DB per richiesta
+        self.attesa_lock = Istogramma(BUCKET_SECONDI)
+        self.attesa_ammissione = Istogramma(BUCKET_SECONDI)
+        self.lotto_scrittore = Istogramma(BUCKET_ISTRUZIONI)
+        self.rifiutate = {}       # (classe, motivo) -> richieste rifiutate con 429 (limiti.py)
+        self.contatori = {'lock_errori': 0, 'blocchi_scaduti': 0, 'sql_fuori_richiesta': 0,
+                          'coda_ingressi': 0, 'coda_ammissioni': 0, 'coda_rifiutate': 0,
+                          'scrittore_diretti': 0, 'scrittore_scaduti': 0}
+
+    def osserva_richiesta(self, metodo, route, stato, durata, istruzioni, secondi_sql):
+        with self._lock:
+            _istogramma(self.durata, (metodo, route, stato), BUCKET_SECONDI).osserva(durata)
+            _istogramma(self.sql_istruzioni, (metodo, route), BUCKET_ISTRUZIONI).osserva(istruzioni)
+            _istogramma(self.sql_secondi, (metodo, route), BUCKET_SECONDI).osserva(secondi_sql)
+
+    def osserva_attesa_lock(self, secondi):
+        with self._lock:
+            self.attesa_lock.osserva(secondi)
+
+    def osserva_attesa_ammissione(self, secondi):
+        with self._lock:
+            self.attesa_ammissione.osserva(secondi)
+
+    def osserva_lotto_scrittore(self, comandi):
+        with self._lock:
+            self.lotto_scrittore.osserva(comandi)
+
+    def rifiuta(self, classe, motivo):
+        with self._lock:
+            self.rifiutate[(classe, motivo)] = self.rifiutate.get((classe, motivo), 0) + 1
+
+    def incrementa(self, nome, n=1):
+        with self._lock:
+            self.contatori[nome] += n
+
+    def testo(self):
+        """Esposizione in formato testo Prometheus 0.0.4."""
+        righe = []
+        with self._lock:
+            for nome, aiuto, serie, chiavi in (
+                ('teatro_richieste_durata_secondi', 'Durata delle richieste HTTP per route.',
+                 self.durata, ('metodo', 'route', 'stato')),
+                ('teatro_richieste_sql_istruzioni', 'Istruzioni SQL eseguite per richiesta.',
+                 self.sql_istruzioni, ('metodo', 'route')),
+                ('teatro_richieste_sql_secondi', 'Tempo passato in istruzioni SQL per richiesta.',
+                 self.sql_secondi, ('metodo', 'route')),
+            ):
+                righe += [f'# HELP {nome} {aiuto}', f'# TYPE {nome} histogram']
+                for chiave in sorted(serie):
+                    righe += serie[chiave].righe(nome, zip(chiavi, chiave))
+            righe += ['# HELP teatro_sqlite_attesa_lock_secondi Attesa del lock di scrittura su BEGIN IMMEDIATE.',
+                      '# TYPE teatro_sqlite_attesa_lock_secondi histogram']
+            righe += self.attesa_lock.righe('teatro_sqlite_attesa_lock_secondi', ())
+            righe += ['# HELP teatro_ammissione_attesa_secondi Attesa al varco di concorrenza delle route di scrittura.',
+                      '# TYPE teatro_ammissione_attesa_secondi histogram']
+            righe += self.attesa_ammissione.righe('teatro_ammissione_attesa_secondi', ())
+            righe += ['# HELP teatro_scrittore_lotto_comandi Comandi per commit dello scrittore unico.',
+                      '# TYPE teatro_scrittore_lotto_comandi histogram']
+            righe += self.lotto_scrittore.righe('teatro_scrittore_lotto_comandi', ())
+            righe += ['# HELP teatro_richieste_rifiutate_total Richieste rifiutate con 429 per classe e motivo.',
+                      '# TYPE teatro_richieste_rifiutate_total counter']
+            righe += [f'teatro_richieste_rifiutate_total{_etichette((("classe", c), ("motivo", m)))} {n}'
+                      for (c, m), n in sorted(self.rifiutate.items())]
+            for nome, chiave, aiuto in (
+                ('teatro_sqlite_lock_errori_total', 'lock_errori', 'Errori "database is locked/busy".'),
+                ('teatro_blocchi_scaduti_total', 'blocchi_scaduti', 'Blocchi scaduti eliminati dal reaper.'),
+                ('teatro_sql_fuori_richiesta_total', 'sql_fuori_richiesta',
+                 'Istruzioni SQL eseguite fuori da una richiesta (reaper, stream SSE).'),
+                ('teatro_coda_ingressi_total', 'coda_ingressi', "Numeri assegnati dalla sala d'attesa."),
+                ('teatro_coda_ammissioni_total', 'coda_ammissioni', "Token di ammissione emessi dalla sala d'attesa."),
+                ('teatro_coda_rifiutate_total', 'coda_rifiutate', 'Richieste rifiutate con 403 senza token di ammissione.'),
+                ('teatro_scrittore_diretti_total', 'scrittore_diretti',
+                 'Scritture eseguite dalla richiesta con lo scrittore unico non raggiungibile.'),
+                ('teatro_scrittore_scaduti_total', 'scrittore_scaduti',
+                 'Scritture scartate (503) perché non avviate dallo scrittore entro il tempo massimo.'),
+            ):
+                righe += [f'# HELP {nome} {aiuto}', f'# TYPE {nome} counter', f'{nome} {self.contatori[chiave]}']
+        return '\n'.join(righe) + '\n'
+
+
+def _istogramma(serie, chiave, bucket):
+    ist = serie.get(chiave)
+    if ist is None:
+        ist = serie[chiave] = Istogramma(bucket)
+    return ist
+
+
+def metriche_app(app=None):
+    return (app or current_app).extensions.get('teatro_metriche')
+
+
+def incrementa(nome, n=1):
+    """Incrementa un contatore dell'app corrente (nessun effetto se le metriche sono disattivate)."""
+    metriche = metriche_app() if has_app_context() else None
+    if metriche is not None and n:
+        metriche.incrementa(nome, n)
+
+
+def configura_metriche(app, engine):
+    """Registra hook di richiesta ed eventi dell'engine. Da chiamare dentro l'app context."""
+    if not app.config.get('METRICHE', True):
+        return None
+    metriche = Metriche()
+    app.extensions['teatro_metriche'] = metriche
+
+    @app.before_request
+    def _inizio_richiesta():
+        g.metriche_inizio = time.perf_counter()
+        g.metriche_sql = [0, 0.0]
+        g.metriche_traccia = [] if app.config.get('METRICHE_RICHIESTA_LENTA_MS') else None
+
+    @app.after_request
+    def _fine_richiesta(response):
+        inizio = g.pop('metriche_inizio', None)
+        if inizio is None:
+            return response
+        durata = time.perf_counter() - inizio
+        istruzioni, secondi_sql = g.get('metriche_sql', (0, 0.0))
+        route = request.url_rule.rule if request.url_rule is not None else 'non_trovata'
+        metriche.osserva_richiesta(request.method, route, response.status_code, durata, istruzioni, secondi_sql)
+        soglia_lenta = (app.config.get('METRICHE_RICHIESTA_LENTA_MS') or 0) / 1000
+        if soglia_lenta and durata >= soglia_lenta:
+            lente = sorted(g.get('metriche_traccia') or [], reverse=True)[:ISTRUZIONI_TRACCIA]
+            app.logger.warning(
+                'Richiesta lenta: %s %s -> %s in %.1f ms (%d istruzioni SQL, %.1f ms nel DB)%s',
+                request.method, request.full_path.rstrip('?'), response.status_code, durata * 1000,
+                istruzioni, secondi_sql * 1000,
+                ''.join(f'\n  {s * 1000:.1f} ms  {sql}' for s, sql in lente))
+        return response
+
+    @app.teardown_request
+    def _richiesta_fallita(errore):
+        # after_request non viene eseguito per le eccezioni non gestite (500)
+        inizio = g.pop('metriche_inizio', None)
+        if inizio is not None:
+            istruzioni, secondi_sql = g.get('metriche_sql', (0, 0.0))
+            route = request.url_rule.rule if request.url_rule is not None else 'non_trovata'
+            metriche.osserva_richiesta(request.method, route, 500, time.perf_counter() - inizio, istruzioni, secondi_sql)
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _prima(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metriche_inizio', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _dopo(conn, cursor, statement, parameters, context, executemany):
+        secondi = time.perf_counter() - conn.info['metriche_inizio'].pop()
+        if statement.startswith('BEGIN IMMEDIATE'):
+            metriche.osserva_attesa_lock(secondi)
+        if has_request_context() and 'metriche_sql' in g:
+            g.metriche_sql[0] += 1
+            g.metriche_sql[1] += secondi
+            if g.metriche_traccia is not None:
+                g.metriche_traccia.append((secondi, ' '.join(statement.split())[:200]))
+        else:
+            metriche.incrementa('sql_fuori_richiesta')
+
+    @event.listens_for(engine, 'handle_error')
+    def _errore(contesto):
+        pila = contesto.connection.info.get('metriche_inizio') if contesto.connection is not None else None
+        if pila:
+            secondi = time.perf_counter() - pila.pop()
+            if (contesto.statement or '').startswith('BEGIN IMMEDIATE'):
+                metriche.osserva_attesa_lock(secondi)
+        messaggio = str(contesto.original_exception).lower()
+        if 'locked' in messaggio or 'busy' in messaggio:
+            metriche.incrementa('lock_errori')
+
+    return metriche
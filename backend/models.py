@@ -13,6 +13,8 @@ class Impostazioni(db.Model):
     numero_file = db.Column(db.Integer, nullable=True)  # es. 15
     posti_per_fila = db.Column(db.Integer, nullable=True)  # stesso per tutte le file, es. 10
     gruppi_file = db.Column(db.Text, default='[]')  # JSON: [{"lettere": "A-G", "nome": "Platea"}, ...]
+    # Incrementata a ogni modifica di impostazioni o eventi: invalida la cache dei worker (impostazioni.py)
+    versione = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     def get_gruppi_file(self):
         try:
@@ -24,13 +26,87 @@ class Impostazioni(db.Model):
         self.gruppi_file = json.dumps(value) if value is not None else '[]'
 
 
+class Evento(db.Model):
+    """Spettacolo in vendita (es. una replica): posti, blocchi, prenotazioni e codici sono per evento.
+    L'evento 1 è quello delle route /api/... senza prefisso; nome e data vuoti valgono come in Impostazioni."""
+    __tablename__ = 'eventi'
+    id = db.Column(db.Integer, primary_key=True)
+    nome = db.Column(db.String(120), nullable=True)
+    data_ora = db.Column(db.DateTime, nullable=True)
+    attivo = db.Column(db.Boolean, default=True, nullable=False)
+    creato = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self, impostazioni=None):
+        nome = self.nome or (impostazioni.nome_spettacolo if impostazioni else '') or ''
+        data_ora = self.data_ora or (impostazioni.data_ora_evento if impostazioni else None)
+        return {
+            'id': self.id,
+            'nome': nome,
+            'data_ora': data_ora.isoformat() if data_ora else None,
+            'attivo': self.attivo,
+        }
+
+
+class LayoutSala(db.Model):
+    """Layout della sala riutilizzabile (file di lunghezza variabile, settori, corridoi): vedi layout.py."""
+    __tablename__ = 'layout_sala'
+    id = db.Column(db.Integer, primary_key=True)
+    nome = db.Column(db.String(120), nullable=False, unique=True)
+    definizione = db.Column(db.Text, nullable=False, default='{}')
+    creato = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def get_definizione(self):
+        try:
+            return json.loads(self.definizione or '{}')
+        except Exception:
+            return {}
+
+    def set_definizione(self, value):
+        self.definizione = json.dumps(value)
+
+    def to_dict(self):
+        file = self.get_definizione().get('file', [])
+        return {'id': self.id, 'nome': self.nome, 'file': len(file), 'posti': sum(f.get('posti', 0) for f in file)}
+
+
+class VersioneMappa(db.Model):
+    """Versione della mappa posti, una riga per evento (id = evento_id): incrementata da ogni modifica allo stato dei posti."""
+    __tablename__ = 'versione_mappa'
+    id = db.Column(db.Integer, primary_key=True, default=1)
+    versione = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ModificaPosto(db.Model):
+    """Registro delle transizioni di stato dei posti per versione (ultime MODIFICHE_MAX_VERSIONI).
+    posto_id NULL indica una modifica dell'intera mappa (es. posti rigenerati)."""
+    __tablename__ = 'modifiche_posti'
+    __table_args__ = (
+        db.Index('ix_modifiche_evento_versione', 'evento_id', 'versione'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    evento_id = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    versione = db.Column(db.Integer, nullable=False)
+    posto_id = db.Column(db.Integer, nullable=True)
+    evento = db.Column(db.String(20), nullable=False)  # prenotato, cancellato, bloccato, rilasciato, scaduto, riservato_staff, liberato_staff, rigenerato
+
+    def to_dict(self):
+        return {'versione': self.versione, 'posto_id': self.posto_id, 'evento': self.evento}
+
+
 class Posto(db.Model):
     __tablename__ = 'posti'
+    __table_args__ = (
+        db.Index('ix_posti_evento_fila_numero', 'evento_id', 'fila', 'numero'),  # mappa di un evento
+    )
     id = db.Column(db.Integer, primary_key=True)
+    evento_id = db.Column(db.Integer, db.ForeignKey('eventi.id'), nullable=False, default=1, server_default='1')
     fila = db.Column(db.String(10), nullable=False)
     numero = db.Column(db.Integer, nullable=False)
     disponibile = db.Column(db.Boolean, default=True, nullable=False)
     riservato_staff = db.Column(db.Boolean, default=False, nullable=False)
+    settore = db.Column(db.String(40), nullable=True)  # da layout sala, es. Platea
+    x = db.Column(db.Float, nullable=True)  # coordinate nella piantina (unità = un posto)
+    y = db.Column(db.Float, nullable=True)
 
     prenotazioni = db.relationship('Prenotazione', backref='posto', lazy='dynamic', foreign_keys='Prenotazione.posto_id')
     blocchi = db.relationship('Blocco', backref='posto', lazy='dynamic', foreign_keys='Blocco.posto_id')
@@ -38,7 +114,13 @@ class Posto(db.Model):
 
 class Blocco(db.Model):
     __tablename__ = 'blocchi'
+    __table_args__ = (
+        db.Index('ix_blocchi_session_posto', 'session_id', 'posto_id'),  # rinnovo e rilascio per sessione
+        db.Index('ix_blocchi_scadenza', 'scadenza'),  # reaper
+        db.Index('ix_blocchi_evento_scadenza', 'evento_id', 'scadenza'),  # blocchi attivi di un evento
+    )
     id = db.Column(db.Integer, primary_key=True)
+    evento_id = db.Column(db.Integer, db.ForeignKey('eventi.id'), nullable=False, default=1, server_default='1')
     posto_id = db.Column(db.Integer, db.ForeignKey('posti.id'), nullable=False, unique=True)
     session_id = db.Column(db.String(64), nullable=False)
     scadenza = db.Column(db.DateTime, nullable=False)
@@ -48,19 +130,42 @@ class Blocco(db.Model):
 
 
 class CodicePrenotazione(db.Model):
-    """Codice 6 cifre univoco per email, assegnato alla prima prenotazione."""
+    """Codice 6 cifre univoco per email ed evento, assegnato alla prima prenotazione."""
     __tablename__ = 'codici_prenotazione'
+    __table_args__ = (
+        db.Index('uq_codici_evento_email', 'evento_id', 'email', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(120), nullable=False, unique=True, index=True)
+    evento_id = db.Column(db.Integer, db.ForeignKey('eventi.id'), nullable=False, default=1, server_default='1')
+    email = db.Column(db.String(120), nullable=False)
     codice = db.Column(db.String(6), nullable=False, unique=True)
 
     def __repr__(self):
         return f'<CodicePrenotazione email={self.email!r} codice={self.codice!r}>'
 
 
+class ContatoreCodici(db.Model):
+    """Contatore dei codici prenotazione assegnati (singola riga, id=1): vedi codici.py.
+    chiave è la chiave segreta della permutazione, generata alla creazione della riga."""
+    __tablename__ = 'contatore_codici'
+    id = db.Column(db.Integer, primary_key=True, default=1)
+    prossimo = db.Column(db.Integer, nullable=False, default=0)
+    chiave = db.Column(db.String(64), nullable=False)
+
+
 class Prenotazione(db.Model):
     __tablename__ = 'prenotazioni'
+    __table_args__ = (
+        db.Index('ix_prenotazioni_posto_stato', 'posto_id', 'stato'),
+        db.Index('ix_prenotazioni_evento_email_stato', 'evento_id', 'email', 'stato', 'timestamp'),  # recupero per email
+        db.Index('ix_prenotazioni_evento_stato_timestamp', 'evento_id', 'stato', 'timestamp', 'id'),  # mappa ed elenco per data
+        # Al più una prenotazione confermata per posto
+        db.Index('uq_prenotazioni_posto_confermata', 'posto_id', unique=True,
+                 sqlite_where=db.text("stato = 'confermata'"),
+                 postgresql_where=db.text("stato = 'confermata'")),
+    )
     id = db.Column(db.Integer, primary_key=True)
+    evento_id = db.Column(db.Integer, db.ForeignKey('eventi.id'), nullable=False, default=1, server_default='1')
     posto_id = db.Column(db.Integer, db.ForeignKey('posti.id'), nullable=False)
     nome = db.Column(db.String(120), nullable=False)
     nome_allieva = db.Column(db.String(120), default='', nullable=True)
@@ -71,6 +176,7 @@ class Prenotazione(db.Model):
     def to_dict(self):
         return {
             'id': self.id,
+            'evento_id': self.evento_id,
             'posto_id': self.posto_id,
             'nome': self.nome,
             'nome_allieva': self.nome_allieva or '',
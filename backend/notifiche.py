@@ -0,0 +1,83 @@
+"""Diffusione in tempo reale delle modifiche ai posti (Server-Sent Events).
+
+Il bus condiviso tra i worker gunicorn è il DB stesso (versione_mappa + modifiche_posti):
+in ogni processo un solo stream in attesa alla volta interroga la versione ogni
+`intervallo` secondi e risveglia tutti gli altri; il delta della nuova versione
+viene calcolato una volta sola e condiviso tra gli stream che erano allineati.
+"""
+import json
+import threading
+import time
+
+
+class HubModifiche:
+    """Fan-out delle modifiche alla mappa posti verso gli stream SSE di questo processo."""
+
+    def __init__(self, intervallo=0.5):
+        self.intervallo = intervallo
+        self._cond = threading.Condition()
+        self._versione = None
+        self._delta = None  # (versione_precedente, payload) dell'ultimo avanzamento
+        self._controllore = False
+
+    def attendi(self, versione, timeout, leggi_versione, calcola_delta):
+        """Attende fino a `timeout` secondi una versione diversa da `versione`.
+
+        Ritorna (versione_corrente, payload) dove payload è il delta condiviso se lo stream
+        era allineato alla versione precedente, altrimenti None (il chiamante calcola il proprio).
+        `leggi_versione()` e `calcola_delta(since)` sono chiamate nel contesto del chiamante."""
+        fine = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                # Solo una versione più recente è una novità: se lo stream ha già letto dal DB una
+                # versione oltre quella dell'hub deve attendere, non tornare subito (con gevent
+                # il ciclo non cederebbe mai il controllo al controllore che aggiorna l'hub)
+                if self._versione is not None and self._versione > versione:
+                    return self._versione, self._delta_per(versione)
+                resto = fine - time.monotonic()
+                if resto <= 0:
+                    return versione, None
+                if not self._controllore:
+                    self._controllore = True
+                    break
+                self._cond.wait(resto)
+        try:
+            while True:
+                nuova = leggi_versione()
+                with self._cond:
+                    precedente = self._versione
+                if precedente is not None and nuova != precedente:
+                    payload = calcola_delta(precedente)
+                    with self._cond:
+                        self._versione = payload.get('versione', nuova)
+                        self._delta = (precedente, payload)
+                        self._cond.notify_all()
+                elif precedente is None:
+                    with self._cond:
+                        self._versione = nuova
+                if nuova > versione:
+                    with self._cond:
+                        return self._versione, self._delta_per(versione)
+                resto = fine - time.monotonic()
+                if resto <= 0:
+                    return versione, None
+                time.sleep(min(self.intervallo, resto))
+        finally:
+            with self._cond:
+                self._controllore = False
+                self._cond.notify_all()
+
+    def _delta_per(self, versione):
+        if self._delta and self._delta[0] == versione:
+            return self._delta[1]
+        return None
+
+
+def evento_sse(nome, dati, event_id=None):
+    """Serializza un evento Server-Sent Events."""
+    righe = []
+    if event_id is not None:
+        righe.append(f'id: {event_id}')
+    righe.append(f'event: {nome}')
+    righe.append(f"data: {json.dumps(dati, separators=(',', ':'))}")
+    return '\n'.join(righe) + '\n\n'
@@ -1,17 +1,95 @@
-import random
+import base64
+import hashlib
+import json
+import math
+import re
+import threading
+import time
 from datetime import datetime, timedelta
-from flask import Blueprint, request, jsonify, current_app
-from sqlalchemy import text
+from flask import Blueprint, request, jsonify, current_app, stream_with_context, g, abort
+from sqlalchemy import text, insert, delete, select, literal, tuple_, and_, or_, func
+from sqlalchemy.exc import IntegrityError
 from app import db
-from models import Posto, Prenotazione, Blocco, Impostazioni, CodicePrenotazione
+from models import Posto, Prenotazione, Blocco, Impostazioni, CodicePrenotazione, VersioneMappa, ModificaPosto, Evento, LayoutSala
+from notifiche import HubModifiche, evento_sse
 
 api_bp = Blueprint('api', __name__)
+# Route globali (eventi, layout sala): registrato una sola volta (api_bp è registrato anche sotto /api/eventi/<id>)
+eventi_bp = Blueprint('eventi', __name__)
+
+EVENTO_PREDEFINITO = 1
+
+@api_bp.url_value_preprocessor
+def _estrai_evento(endpoint, values):
+    """Le route sotto /api/eventi/<evento_id>/ operano su quell'evento, quelle sotto /api/ sull'evento 1."""
+    g.evento_id = values.pop('evento_id', EVENTO_PREDEFINITO) if values else EVENTO_PREDEFINITO
+
+@api_bp.before_request
+def _verifica_evento():
+    if g.evento_id == EVENTO_PREDEFINITO:
+        return
+    noti = current_app.extensions.setdefault('teatro_eventi', set())
+    if g.evento_id not in noti:
+        if db.session.get(Evento, g.evento_id) is None:
+            abort(404)
+        noti.add(g.evento_id)
+
+def _evento_id():
+    return g.get('evento_id', EVENTO_PREDEFINITO)
 
 def _pulisci_blocchi_scaduti():
-    """Rimuove tutti i blocchi con scadenza passata."""
+    """Rimuove tutti i blocchi con scadenza passata, di qualsiasi evento (eseguita dal reaper, vedi scadenze.py).
+    Eliminazione e registro modifiche in una transazione sotto il lock di scrittura: un DELETE ... RETURNING
+    registra come 'scaduto' solo i blocchi davvero eliminati, non quelli rinnovati nel frattempo.
+    Ritorna il numero di blocchi eliminati."""
+    _prendi_lock_scrittura()
     now = datetime.utcnow()
-    Blocco.query.filter(Blocco.scadenza < now).delete()
+    per_evento = {}
+    eliminati = db.session.execute(
+        delete(Blocco).where(Blocco.scadenza < now).returning(Blocco.posto_id, Blocco.evento_id))
+    for posto_id, evento_id in eliminati:
+        per_evento.setdefault(evento_id, []).append(posto_id)
+    if not per_evento:
+        db.session.rollback()
+        return 0
+    for evento_id, ids in per_evento.items():
+        _registra_modifica('scaduto', sorted(ids), evento_id)
     db.session.commit()
+    scaduti = sum(len(ids) for ids in per_evento.values())
+    from metriche import incrementa
+    incrementa('blocchi_scaduti', scaduti)
+    return scaduti
+
+def _registra_modifica(evento, posto_ids, evento_id=None):
+    """Incrementa la versione della mappa posti dell'evento (default: quello della richiesta) e registra
+    l'evento per ogni posto coinvolto, nella transazione corrente (commit a carico del chiamante).
+    posto_ids=None indica una modifica dell'intera mappa. Ritorna la nuova versione."""
+    evento_id = evento_id or _evento_id()
+    db.session.execute(text('UPDATE versione_mappa SET versione = versione + 1 WHERE id = :id'), {'id': evento_id})
+    versione = _versione_mappa(evento_id)
+    righe = [{'evento_id': evento_id, 'versione': versione, 'posto_id': pid, 'evento': evento}
+             for pid in (posto_ids if posto_ids is not None else [None])]
+    if righe:
+        db.session.execute(insert(ModificaPosto), righe)
+    max_versioni = current_app.config.get('MODIFICHE_MAX_VERSIONI', 1000)
+    if versione % 100 == 0 and versione > max_versioni:
+        ModificaPosto.query.filter(
+            ModificaPosto.evento_id == evento_id,
+            ModificaPosto.versione <= versione - max_versioni,
+        ).delete(synchronize_session=False)
+    return versione
+
+def _versione_mappa(evento_id=None):
+    return db.session.execute(
+        db.select(VersioneMappa.versione).filter_by(id=evento_id or _evento_id())).scalar() or 0
+
+def _insert_upsert(model):
+    """INSERT con supporto ON CONFLICT del dialetto in uso (SQLite o PostgreSQL)."""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as insert_dialetto
+    else:
+        from sqlalchemy.dialects.sqlite import insert as insert_dialetto
+    return insert_dialetto(model)
 
 def _get_scadenza():
     minuti = current_app.config.get('BLOCCO_DURATA_MINUTI', 5)
@@ -20,69 +98,465 @@ def _get_scadenza():
 def _posto_occupato(posto):
     return Prenotazione.query.filter_by(posto_id=posto.id, stato='confermata').first() is not None
 
-def _posto_blocco_attivo(posto):
-    """Ritorna il Blocco attivo per il posto se esiste (scadenza > now), altrimenti None."""
-    now = datetime.utcnow()
-    return Blocco.query.filter_by(posto_id=posto.id).filter(Blocco.scadenza > now).first()
-
-def _posto_stato(posto, session_id=None):
+def _posto_stato(posto, prenotazione=None, blocco=None, session_id=None):
+    """Stato pubblico del posto dati prenotazione confermata e blocco attivo (già caricati)."""
     if posto.riservato_staff or not posto.disponibile:
         return 'non_disponibile'
-    if _posto_occupato(posto):
+    if prenotazione is not None:
         return 'occupato'
-    blocco = _posto_blocco_attivo(posto)
-    if blocco:
+    if blocco is not None:
         if session_id and blocco.session_id == session_id:
             return 'bloccato_da_me'
         return 'bloccato'
     return 'disponibile'
 
-def _serialize_posto(posto, session_id=None):
-    stato = _posto_stato(posto, session_id)
+def _serialize_posto(posto, session_id=None, prenotazione=None, blocco=None):
+    """Vista pubblica del posto: solo stato e posizione, nessun dato di chi ha prenotato."""
     out = {
         'id': posto.id,
         'fila': posto.fila,
         'numero': posto.numero,
         'disponibile': posto.disponibile,
         'riservato_staff': posto.riservato_staff,
-        'stato': stato
+        'stato': _posto_stato(posto, prenotazione, blocco, session_id)
     }
-    if stato == 'occupato':
-        pren = Prenotazione.query.filter_by(posto_id=posto.id, stato='confermata').first()
-        if pren:
-            out['prenotazione_nome'] = pren.nome
-            out['prenotazione_nome_allieva'] = pren.nome_allieva or ''
-            out['prenotazione_email'] = pren.email
+    if posto.settore is not None or posto.x is not None:
+        out.update({'settore': posto.settore, 'x': posto.x, 'y': posto.y})
+    return out
+
+def _serialize_posto_admin(posto, prenotazione=None, blocco=None):
+    """Vista admin: come quella pubblica più nome, allieva ed email della prenotazione."""
+    out = _serialize_posto(posto, None, prenotazione, blocco)
+    if out['stato'] == 'occupato':
+        out['prenotazione_nome'] = prenotazione.nome
+        out['prenotazione_nome_allieva'] = prenotazione.nome_allieva or ''
+        out['prenotazione_email'] = prenotazione.email
     return out
 
+def _carica_mappa(con_dettagli=False):
+    """Carica posti, prenotazioni confermate e blocchi attivi dell'evento con tre query,
+    indicizzando prenotazioni e blocchi per posto_id.
+
+    Per la mappa pubblica delle prenotazioni serve solo il posto_id; con con_dettagli (admin)
+    la stessa query porta anche nome, allieva ed email."""
+    now = datetime.utcnow()
+    evento_id = _evento_id()
+    posti = Posto.query.filter_by(evento_id=evento_id).order_by(Posto.fila, Posto.numero).all()
+    colonne = [Prenotazione.posto_id]
+    if con_dettagli:
+        colonne += [Prenotazione.nome, Prenotazione.nome_allieva, Prenotazione.email]
+    stmt = select(*colonne).where(Prenotazione.evento_id == evento_id, Prenotazione.stato == 'confermata')
+    prenotazioni = {}
+    for riga in db.session.execute(stmt.order_by(Prenotazione.id)):
+        prenotazioni.setdefault(riga.posto_id, riga)
+    blocchi = {b.posto_id: b for b in Blocco.query.filter(Blocco.evento_id == evento_id, Blocco.scadenza > now)}
+    return posti, prenotazioni, blocchi
+
+def _mappa_posti_admin():
+    """Mappa completa con i dati di chi ha prenotato: il numero di query non dipende dal numero di posti."""
+    posti, prenotazioni, blocchi = _carica_mappa(con_dettagli=True)
+    return [_serialize_posto_admin(p, prenotazioni.get(p.id), blocchi.get(p.id)) for p in posti]
+
+_lock_snapshot = threading.Lock()
+
+def _snapshot_mappa():
+    """Snapshot serializzato della mappa senza sessione, in cache per versione.
+
+    Viene ricostruito quando la versione in DB cambia o quando scade il primo
+    blocco attivo (valido_fino), senza scrivere: i blocchi scaduti sono ignorati
+    e li elimina il reaper. Per ogni blocco si conserva la session_id così da
+    poter sovrapporre lo stato 'bloccato_da_me' del chiamante. Uno snapshot per evento."""
+    evento_id = _evento_id()
+    cache = current_app.extensions.setdefault('teatro_mappa', {}).setdefault('snapshot', {})
+    versione = _versione_mappa(evento_id)
+    snap = cache.get(evento_id)
+    if snap and snap['versione'] == versione and (snap['valido_fino'] is None or datetime.utcnow() < snap['valido_fino']):
+        return snap
+    with _lock_snapshot:
+        snap = cache.get(evento_id)
+        if snap and snap['versione'] == versione and (snap['valido_fino'] is None or datetime.utcnow() < snap['valido_fino']):
+            return snap
+        posti, prenotazioni, blocchi = _carica_mappa()
+        base = []
+        per_sessione = {}
+        for i, p in enumerate(posti):
+            blocco = blocchi.get(p.id)
+            out = _serialize_posto(p, None, prenotazioni.get(p.id), blocco)
+            if out['stato'] == 'bloccato':
+                per_sessione.setdefault(blocco.session_id, []).append(i)
+            base.append(out)
+        body = current_app.json.response(base).get_data()
+        layout = current_app.json.response(
+            {'posti': [{k: p[k] for k in _CAMPI_LAYOUT if k in p} for p in base]}).get_data()
+        stati = _codifica_stati([p['stato'] for p in base])
+        snap = {
+            'versione': versione,
+            'posti': base,
+            'indice': {p['id']: i for i, p in enumerate(base)},
+            'per_sessione': per_sessione,
+            'valido_fino': min((b.scadenza for b in blocchi.values()), default=None),
+            'body': body,
+            'etag': f'{versione}-{hashlib.sha1(body).hexdigest()[:16]}',
+            'layout': layout,
+            'layout_hash': hashlib.sha1(layout).hexdigest()[:16],
+            'stati': stati,
+            'stati_b64': base64.b64encode(stati).decode(),
+        }
+        cache[evento_id] = snap
+        return snap
+
+# Rappresentazione compatta: layout statico + vettore di stati a 2 bit per posto
+_CAMPI_LAYOUT = ('id', 'fila', 'numero', 'settore', 'x', 'y')
+_CODICI_STATO = {'disponibile': 0, 'occupato': 1, 'non_disponibile': 2, 'bloccato': 3}
+
+def _codifica_stati(stati):
+    """2 bit per posto nell'ordine del layout, 4 posti per byte a partire dai bit meno significativi."""
+    buf = bytearray((len(stati) + 3) // 4)
+    for i, stato in enumerate(stati):
+        buf[i >> 2] |= _CODICI_STATO[stato] << ((i & 3) * 2)
+    return bytes(buf)
+
+def _risposta_mappa(session_id=None):
+    """Risposta GET della mappa dallo snapshot: 304 se l'ETag del client è ancora valido."""
+    snap = _snapshot_mappa()
+    miei = snap['per_sessione'].get(session_id) if session_id else None
+    etag = snap['etag']
+    if miei:
+        etag = f"{etag}-{hashlib.sha1(session_id.encode()).hexdigest()[:12]}"
+    if request.if_none_match.contains(etag):
+        resp = current_app.response_class(status=304)
+    elif miei:
+        posti = list(snap['posti'])
+        for i in miei:
+            posti[i] = {**posti[i], 'stato': 'bloccato_da_me'}
+        resp = current_app.json.response(posti)
+    else:
+        resp = current_app.response_class(snap['body'], mimetype=current_app.json.mimetype)
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Versione-Mappa'] = str(snap['versione'])
+    return resp
+
+@api_bp.route('/posti/layout', methods=['GET'])
+def get_posti_layout():
+    """Parte statica della mappa (id, fila, numero, settore, coordinate) nell'ordine del vettore
+    di /api/posti/stato. Con ?v=<hash del layout> la risposta è immutabile e cacheabile a lungo."""
+    snap = _snapshot_mappa()
+    etag = snap['layout_hash']
+    if request.if_none_match.contains(etag):
+        resp = current_app.response_class(status=304)
+    else:
+        resp = current_app.response_class(snap['layout'], mimetype=current_app.json.mimetype)
+    resp.set_etag(etag)
+    if request.args.get('v') == etag:
+        resp.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        resp.headers['Cache-Control'] = 'no-cache'
+    return resp
+
+@api_bp.route('/posti/stato', methods=['GET'])
+def get_posti_stato():
+    """Stato compatto della mappa: 2 bit per posto nell'ordine di /api/posti/layout
+    (0 disponibile, 1 occupato, 2 non disponibile, 3 bloccato) più gli id bloccati dal chiamante.
+    JSON {versione, layout, n, stati (base64), miei} oppure, con Accept: application/octet-stream
+    o ?formato=binario, i byte grezzi con versione, layout e miei negli header X-*."""
+    session_id = request.args.get('session_id') or request.headers.get('X-Session-Id') or ''
+    snap = _snapshot_mappa()
+    miei = [snap['posti'][i]['id'] for i in snap['per_sessione'].get(session_id, [])] if session_id else []
+    binario = request.args.get('formato') == 'binario' or request.accept_mimetypes.best_match(
+        ['application/json', 'application/octet-stream']) == 'application/octet-stream'
+    etag = f"{snap['etag']}-{'b' if binario else 'j'}"
+    if miei:
+        etag = f"{etag}-{hashlib.sha1(session_id.encode()).hexdigest()[:12]}"
+    if request.if_none_match.contains(etag):
+        resp = current_app.response_class(status=304)
+    elif binario:
+        resp = current_app.response_class(snap['stati'], mimetype='application/octet-stream')
+    else:
+        resp = jsonify({
+            'versione': snap['versione'],
+            'layout': snap['layout_hash'],
+            'n': len(snap['posti']),
+            'stati': snap['stati_b64'],
+            'miei': miei,
+        })
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['Vary'] = 'Accept'
+    resp.headers['X-Versione-Mappa'] = str(snap['versione'])
+    resp.headers['X-Layout-Mappa'] = snap['layout_hash']
+    resp.headers['X-Posti-Miei'] = ','.join(str(pid) for pid in miei)
+    return resp
+
 @api_bp.route('/spettacolo', methods=['GET'])
 def get_spettacolo():
-    """Dati spettacolo per la pagina pubblica (senza auth)."""
-    row = Impostazioni.query.get(1)
-    if not row:
-        return jsonify({
-            'nome_teatro': '',
-            'nome_spettacolo': '',
-            'data_ora_evento': None,
-            'gruppi_file': [],
-        })
-    return jsonify({
-        'nome_teatro': row.nome_teatro or '',
-        'nome_spettacolo': row.nome_spettacolo or '',
-        'data_ora_evento': row.data_ora_evento.isoformat() if row.data_ora_evento else None,
-        'gruppi_file': row.get_gruppi_file(),
-    })
+    """Dati spettacolo per la pagina pubblica (senza auth): nome e data dell'evento, se impostati.
+    Serviti dalla cache delle impostazioni, con Cache-Control pubblico per la cache di nginx."""
+    from impostazioni import spettacolo
+    body, etag = spettacolo(_evento_id())
+    if request.if_none_match.contains(etag):
+        resp = current_app.response_class(status=304)
+    else:
+        resp = current_app.response_class(body, mimetype=current_app.json.mimetype)
+    resp.set_etag(etag)
+    secondi = current_app.config.get('SPETTACOLO_CACHE_SECONDI', 30)
+    if secondi:
+        resp.headers['Cache-Control'] = f'public, max-age={secondi}, stale-while-revalidate={secondi * 10}'
+    else:
+        resp.headers['Cache-Control'] = 'no-cache'
+    return resp
 
 
 @api_bp.route('/posti', methods=['GET'])
 def get_posti():
-    _pulisci_blocchi_scaduti()
     session_id = request.args.get('session_id') or request.headers.get('X-Session-Id') or ''
-    posti = Posto.query.order_by(Posto.fila, Posto.numero).all()
-    return jsonify([_serialize_posto(p, session_id) for p in posti])
+    return _risposta_mappa(session_id)
+
+def _delta_posti_base(since):
+    """Posti cambiati dopo la versione `since` (stato attuale dallo snapshot) e relative transizioni.
+    Con resync=True il client deve ricaricare l'intera mappa (versione fuori dal registro o mappa rigenerata).
+    '_sessioni' (posto_id -> session_id dei blocchi) serve solo a _sovrapponi_sessione e non va inviato."""
+    snap = _snapshot_mappa()
+    versione = snap['versione']
+    max_versioni = current_app.config.get('MODIFICHE_MAX_VERSIONI', 1000)
+    if since is None or since > versione or since < versione - max_versioni:
+        return {'versione': versione, 'resync': True}
+    modifiche = []
+    if since < versione:
+        modifiche = ModificaPosto.query.filter(
+            ModificaPosto.evento_id == _evento_id(),
+            ModificaPosto.versione > since,
+            ModificaPosto.versione <= versione
+        ).order_by(ModificaPosto.versione, ModificaPosto.id).all()
+    if any(m.posto_id is None for m in modifiche):
+        return {'versione': versione, 'resync': True}
+    sessioni = {}
+    for sid, indici in snap['per_sessione'].items():
+        for i in indici:
+            sessioni[snap['posti'][i]['id']] = sid
+    posti = []
+    for pid in dict.fromkeys(m.posto_id for m in modifiche):
+        i = snap['indice'].get(pid)
+        if i is not None:
+            posti.append(snap['posti'][i])
+    return {
+        'versione': versione,
+        'resync': False,
+        'posti': posti,
+        'modifiche': [m.to_dict() for m in modifiche],
+        '_sessioni': {p['id']: sessioni[p['id']] for p in posti if p['id'] in sessioni},
+    }
+
+def _delta_posti(since, session_id=None):
+    return _sovrapponi_sessione(_delta_posti_base(since), session_id)
+
+def _sovrapponi_sessione(payload, session_id):
+    """Delta pubblico (senza '_sessioni') con 'bloccato_da_me' sui blocchi di session_id."""
+    if payload.get('resync'):
+        return payload
+    sessioni = payload.get('_sessioni', {})
+    out = {k: v for k, v in payload.items() if k != '_sessioni'}
+    if session_id and session_id in sessioni.values():
+        out['posti'] = [
+            {**p, 'stato': 'bloccato_da_me'} if sessioni.get(p['id']) == session_id else p
+            for p in payload['posti']
+        ]
+    return out
+
+@api_bp.route('/posti/changes', methods=['GET'])
+def get_posti_modifiche():
+    """Delta della mappa posti dalla versione 'since' (vedi _delta_posti)."""
+    session_id = request.args.get('session_id') or request.headers.get('X-Session-Id') or ''
+    return jsonify(_delta_posti(request.args.get('since', type=int), session_id))
+
+def _hub_modifiche():
+    """Hub degli stream SSE dell'evento della richiesta (uno per evento e per processo)."""
+    hub_eventi = current_app.extensions.setdefault('teatro_notifiche', {})
+    hub = hub_eventi.get(_evento_id())
+    if hub is None:
+        hub = hub_eventi.setdefault(
+            _evento_id(), HubModifiche(current_app.config.get('SSE_INTERVALLO_CONTROLLO', 0.5)))
+    return hub
+
+def _evento_delta(payload):
+    if payload['resync']:
+        return evento_sse('resync', {'versione': payload['versione']}, payload['versione'])
+    return evento_sse('posti', payload, payload['versione'])
+
+_lock_stream = threading.Lock()
+
+def _prendi_posto_stream():
+    """Riserva uno degli SSE_STREAM_MAX stream del processo: ogni stream occupa un thread
+    (gthread) o un worker intero (sync) finché resta aperto. Ritorna la funzione che lo
+    libera (idempotente) oppure None se il limite è raggiunto."""
+    limite = current_app.config.get('SSE_STREAM_MAX')
+    stato = current_app.extensions.setdefault('teatro_stream', {'attivi': 0})
+    with _lock_stream:
+        if limite is not None and stato['attivi'] >= limite:
+            return None
+        stato['attivi'] += 1
+    liberato = []
+
+    def rilascia():
+        with _lock_stream:
+            if not liberato:
+                liberato.append(True)
+                stato['attivi'] -= 1
+    return rilascia
+
+@api_bp.route('/posti/stream', methods=['GET'])
+def stream_posti():
+    """Stream Server-Sent Events delle modifiche alla mappa posti.
+
+    Ogni evento 'posti' ha come id la versione della mappa e contiene lo stesso delta di
+    /api/posti/changes; alla riconnessione il browser invia Last-Event-ID e riceve ciò che
+    ha perso (o 'resync'). Senza versione iniziale viene inviato subito 'resync'. Lo stream
+    si chiude dopo SSE_DURATA_MAX_SECONDI (il browser si riconnette da solo) per non
+    superare il timeout dei worker gunicorn sincroni.
+
+    Gli stream aperti per processo sono al massimo SSE_STREAM_MAX: oltre, 503 con Retry-After
+    e il client resta sul polling di /api/posti (con worker sync il limite di default è 0)."""
+    rilascia = _prendi_posto_stream()
+    if rilascia is None:
+        resp = jsonify({'error': 'Troppi aggiornamenti in tempo reale attivi, usa il polling'})
+        resp.status_code = 503
+        resp.headers['Retry-After'] = '30'
+        return resp
+    session_id = request.args.get('session_id') or request.headers.get('X-Session-Id') or ''
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', type=int)
+    heartbeat = current_app.config.get('SSE_HEARTBEAT_SECONDI', 15)
+    durata = current_app.config.get('SSE_DURATA_MAX_SECONDI', 55)
+    hub = _hub_modifiche()
+
+    def leggi_versione():
+        try:
+            return _versione_mappa()
+        finally:
+            db.session.remove()
+
+    def genera():
+        fine = time.monotonic() + durata
+        yield 'retry: 3000\n\n'
+        try:
+            payload = _delta_posti(since, session_id)
+            db.session.remove()  # nessuna connessione trattenuta mentre il client legge
+            versione = payload['versione']
+            if payload['resync'] or payload['posti']:
+                yield _evento_delta(payload)
+            while True:
+                resto = fine - time.monotonic()
+                if resto <= 0:
+                    break
+                nuova, condiviso = hub.attendi(versione, min(heartbeat, resto), leggi_versione, _delta_posti_base)
+                if nuova == versione:
+                    yield ': ping\n\n'
+                    continue
+                if condiviso is not None:
+                    payload = _sovrapponi_sessione(condiviso, session_id)
+                else:
+                    payload = _delta_posti(versione, session_id)
+                db.session.remove()
+                versione = payload['versione']
+                if payload['resync'] or payload['posti']:
+                    yield _evento_delta(payload)
+                else:
+                    # Nessun posto cambiato: solo l'id, che il browser ricorda per Last-Event-ID senza generare eventi
+                    yield f'id: {versione}\n\n'
+        finally:
+            db.session.remove()
+
+    resp = current_app.response_class(stream_with_context(genera()), mimetype='text/event-stream')
+    resp.call_on_close(rilascia)
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
+
+_MESSAGGI_CONFLITTO = {
+    'non_trovato': 'Posto {posto} non trovato',
+    'non_disponibile': 'Posto {posto} non disponibile',
+    'occupato': 'Posto {posto} già occupato. Ricarica la pagina e riprova.',
+    'bloccato': 'Posto {posto} non più disponibile (blocco scaduto o occupato). Ricarica e riprova.',
+}
+
+# Blocchi e prenotazioni su un evento archiviato (Evento.attivo falso), verificato sotto il lock di scrittura
+_EVENTO_ARCHIVIATO = ({'error': 'Evento archiviato: non è più possibile bloccare o prenotare posti.'}, 403)
+
+def _conflitto(pid, motivo, etichetta=None):
+    return {
+        'posto_id': pid,
+        'posto': etichetta,
+        'motivo': motivo,
+        'messaggio': _MESSAGGI_CONFLITTO[motivo].format(posto=etichetta or pid),
+    }
+
+def _corpo_conflitti(conflitti):
+    """Errore con tutti i posti in conflitto; 'error' resta il messaggio del primo (ordine della richiesta)."""
+    return {'error': conflitti[0]['messaggio'], 'conflitti': conflitti}
+
+def _risposta_conflitti(conflitti):
+    return jsonify(_corpo_conflitti(conflitti)), 400
+
+def _verifica_posti_prenotabili(posto_ids, session_id):
+    """Verifica tutti i posti richiesti con una sola query (posti + prenotazione confermata + blocco).
+    Ritorna (etichette dei posti per id, conflitti nell'ordine della richiesta)."""
+    now = datetime.utcnow()
+    righe = db.session.query(Posto, Prenotazione.id, Blocco).outerjoin(
+        Prenotazione, db.and_(Prenotazione.posto_id == Posto.id, Prenotazione.stato == 'confermata')
+    ).outerjoin(Blocco, Blocco.posto_id == Posto.id).filter(
+        Posto.id.in_(posto_ids), Posto.evento_id == _evento_id()).all()
+    per_id = {posto.id: (posto, pren_id, blocco) for posto, pren_id, blocco in righe}
+    etichette = {pid: f'{posto.fila}{posto.numero}' for pid, (posto, _, _) in per_id.items()}
+    conflitti = []
+    for pid in posto_ids:
+        if pid not in per_id:
+            conflitti.append(_conflitto(pid, 'non_trovato'))
+            continue
+        posto, pren_id, blocco = per_id[pid]
+        if posto.riservato_staff or not posto.disponibile:
+            conflitti.append(_conflitto(pid, 'non_disponibile', etichette[pid]))
+        elif pren_id is not None:
+            conflitti.append(_conflitto(pid, 'occupato', etichette[pid]))
+        elif blocco is not None and blocco.scadenza > now and (not session_id or blocco.session_id != session_id):
+            conflitti.append(_conflitto(pid, 'bloccato', etichette[pid]))
+    return etichette, conflitti
+
+def _assegna_codice(email_lower):
+    """Codice prenotazione (6 cifre) dell'email per l'evento: esistente o nuovo, dal contatore
+    permutato di codici.py. Ritorna (codice, nuovo) oppure (None, False) se i codici sono esauriti."""
+    row = CodicePrenotazione.query.filter_by(evento_id=_evento_id(), email=email_lower).first()
+    if row:
+        return row.codice, False
+    from codici import nuovo_codice
+    codice = nuovo_codice(_evento_id(), email_lower)
+    return codice, codice is not None
+
+def _prendi_lock_scrittura():
+    """Su SQLite prende subito il lock di scrittura (BEGIN IMMEDIATE, prima di qualsiasi lettura), chiudendo
+    la transazione di sola lettura in corso. Nel lotto dello scrittore unico il lock è già preso."""
+    if g.get('scrittura_in_lotto'):
+        return
+    db.session.rollback()
+    if db.session.get_bind().dialect.name == 'sqlite':
+        db.session.execute(text('BEGIN IMMEDIATE'))
+
+def _esegui_scrittura(tipo, **dati):
+    """Risposta di un comando di COMANDI_SCRITTURA: dallo scrittore unico se attivo (scrittore.py),
+    altrimenti eseguito nella richiesta."""
+    from scrittore import esegui
+    corpo, stato = esegui(tipo, _evento_id(), dati)
+    return jsonify(corpo), stato
 
 @api_bp.route('/prenotazioni', methods=['POST'])
 def crea_prenotazione():
+    """Prenota tutti i posti richiesti o nessuno.
+
+    La verifica dei posti avviene con una query prima di prendere il lock di scrittura;
+    sotto BEGIN IMMEDIATE (vedi _prenota) restano solo il controllo dei blocchi presi nel
+    frattempo, un unico INSERT multiplo e l'assegnazione del codice. Una prenotazione concorrente
+    sullo stesso posto viene rilevata dall'indice unico parziale (posto_id, stato='confermata').
+    In caso di conflitto la risposta elenca tutti i posti non prenotabili in 'conflitti'."""
     data = request.get_json() or {}
     posto_ids = data.get('posto_ids', [])
     nome = (data.get('nome') or '').strip()
@@ -94,63 +568,198 @@ def crea_prenotazione():
     if not posto_ids:
         return jsonify({'error': 'Seleziona almeno un posto'}), 400
     try:
-        _pulisci_blocchi_scaduti()
-        # Lock per concorrenza: su SQLite BEGIN IMMEDIATE acquisisce il lock subito (prima di qualsiasi lettura)
-        bind = db.session.get_bind()
-        if bind.dialect.name == 'sqlite':
-            db.session.execute(text('BEGIN IMMEDIATE'))
-        for pid in posto_ids:
-            posto = Posto.query.get(pid)
-            if not posto:
-                db.session.rollback()
-                return jsonify({'error': f'Posto {pid} non trovato'}), 400
-            if posto.riservato_staff or not posto.disponibile:
-                db.session.rollback()
-                return jsonify({'error': f'Posto {posto.fila}{posto.numero} non disponibile'}), 400
-            if _posto_occupato(posto):
-                db.session.rollback()
-                return jsonify({'error': f'Posto {posto.fila}{posto.numero} già occupato. Ricarica la pagina e riprova.'}), 400
-            blocco = _posto_blocco_attivo(posto)
-            if blocco and (not session_id or blocco.session_id != session_id):
-                db.session.rollback()
-                return jsonify({'error': f'Posto {posto.fila}{posto.numero} non più disponibile (blocco scaduto o occupato). Ricarica e riprova.'}), 400
-        email_lower = email.lower()
-        created = []
-        for pid in posto_ids:
-            pren = Prenotazione(posto_id=pid, nome=nome, nome_allieva=nome_allieva or None, email=email_lower, stato='confermata')
-            db.session.add(pren)
-            created.append(pren)
-        # Rilascia blocchi sui posti prenotati (qualsiasi session_id)
-        Blocco.query.filter(Blocco.posto_id.in_(posto_ids)).delete(synchronize_session=False)
-        # Assegna o recupera codice prenotazione (6 cifre) per questa email
-        row = CodicePrenotazione.query.filter_by(email=email_lower).first()
-        if row:
-            codice = row.codice
-            codice_nuovo = False
-        else:
-            for _ in range(10):
-                codice = str(random.randint(100000, 999999))
-                if CodicePrenotazione.query.filter_by(codice=codice).first() is None:
-                    db.session.add(CodicePrenotazione(email=email_lower, codice=codice))
-                    codice_nuovo = True
-                    break
-            else:
-                db.session.rollback()
-                return jsonify({'error': 'Impossibile generare codice prenotazione. Riprova.'}), 500
-        db.session.commit()
-        return jsonify({
-            'prenotazioni': [p.to_dict() for p in created],
-            'codice': codice,
-            'codice_nuovo': codice_nuovo,
-        })
+        posto_ids = list(dict.fromkeys(int(pid) for pid in posto_ids))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Posti non validi'}), 400
+    try:
+        etichette, conflitti = _verifica_posti_prenotabili(posto_ids, session_id)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
+    db.session.rollback()
+    if conflitti:
+        return _risposta_conflitti(conflitti)
+    return _esegui_scrittura('prenota', posto_ids=posto_ids, nome=nome, nome_allieva=nome_allieva,
+                             email_lower=email.lower(), session_id=session_id, etichette=etichette)
+
+def _prenota(posto_ids, nome, nome_allieva, email_lower, session_id, etichette):
+    """Sotto il lock di scrittura: di nuovo posti (evento, disponibilità) e blocchi di altri in una query,
+    INSERT delle prenotazioni, codice. La verifica prima del lock serve solo a rifiutare presto. Ritorna (corpo, stato)."""
+    from scrittore import ScritturaAnnullata
+    _prendi_lock_scrittura()
+    now = datetime.utcnow()
+    righe = db.session.query(
+        Posto.id, Posto.disponibile, Posto.riservato_staff, Blocco.session_id, Blocco.scadenza, Evento.attivo,
+    ).join(Evento, Evento.id == Posto.evento_id).outerjoin(
+        Blocco, Blocco.posto_id == Posto.id).filter(Posto.id.in_(posto_ids), Posto.evento_id == _evento_id()).all()
+    if any(not r.attivo for r in righe):
+        return _EVENTO_ARCHIVIATO
+    per_id = {r.id: r for r in righe}
+    conflitti = []
+    for pid in posto_ids:
+        r = per_id.get(pid)
+        if r is None:
+            conflitti.append(_conflitto(pid, 'non_trovato'))
+        elif r.riservato_staff or not r.disponibile:
+            conflitti.append(_conflitto(pid, 'non_disponibile', etichette.get(pid)))
+        elif r.scadenza is not None and r.scadenza > now and (not session_id or r.session_id != session_id):
+            conflitti.append(_conflitto(pid, 'bloccato', etichette.get(pid)))
+    if conflitti:
+        return _corpo_conflitti(conflitti), 400
+    try:
+        with db.session.begin_nested():
+            # Un solo INSERT multiplo: senza sort_by_parameter_order SQLite non deve inserire riga per riga,
+            # l'ordine della richiesta si ricostruisce dal posto_id
+            created = db.session.scalars(insert(Prenotazione).returning(Prenotazione), [
+                {'evento_id': _evento_id(), 'posto_id': pid, 'nome': nome, 'nome_allieva': nome_allieva or None, 'email': email_lower, 'stato': 'confermata'}
+                for pid in posto_ids
+            ]).all()
+            ordine = {pid: i for i, pid in enumerate(posto_ids)}
+            created.sort(key=lambda p: ordine[p.posto_id])
+    except IntegrityError:
+        occupati = {pid for (pid,) in db.session.query(Prenotazione.posto_id).filter(
+            Prenotazione.posto_id.in_(posto_ids), Prenotazione.stato == 'confermata')}
+        return _corpo_conflitti([_conflitto(pid, 'occupato', etichette[pid]) for pid in posto_ids if pid in occupati]), 400
+    # Rilascia blocchi sui posti prenotati (qualsiasi session_id)
+    Blocco.query.filter(Blocco.posto_id.in_(posto_ids)).delete(synchronize_session=False)
+    codice, codice_nuovo = _assegna_codice(email_lower)
+    if codice is None:
+        raise ScritturaAnnullata({'error': 'Codici prenotazione esauriti.'}, 500)
+    _registra_modifica('prenotato', posto_ids)
+    # Serializzate prima del commit, che scade gli oggetti (altrimenti una SELECT per prenotazione)
+    return {
+        'prenotazioni': [p.to_dict() for p in created],
+        'codice': codice,
+        'codice_nuovo': codice_nuovo,
+    }, 200
+
+PAGINA_PRENOTAZIONI_DEFAULT = 50
+PAGINA_PRENOTAZIONI_MAX = 200
+
+
+def _codifica_cursore(pren):
+    dati = [pren.timestamp.isoformat() if pren.timestamp else None, pren.id]
+    return base64.urlsafe_b64encode(json.dumps(dati).encode()).decode().rstrip('=')
+
+
+def _decodifica_cursore(cursore):
+    """(timestamp|None, id) dal cursore opaco; ValueError se non valido."""
+    try:
+        ts, pid = json.loads(base64.urlsafe_b64decode(cursore + '=' * (-len(cursore) % 4)))
+        return (datetime.fromisoformat(ts) if ts is not None else None), int(pid)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Cursore non valido') from e
+
+
+def _parametri_pagina():
+    """(limite, cursore decodificato) dalla query string; ValueError se non validi."""
+    try:
+        limite = int(request.args.get('limit', PAGINA_PRENOTAZIONI_DEFAULT))
+    except ValueError as e:
+        raise ValueError('Limite non valido') from e
+    limite = max(1, min(limite, PAGINA_PRENOTAZIONI_MAX))
+    cursore = request.args.get('cursor')
+    return limite, (_decodifica_cursore(cursore) if cursore else None)
+
+
+def _pagina_prenotazioni(stmt, limite, cursore):
+    """Pagina keyset su (timestamp, id) decrescenti di una select che ha Prenotazione come prima colonna.
+    Le righe senza timestamp (solo dati storici) seguono in coda per id decrescente.
+    Ritorna (righe, cursore della pagina successiva o None)."""
+    righe = []
+    if cursore is None or cursore[0] is not None:
+        s = stmt.where(Prenotazione.timestamp.isnot(None))
+        if cursore is not None:
+            s = s.where(tuple_(Prenotazione.timestamp, Prenotazione.id) < tuple_(*cursore))
+        s = s.order_by(Prenotazione.timestamp.desc(), Prenotazione.id.desc()).limit(limite + 1)
+        righe = db.session.execute(s).all()
+    if len(righe) <= limite:
+        s = stmt.where(Prenotazione.timestamp.is_(None))
+        if cursore is not None and cursore[0] is None:
+            s = s.where(Prenotazione.id < cursore[1])
+        s = s.order_by(Prenotazione.id.desc()).limit(limite + 1 - len(righe))
+        righe += db.session.execute(s).all()
+    if len(righe) <= limite:
+        return righe, None
+    righe = righe[:limite]
+    return righe, _codifica_cursore(righe[-1][0])
+
 
 @api_bp.route('/prenotazioni', methods=['GET'])
 def list_prenotazioni():
-    pren = Prenotazione.query.filter_by(stato='confermata').order_by(Prenotazione.timestamp.desc()).all()
-    return jsonify([p.to_dict() for p in pren])
+    """Prenotazioni confermate dalla più recente. Senza parametri restituisce l'elenco completo
+    (compatibilità); con ?limit e/o ?cursor una pagina {prenotazioni, next_cursor}."""
+    if 'limit' not in request.args and 'cursor' not in request.args:
+        pren = Prenotazione.query.filter_by(evento_id=_evento_id(), stato='confermata').order_by(Prenotazione.timestamp.desc()).all()
+        return jsonify([p.to_dict() for p in pren])
+    try:
+        limite, cursore = _parametri_pagina()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    stmt = select(Prenotazione).where(Prenotazione.evento_id == _evento_id(), Prenotazione.stato == 'confermata')
+    righe, prossimo = _pagina_prenotazioni(stmt, limite, cursore)
+    return jsonify({'prenotazioni': [r[0].to_dict() for r in righe], 'next_cursor': prossimo})
+
+
+def _termini_ricerca(q):
+    return re.findall(r'\w+', q or '')
+
+
+def _filtro_testo(q):
+    """Condizione di ricerca libera su nome, nome allieva ed email (ogni parola come prefisso).
+    Usa l'indice FTS5 se disponibile, altrimenti LIKE. None se non ci sono parole."""
+    termini = _termini_ricerca(q)
+    if not termini:
+        return None
+    if current_app.extensions.get('teatro_fts_prenotazioni'):
+        match = ' '.join(f'"{t}"*' for t in termini)
+        return Prenotazione.id.in_(
+            text('SELECT rowid FROM prenotazioni_fts WHERE prenotazioni_fts MATCH :match').bindparams(match=match))
+    condizioni = []
+    for t in termini:
+        like = f'%{t.lower()}%'
+        condizioni.append(or_(func.lower(Prenotazione.nome).like(like),
+                              func.lower(func.coalesce(Prenotazione.nome_allieva, '')).like(like),
+                              Prenotazione.email.like(like)))
+    return and_(*condizioni)
+
+
+@api_bp.route('/admin/prenotazioni', methods=['GET'])
+def admin_cerca_prenotazioni():
+    """Ricerca prenotazioni (admin) con paginazione keyset.
+    Filtri: email (esatta), nome (contiene), fila, stato (confermata|cancellata|tutte), q (testo libero)."""
+    if not _admin_auth():
+        return jsonify({'error': 'Non autorizzato'}), 401
+    try:
+        limite, cursore = _parametri_pagina()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    stato = request.args.get('stato', 'confermata')
+    if stato not in ('confermata', 'cancellata', 'tutte'):
+        return jsonify({'error': 'Stato non valido'}), 400
+    stmt = select(Prenotazione, Posto.fila, Posto.numero).join(Posto, Posto.id == Prenotazione.posto_id).where(
+        Prenotazione.evento_id == _evento_id())
+    if stato != 'tutte':
+        stmt = stmt.where(Prenotazione.stato == stato)
+    email = (request.args.get('email') or '').strip().lower()
+    if email:
+        stmt = stmt.where(Prenotazione.email == email)
+    nome = (request.args.get('nome') or '').strip().lower()
+    if nome:
+        stmt = stmt.where(func.lower(Prenotazione.nome).contains(nome, autoescape=True))
+    fila = (request.args.get('fila') or '').strip().upper()
+    if fila:
+        stmt = stmt.where(Posto.fila == fila)
+    filtro = _filtro_testo(request.args.get('q'))
+    if filtro is not None:
+        stmt = stmt.where(filtro)
+    righe, prossimo = _pagina_prenotazioni(stmt, limite, cursore)
+    risultati = []
+    for pren, fila_posto, numero in righe:
+        d = pren.to_dict()
+        d.update({'fila': fila_posto, 'numero': numero, 'posto': f'{fila_posto}{numero}'})
+        risultati.append(d)
+    return jsonify({'prenotazioni': risultati, 'next_cursor': prossimo})
 
 
 @api_bp.route('/prenotazioni/recupera', methods=['POST'])
@@ -163,10 +772,10 @@ def recupera_prenotazioni():
         return jsonify({'error': 'Email richiesta'}), 400
     if not codice or len(codice) != 6 or not codice.isdigit():
         return jsonify({'error': 'Codice prenotazione non valido (6 cifre)'}), 400
-    row = CodicePrenotazione.query.filter_by(email=email).first()
+    row = CodicePrenotazione.query.filter_by(evento_id=_evento_id(), email=email).first()
     if not row or row.codice != codice:
         return jsonify({'error': 'Nessuna prenotazione trovata per questa email e codice.'}), 404
-    pren_list = Prenotazione.query.filter_by(email=row.email, stato='confermata').order_by(Prenotazione.timestamp.desc()).all()
+    pren_list = Prenotazione.query.filter_by(evento_id=_evento_id(), email=row.email, stato='confermata').order_by(Prenotazione.timestamp.desc()).all()
     out = []
     for p in pren_list:
         posto = Posto.query.get(p.posto_id)
@@ -181,50 +790,52 @@ def recupera_prenotazioni():
 @api_bp.route('/prenotazioni/<int:pid>', methods=['DELETE'])
 def cancella_prenotazione(pid):
     pren = Prenotazione.query.get(pid)
-    if not pren:
+    if not pren or pren.evento_id != _evento_id():
         return jsonify({'error': 'Prenotazione non trovata'}), 404
     pren.stato = 'cancellata'
+    _registra_modifica('cancellato', [pren.posto_id])
     db.session.commit()
     return jsonify({'ok': True})
 
 @api_bp.route('/admin/file/<fila>', methods=['PUT'])
 def admin_file(fila):
-    data = request.get_json() or {}
-    password = data.get('password') or request.headers.get('X-Admin-Password')
-    if password != current_app.config.get('ADMIN_PASSWORD'):
+    if not _admin_auth():
         return jsonify({'error': 'Non autorizzato'}), 401
+    data = request.get_json(silent=True) or {}
     riservato = data.get('riservato_staff', True)
-    updated = Posto.query.filter_by(fila=fila.upper()).update({'riservato_staff': riservato})
+    ids = [r[0] for r in db.session.query(Posto.id).filter_by(evento_id=_evento_id(), fila=fila.upper())]
+    updated = Posto.query.filter_by(evento_id=_evento_id(), fila=fila.upper()).update({'riservato_staff': riservato})
+    if updated:
+        _registra_modifica('riservato_staff' if riservato else 'liberato_staff', ids)
     db.session.commit()
     return jsonify({'aggiornati': updated})
 
 @api_bp.route('/admin/file', methods=['GET'])
 def admin_list_file():
-    password = request.headers.get('X-Admin-Password') or request.args.get('password')
-    if password != current_app.config.get('ADMIN_PASSWORD'):
+    if not _admin_auth():
         return jsonify({'error': 'Non autorizzato'}), 401
     from sqlalchemy import distinct
-    file = db.session.query(Posto.fila).distinct().order_by(Posto.fila).all()
+    file = db.session.query(Posto.fila).filter_by(evento_id=_evento_id()).distinct().order_by(Posto.fila).all()
     file_list = [f[0] for f in file]
-    riservate = db.session.query(Posto.fila).filter_by(riservato_staff=True).distinct().all()
+    riservate = db.session.query(Posto.fila).filter_by(evento_id=_evento_id(), riservato_staff=True).distinct().all()
     riservate_list = [r[0] for r in riservate]
     return jsonify({'file': file_list, 'riservate': riservate_list})
 
 
 def _admin_auth():
-    password = request.headers.get('X-Admin-Password') or (request.get_json() or {}).get('password') or request.args.get('password')
-    if password != current_app.config.get('ADMIN_PASSWORD'):
-        return None
-    return True
+    """Token "Authorization: Bearer" da POST /api/admin/login oppure header X-Admin-Password
+    (vedi autenticazione.py): niente lettura del corpo né hash per richiesta."""
+    from autenticazione import richiesta_admin
+    return richiesta_admin() or None
 
 
 @api_bp.route('/admin/posti', methods=['GET'])
 def admin_get_posti():
     if not _admin_auth():
         return jsonify({'error': 'Non autorizzato'}), 401
-    _pulisci_blocchi_scaduti()
-    posti = Posto.query.order_by(Posto.fila, Posto.numero).all()
-    return jsonify([_serialize_posto(p, None) for p in posti])
+    resp = jsonify(_mappa_posti_admin())
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
 
 
 @api_bp.route('/admin/posti/<int:posto_id>', methods=['PUT'])
@@ -232,104 +843,91 @@ def admin_set_posto(posto_id):
     if not _admin_auth():
         return jsonify({'error': 'Non autorizzato'}), 401
     posto = Posto.query.get(posto_id)
-    if not posto:
+    if not posto or posto.evento_id != _evento_id():
         return jsonify({'error': 'Posto non trovato'}), 404
     if _posto_occupato(posto):
         return jsonify({'error': 'Non si può modificare un posto già prenotato'}), 400
     data = request.get_json() or {}
     riservato = data.get('riservato_staff', True)
     posto.riservato_staff = bool(riservato)
+    _registra_modifica('riservato_staff' if posto.riservato_staff else 'liberato_staff', [posto.id])
     db.session.commit()
     return jsonify({'ok': True, 'riservato_staff': posto.riservato_staff})
 
 
 @api_bp.route('/admin/export', methods=['GET'])
 def admin_export():
+    """Prenotazioni confermate per posto e per persona, in streaming.
+    Formato da ?formato=json|csv|ndjson o dall'header Accept (default json);
+    per csv e ndjson ?vista=posti|persone sceglie l'elenco (default posti)."""
     if not _admin_auth():
         return jsonify({'error': 'Non autorizzato'}), 401
-    pren_list = Prenotazione.query.filter_by(stato='confermata').order_by(Prenotazione.nome, Prenotazione.email).all()
-    by_seat = []
-    person_map = {}  # (nome, email) -> { count, posti: [], timestamp: datetime }
-    for p in pren_list:
-        posto = Posto.query.get(p.posto_id)
-        if not posto:
-            continue
-        fila, numero = posto.fila, posto.numero
-        label = f'{fila}{numero}'
-        by_seat.append({'fila': fila, 'numero': numero, 'posto': label, 'nome': p.nome, 'nome_allieva': p.nome_allieva or '', 'email': p.email})
-        key = (p.nome, p.email)
-        if key not in person_map:
-            person_map[key] = {'nome': p.nome, 'nome_allieva': p.nome_allieva or '', 'email': p.email, 'count': 0, 'posti': [], 'timestamp': p.timestamp}
-        else:
-            if p.timestamp and (person_map[key]['timestamp'] is None or p.timestamp < person_map[key]['timestamp']):
-                person_map[key]['timestamp'] = p.timestamp
-        person_map[key]['count'] += 1
-        person_map[key]['posti'].append(label)
-    by_person = []
-    for v in person_map.values():
-        rec = {'nome': v['nome'], 'nome_allieva': v['nome_allieva'], 'email': v['email'], 'count': v['count'], 'posti': v['posti']}
-        if v.get('timestamp'):
-            rec['timestamp'] = v['timestamp'].isoformat()
-        by_person.append(rec)
-    by_person.sort(key=lambda x: (-x['count'], x['nome'], x['email']))
-    by_seat.sort(key=lambda x: (x['fila'], x['numero']))
-    return jsonify({'bySeat': by_seat, 'byPerson': by_person})
+    from esportazione import FORMATI, VISTE, genera_csv, genera_json, genera_ndjson
+    formato = request.args.get('formato')
+    if formato is None:
+        mimetype = request.accept_mimetypes.best_match(list(FORMATI.values()), default=FORMATI['json'])
+        formato = next(k for k, v in FORMATI.items() if v == mimetype)
+    vista = request.args.get('vista', 'posti')
+    if formato not in FORMATI or vista not in VISTE:
+        return jsonify({'error': 'Formato non valido'}), 400
+    dumps = current_app.json.dumps
+    evento_id = _evento_id()
+    if formato == 'json':
+        corpo = genera_json(evento_id, dumps)
+    elif formato == 'ndjson':
+        corpo = genera_ndjson(evento_id, vista, dumps)
+    else:
+        corpo = genera_csv(evento_id, vista)
+    resp = current_app.response_class(stream_with_context(corpo), mimetype=FORMATI[formato])
+    if formato != 'json':
+        resp.headers['Content-Disposition'] = f'attachment; filename=prenotazioni-{vista}.{formato}'
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
 
 
 @api_bp.route('/admin/impostazioni', methods=['GET'])
 def admin_get_impostazioni():
     if not _admin_auth():
         return jsonify({'error': 'Non autorizzato'}), 401
-    row = Impostazioni.query.get(1)
-    if not row:
-        return jsonify({
-            'nome_teatro': '', 'indirizzo_teatro': '', 'nome_spettacolo': '',
-            'data_ora_evento': None, 'numero_file': None, 'posti_per_fila': None,
-            'gruppi_file': []
-        })
-    return jsonify({
-        'nome_teatro': row.nome_teatro or '',
-        'indirizzo_teatro': row.indirizzo_teatro or '',
-        'nome_spettacolo': row.nome_spettacolo or '',
-        'data_ora_evento': row.data_ora_evento.isoformat() if row.data_ora_evento else None,
-        'numero_file': row.numero_file,
-        'posti_per_fila': row.posti_per_fila,
-        'gruppi_file': row.get_gruppi_file(),
-    })
+    from impostazioni import impostazioni_correnti
+    return jsonify(impostazioni_correnti()['impostazioni'])
+
+
+def _parse_data_ora(da):
+    """Data e ora 'YYYY-MM-DDTHH:MM' (datetime-local del browser); None se assente o non valida."""
+    if not da or not isinstance(da, str):
+        return None
+    try:
+        s = da.strip()
+        if 'T' not in s:
+            return None
+        date_part, time_part = s.split('T', 1)
+        y, m, d = map(int, date_part.split('-'))
+        h = mnt = 0
+        if time_part:
+            t = time_part.replace('Z', '').replace('+00:00', '').strip()
+            parts = t.split(':')
+            h = int(parts[0]) if len(parts) > 0 else 0
+            mnt = int(parts[1]) if len(parts) > 1 else 0
+        return datetime(y, m, d, h, mnt)
+    except (ValueError, TypeError):
+        return None
 
 
 @api_bp.route('/admin/impostazioni', methods=['PUT'])
 def admin_put_impostazioni():
     if not _admin_auth():
         return jsonify({'error': 'Non autorizzato'}), 401
+    from impostazioni import invalida_impostazioni
     data = request.get_json() or {}
-    row = Impostazioni.query.get(1)
+    row = db.session.get(Impostazioni, 1)
     if not row:
         row = Impostazioni(id=1)
         db.session.add(row)
     row.nome_teatro = (data.get('nome_teatro') or '').strip()[:120]
     row.indirizzo_teatro = (data.get('indirizzo_teatro') or '').strip()[:255]
     row.nome_spettacolo = (data.get('nome_spettacolo') or '').strip()[:120]
-    da = data.get('data_ora_evento')
-    if da and isinstance(da, str):
-        try:
-            s = da.strip()
-            if 'T' in s:
-                date_part, time_part = s.split('T', 1)
-                y, m, d = map(int, date_part.split('-'))
-                h = mnt = 0
-                if time_part:
-                    t = time_part.replace('Z', '').replace('+00:00', '').strip()
-                    parts = t.split(':')
-                    h = int(parts[0]) if len(parts) > 0 else 0
-                    mnt = int(parts[1]) if len(parts) > 1 else 0
-                row.data_ora_evento = datetime(y, m, d, h, mnt)
-            else:
-                row.data_ora_evento = None
-        except (ValueError, TypeError):
-            row.data_ora_evento = None
-    else:
-        row.data_ora_evento = None
+    row.data_ora_evento = _parse_data_ora(data.get('data_ora_evento'))
     row.numero_file = data.get('numero_file') if data.get('numero_file') is not None else None
     if row.numero_file is not None and (row.numero_file < 1 or row.numero_file > 50):
         row.numero_file = None
@@ -339,38 +937,85 @@ def admin_put_impostazioni():
     gruppi = data.get('gruppi_file')
     if isinstance(gruppi, list):
         row.set_gruppi_file([g for g in gruppi if isinstance(g, dict) and g.get('lettere') and g.get('nome')])
+    invalida_impostazioni()
     db.session.commit()
     return jsonify({'ok': True})
 
 
 @api_bp.route('/admin/impostazioni/genera-posti', methods=['POST'])
 def admin_genera_posti():
+    """Rigenera i posti dell'evento dal layout indicato ({"layout_id"} o {"layout": definizione})
+    oppure dalla griglia numero_file x posti_per_fila delle impostazioni, con un solo INSERT."""
     if not _admin_auth():
         return jsonify({'error': 'Non autorizzato'}), 401
-    row = Impostazioni.query.get(1)
-    if not row or row.numero_file is None or row.numero_file < 1 or row.posti_per_fila is None or row.posti_per_fila < 1:
-        return jsonify({'error': 'Configura prima numero di file e posti per fila'}), 400
-    n_prenotazioni = Prenotazione.query.filter_by(stato='confermata').count()
+    from layout import genera_posti, layout_rettangolare, valida_layout
+    from impostazioni import impostazioni_correnti
+    imp = impostazioni_correnti()['impostazioni']
+    data = request.get_json(silent=True) or {}
+    try:
+        definizione = _layout_richiesto(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if definizione is None:
+        if not imp['numero_file'] or imp['numero_file'] < 1 or not imp['posti_per_fila'] or imp['posti_per_fila'] < 1:
+            return jsonify({'error': 'Configura prima numero di file e posti per fila'}), 400
+        definizione = valida_layout(layout_rettangolare(imp['numero_file'], imp['posti_per_fila']))
+    evento_id = _evento_id()
+    # Verifica, eliminazione e nuovi posti in un'unica transazione sotto il lock: se l'INSERT fallisce
+    # l'evento resta con i posti di prima
+    _prendi_lock_scrittura()
+    n_prenotazioni = Prenotazione.query.filter_by(evento_id=evento_id, stato='confermata').count()
     if n_prenotazioni > 0:
+        db.session.rollback()
         return jsonify({'error': 'Impossibile rigenerare: ci sono prenotazioni confermate. Elimina le prenotazioni prima.'}), 400
-    Blocco.query.delete()
-    Posto.query.delete()
-    db.session.commit()
-    import string
-    letters = string.ascii_uppercase[: row.numero_file]
-    for i, letter in enumerate(letters):
-        for n in range(1, row.posti_per_fila + 1):
-            db.session.add(Posto(fila=letter, numero=n, disponibile=True, riservato_staff=False))
-    db.session.commit()
-    return jsonify({'ok': True, 'creati': row.numero_file * row.posti_per_fila})
+    try:
+        Blocco.query.filter_by(evento_id=evento_id).delete()
+        Posto.query.filter_by(evento_id=evento_id).delete()
+        creati = genera_posti(definizione, evento_id, imp['gruppi_file'])
+        _registra_modifica('rigenerato', None)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception('Rigenerazione posti non riuscita')
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'ok': True, 'creati': creati})
+
+
+def _layout_richiesto(data):
+    """Definizione validata da {"layout_id": id} o {"layout": {...}}; None se non indicata.
+    ValueError se il layout non esiste o non è valido."""
+    from layout import valida_layout
+    if data.get('layout_id') is not None:
+        layout = db.session.get(LayoutSala, data['layout_id']) if isinstance(data['layout_id'], int) else None
+        if layout is None:
+            raise ValueError('Layout non trovato')
+        return valida_layout(layout.get_definizione())
+    if data.get('layout') is not None:
+        return valida_layout(data['layout'])
+    return None
+
+
+@api_bp.route('/admin/posti/layout', methods=['GET'])
+def admin_esporta_layout_posti():
+    """Layout (JSON) ricavato dai posti attuali dell'evento, importabile con POST /api/admin/layout."""
+    if not _admin_auth():
+        return jsonify({'error': 'Non autorizzato'}), 401
+    from layout import layout_da_posti
+    from impostazioni import impostazioni_correnti
+    posti = Posto.query.filter_by(evento_id=_evento_id()).order_by(Posto.fila, Posto.numero).all()
+    return jsonify(layout_da_posti(posti, impostazioni_correnti()['impostazioni']['nome_teatro']))
 
 
 # --- Blocco temporaneo posti ---
 
 @api_bp.route('/blocchi', methods=['POST'])
 def blocca_posti():
-    """Blocca i posti per la session_id. Crea nuovi blocchi o rinnova (scadenza +5 min) se già bloccati da questa session."""
-    _pulisci_blocchi_scaduti()
+    """Blocca i posti per la session_id. Crea nuovi blocchi o rinnova (scadenza +5 min) se già bloccati da questa session.
+
+    I posti richiesti sono letti con una query (posto, prenotazione confermata, blocco attuale);
+    i blocchi sono presi o rinnovati con un unico INSERT ... ON CONFLICT(posto_id) DO UPDATE
+    che sovrascrive solo blocchi della stessa sessione o scaduti: i posti non restituiti
+    da RETURNING sono i conflitti."""
     data = request.get_json() or {}
     posto_ids = data.get('posto_ids', [])
     session_id = (data.get('session_id') or request.headers.get('X-Session-Id') or '').strip()
@@ -378,57 +1023,85 @@ def blocca_posti():
         return jsonify({'error': 'session_id richiesto'}), 400
     if not posto_ids:
         return jsonify({'ok': True, 'bloccati': []})
-    scadenza = _get_scadenza()
-    bloccati = []
-    conflitti = []
+    ids = []
     for pid in posto_ids:
-        posto = Posto.query.get(pid)
-        if not posto or posto.riservato_staff or not posto.disponibile or _posto_occupato(posto):
+        try:
+            ids.append(int(pid))
+        except (TypeError, ValueError):
             continue
-        blocco = _posto_blocco_attivo(posto)
-        if blocco:
-            if blocco.session_id == session_id:
-                blocco.scadenza = scadenza
-                bloccati.append(pid)
-            else:
-                conflitti.append(pid)
-        else:
-            db.session.add(Blocco(posto_id=pid, session_id=session_id, scadenza=scadenza))
-            bloccati.append(pid)
-    db.session.commit()
+    ids = list(dict.fromkeys(ids))
+    return _esegui_scrittura('blocca', session_id=session_id, posto_ids=ids)
+
+def _blocca(session_id, posto_ids):
+    _prendi_lock_scrittura()
+    scadenza = _get_scadenza()
+    now = datetime.utcnow()
+    righe = db.session.query(Posto.id, Posto.fila, Posto.numero, Blocco.session_id, Blocco.scadenza, Evento.attivo).join(
+        Evento, Evento.id == Posto.evento_id
+    ).outerjoin(
+        Prenotazione, db.and_(Prenotazione.posto_id == Posto.id, Prenotazione.stato == 'confermata')
+    ).outerjoin(Blocco, Blocco.posto_id == Posto.id).filter(
+        Posto.id.in_(posto_ids),
+        Posto.evento_id == _evento_id(),
+        Posto.riservato_staff.is_(False),
+        Posto.disponibile.is_(True),
+        Prenotazione.id.is_(None),
+    ).all()
+    if any(not r.attivo for r in righe):
+        return _EVENTO_ARCHIVIATO
+    etichette = {r.id: f'{r.fila}{r.numero}' for r in righe}
+    gia_miei = {r.id for r in righe if r.session_id == session_id and r.scadenza is not None and r.scadenza > now}
+    candidati = [pid for pid in posto_ids if pid in etichette]
+    bloccati = []
+    if candidati:
+        upsert = _insert_upsert(Blocco).values([
+            {'evento_id': _evento_id(), 'posto_id': pid, 'session_id': session_id, 'scadenza': scadenza} for pid in candidati
+        ])
+        upsert = upsert.on_conflict_do_update(
+            index_elements=['posto_id'],
+            set_={'session_id': upsert.excluded.session_id, 'scadenza': upsert.excluded.scadenza},
+            where=db.or_(Blocco.session_id == upsert.excluded.session_id, Blocco.scadenza < now),
+        ).returning(Blocco.posto_id)
+        presi = {pid for (pid,) in db.session.execute(upsert)}
+        bloccati = [pid for pid in candidati if pid in presi]
+    conflitti = [pid for pid in candidati if pid not in bloccati]
+    nuovi = [pid for pid in bloccati if pid not in gia_miei]
+    if nuovi:
+        # i posti già bloccati dalla sessione sono solo rinnovati: nessuna modifica, come in _rinnova
+        _registra_modifica('bloccato', nuovi)
     if conflitti:
-        conflitti_etichette = []
-        for pid in conflitti:
-            p = Posto.query.get(pid)
-            if p:
-                conflitti_etichette.append(f'{p.fila}{p.numero}')
-        return jsonify({
+        return {
             'error': 'Alcuni posti sono stati bloccati da un altro utente.',
             'bloccati': bloccati,
             'conflitti': conflitti,
-            'conflitti_etichette': conflitti_etichette,
-        }), 409
-    return jsonify({'ok': True, 'bloccati': bloccati})
+            'conflitti_etichette': [etichette[pid] for pid in conflitti],
+        }, 409
+    return {'ok': True, 'bloccati': bloccati}, 200
 
 
 @api_bp.route('/blocchi/rinnovo', methods=['PUT'])
 def rinnova_blocchi():
     """Rinnova la scadenza (+5 min) per i blocchi della session_id sui posti indicati."""
-    _pulisci_blocchi_scaduti()
     data = request.get_json() or {}
     posto_ids = data.get('posto_ids', [])
     session_id = (data.get('session_id') or request.headers.get('X-Session-Id') or '').strip()
     if not session_id or not posto_ids:
         return jsonify({'ok': True})
+    return _esegui_scrittura('rinnova', session_id=session_id, posto_ids=posto_ids)
+
+def _rinnova(session_id, posto_ids):
     scadenza = _get_scadenza()
     now = datetime.utcnow()
     Blocco.query.filter(
+        Blocco.evento_id == _evento_id(),
         Blocco.session_id == session_id,
         Blocco.posto_id.in_(posto_ids),
         Blocco.scadenza > now
     ).update({'scadenza': scadenza}, synchronize_session=False)
-    db.session.commit()
-    return jsonify({'ok': True})
+    # Nessuna modifica registrata: lo stato dei posti non cambia, quindi versione ed ETag restano validi
+    # (304 ai client in polling). Lo snapshot della mappa scade comunque alla vecchia scadenza
+    # (valido_fino) e viene ricostruito con quella nuova, con lo stesso contenuto e lo stesso ETag.
+    return {'ok': True}, 200
 
 
 @api_bp.route('/blocchi', methods=['DELETE'])
@@ -439,9 +1112,257 @@ def rilascio_blocchi():
     session_id = (data.get('session_id') or request.headers.get('X-Session-Id') or '').strip()
     if not session_id or not posto_ids:
         return jsonify({'ok': True})
-    Blocco.query.filter(
+    return _esegui_scrittura('rilascia', session_id=session_id, posto_ids=posto_ids)
+
+def _rilascia(session_id, posto_ids):
+    rilasciati = [r[0] for r in db.session.query(Blocco.posto_id).filter(
+        Blocco.evento_id == _evento_id(),
         Blocco.session_id == session_id,
         Blocco.posto_id.in_(posto_ids)
-    ).delete(synchronize_session=False)
+    )]
+    if rilasciati:
+        Blocco.query.filter(
+            Blocco.session_id == session_id,
+            Blocco.posto_id.in_(rilasciati)
+        ).delete(synchronize_session=False)
+        _registra_modifica('rilasciato', rilasciati)
+    return {'ok': True}, 200
+
+
+# Comandi di scrittura sui posti (tipo -> funzione che ritorna (corpo, stato) senza commit):
+# eseguiti nella richiesta o, con SCRITTORE, a lotti dallo scrittore unico (scrittore.py)
+COMANDI_SCRITTURA = {
+    'blocca': _blocca,
+    'rinnova': _rinnova,
+    'rilascia': _rilascia,
+    'prenota': _prenota,
+}
+
+
+# --- Sala d'attesa (SALA_ATTESA, vedi attesa.py) ---
+
+@api_bp.route('/coda/stato', methods=['GET'])
+def stato_coda():
+    """Numeri ammessi finora: uguale per tutti, servito dalla cache (il client confronta il proprio numero)."""
+    from attesa import stato_coda as calcola
+    resp = jsonify(calcola(_evento_id()))
+    resp.headers['Cache-Control'] = 'public, max-age=2'
+    return resp
+
+
+@api_bp.route('/coda', methods=['POST'])
+def entra_in_coda():
+    """Assegna il prossimo numero della coda in un token firmato."""
+    from attesa import entra_in_coda as prendi, stato_coda as calcola
+    from metriche import incrementa
+    if not current_app.config.get('SALA_ATTESA'):
+        return jsonify({'attiva': False})
+    token, numero = prendi(_evento_id())
+    incrementa('coda_ingressi')
+    resp = jsonify({**calcola(_evento_id()), 'token': token, 'numero': numero})
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
+
+
+@api_bp.route('/coda/ammissione', methods=['POST'])
+def ammissione_coda():
+    """Scambia il token della coda con un token di ammissione per la session_id, quando è il suo turno.
+    Si può ripetere con lo stesso token della coda per rinnovare l'ammissione prima che scada."""
+    from attesa import attesa_stimata, emetti_ammissione, numero_da_token, stato_coda as calcola
+    from metriche import incrementa
+    if not current_app.config.get('SALA_ATTESA'):
+        return jsonify({'attiva': False})
+    data = request.get_json(silent=True) or {}
+    session_id = str(data.get('session_id') or request.headers.get('X-Session-Id') or '').strip()[:64]
+    if not session_id:
+        return jsonify({'error': 'session_id obbligatorio'}), 400
+    numero = numero_da_token(str(data.get('token') or ''), _evento_id())
+    if numero is None:
+        return jsonify({'error': 'Token della coda non valido o scaduto: rientra in coda.'}), 400
+    stato = calcola(_evento_id())
+    if numero > stato['ammessi_fino_a']:
+        attesa = math.ceil(attesa_stimata(numero, stato))
+        resp = jsonify({**stato, 'numero': numero, 'posizione': numero - stato['ammessi_fino_a']})
+        resp.status_code = 409
+        resp.headers['Retry-After'] = str(max(1, attesa))
+        return resp
+    incrementa('coda_ammissioni')
+    resp = jsonify({'ammissione': emetti_ammissione(_evento_id(), session_id),
+                    'scade_tra': current_app.config.get('SALA_ATTESA_DURATA_AMMISSIONE_SECONDI', 1800)})
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
+
+
+@api_bp.route('/admin/coda', methods=['PUT'])
+def admin_apertura_coda():
+    """Fissa l'apertura delle vendite per la sala d'attesa: {"apertura": ISO 8601} (senza fuso: ora del
+    server), senza campo adesso, null per richiudere. Prima dell'apertura nessun numero è ammesso."""
+    from attesa import imposta_apertura, stato_coda as calcola
+    if not _admin_auth():
+        return jsonify({'error': 'Non autorizzato'}), 401
+    data = request.get_json(silent=True) or {}
+    if 'apertura' not in data:
+        apertura = time.time()
+    elif data['apertura'] is None:
+        apertura = None
+    else:
+        try:
+            apertura = datetime.fromisoformat(str(data['apertura']).replace('Z', '+00:00')).timestamp()
+        except ValueError:
+            return jsonify({'error': 'apertura non valida (ISO 8601)'}), 400
+    imposta_apertura(_evento_id(), apertura)
+    return jsonify(calcola(_evento_id()))
+
+
+# --- Eventi (repliche dello spettacolo) ---
+
+@eventi_bp.route('/eventi', methods=['GET'])
+def lista_eventi():
+    """Eventi attivi (pubblico); con la password admin anche quelli archiviati."""
+    from impostazioni import impostazioni_correnti
+    eventi = impostazioni_correnti()['eventi']
+    if not _admin_auth():
+        eventi = [e for e in eventi if e['attivo']]
+    return jsonify(eventi)
+
+
+@eventi_bp.route('/admin/eventi', methods=['POST'])
+def admin_crea_evento():
+    """Crea un evento con i posti del layout indicato ('layout_id' o 'layout') oppure copiando la sala
+    (posti, riservati staff) da 'copia_da' (default evento 1) con un solo INSERT ... SELECT.
+    Le route dell'evento sono sotto /api/eventi/<id>/."""
+    if not _admin_auth():
+        return jsonify({'error': 'Non autorizzato'}), 401
+    from layout import genera_posti
+    from impostazioni import invalida_impostazioni
+    data = request.get_json(silent=True) or {}
+    try:
+        definizione = _layout_richiesto(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    origine = data.get('copia_da', EVENTO_PREDEFINITO)
+    if definizione is None and (not isinstance(origine, int) or db.session.get(Evento, origine) is None):
+        return jsonify({'error': 'Evento da copiare non trovato'}), 400
+    evento = Evento(
+        nome=(data.get('nome') or '').strip()[:120] or None,
+        data_ora=_parse_data_ora(data.get('data_ora')),
+    )
+    db.session.add(evento)
+    db.session.flush()
+    db.session.add(VersioneMappa(id=evento.id, versione=0))
+    impostazioni = db.session.get(Impostazioni, 1)
+    if definizione is not None:
+        creati = genera_posti(definizione, evento.id, impostazioni.get_gruppi_file() if impostazioni else None)
+    else:
+        creati = db.session.execute(insert(Posto).from_select(
+            ['evento_id', 'fila', 'numero', 'disponibile', 'riservato_staff', 'settore', 'x', 'y'],
+            select(literal(evento.id), Posto.fila, Posto.numero, Posto.disponibile, Posto.riservato_staff,
+                   Posto.settore, Posto.x, Posto.y)
+            .where(Posto.evento_id == origine).order_by(Posto.fila, Posto.numero),
+        )).rowcount
+    invalida_impostazioni()
+    db.session.commit()
+    return jsonify({**evento.to_dict(impostazioni), 'posti': creati}), 201
+
+
+@eventi_bp.route('/admin/eventi/<int:evento_id>', methods=['PUT'])
+def admin_modifica_evento(evento_id):
+    if not _admin_auth():
+        return jsonify({'error': 'Non autorizzato'}), 401
+    evento = db.session.get(Evento, evento_id)
+    if evento is None:
+        return jsonify({'error': 'Evento non trovato'}), 404
+    data = request.get_json(silent=True) or {}
+    if 'nome' in data:
+        evento.nome = (data.get('nome') or '').strip()[:120] or None
+    if 'data_ora' in data:
+        evento.data_ora = _parse_data_ora(data.get('data_ora'))
+    if 'attivo' in data:
+        evento.attivo = bool(data['attivo'])
+    from impostazioni import invalida_impostazioni
+    invalida_impostazioni()
+    db.session.commit()
+    return jsonify(evento.to_dict(db.session.get(Impostazioni, 1)))
+
+
+# --- Layout sala ---
+
+@eventi_bp.route('/admin/layout', methods=['GET'])
+def admin_lista_layout():
+    if not _admin_auth():
+        return jsonify({'error': 'Non autorizzato'}), 401
+    return jsonify([l.to_dict() for l in LayoutSala.query.order_by(LayoutSala.nome)])
+
+
+@eventi_bp.route('/admin/layout', methods=['POST'])
+def admin_importa_layout():
+    """Importa un layout JSON (vedi layout.py); un layout con lo stesso nome viene sostituito."""
+    if not _admin_auth():
+        return jsonify({'error': 'Non autorizzato'}), 401
+    from layout import valida_layout
+    try:
+        definizione = valida_layout(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not definizione['nome']:
+        return jsonify({'error': 'Nome del layout richiesto'}), 400
+    layout = LayoutSala.query.filter_by(nome=definizione['nome']).first()
+    nuovo = layout is None
+    if nuovo:
+        layout = LayoutSala(nome=definizione['nome'])
+        db.session.add(layout)
+    layout.set_definizione(definizione)
+    db.session.commit()
+    return jsonify(layout.to_dict()), 201 if nuovo else 200
+
+
+@eventi_bp.route('/admin/layout/<int:layout_id>', methods=['GET'])
+def admin_esporta_layout(layout_id):
+    if not _admin_auth():
+        return jsonify({'error': 'Non autorizzato'}), 401
+    layout = db.session.get(LayoutSala, layout_id)
+    if layout is None:
+        return jsonify({'error': 'Layout non trovato'}), 404
+    resp = jsonify(layout.get_definizione())
+    resp.headers['Content-Disposition'] = f'attachment; filename=layout-{layout.id}.json'
+    return resp
+
+
+@eventi_bp.route('/admin/layout/<int:layout_id>', methods=['DELETE'])
+def admin_elimina_layout(layout_id):
+    if not _admin_auth():
+        return jsonify({'error': 'Non autorizzato'}), 401
+    layout = db.session.get(LayoutSala, layout_id)
+    if layout is None:
+        return jsonify({'error': 'Layout non trovato'}), 404
+    db.session.delete(layout)
     db.session.commit()
     return jsonify({'ok': True})
+
+
+@eventi_bp.route('/admin/login', methods=['POST'])
+def admin_login():
+    """Scambia la password admin con un token firmato valido ADMIN_TOKEN_DURATA_SECONDI."""
+    from autenticazione import emetti_token, verifica_password
+    data = request.get_json(silent=True) or {}
+    if not verifica_password(data.get('password') or ''):
+        return jsonify({'error': 'Password errata'}), 401
+    durata = current_app.config.get('ADMIN_TOKEN_DURATA_SECONDI', 3600)
+    resp = jsonify({'token': emetti_token(), 'scade_tra': durata})
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
+
+
+@eventi_bp.route('/admin/metrics', methods=['GET'])
+def admin_metriche():
+    """Metriche del processo in formato testo Prometheus (vedi metriche.py)."""
+    if not _admin_auth():
+        return jsonify({'error': 'Non autorizzato'}), 401
+    from metriche import metriche_app
+    metriche = metriche_app()
+    if metriche is None:
+        return jsonify({'error': 'Metriche disattivate (METRICHE=0)'}), 404
+    resp = current_app.response_class(metriche.testo(), mimetype='text/plain')
+    resp.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
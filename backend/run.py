@@ -1,3 +1,8 @@
+import os
+
+# Server di sviluppo: un thread per richiesta, come un worker gthread (stream SSE attivi)
+os.environ.setdefault('SERVER_WORKER', 'gthread')
+
 from app import create_app
 app = create_app()
 if __name__ == '__main__':
@@ -0,0 +1,100 @@
+"""Reaper in background dei blocchi scaduti.
+
+Un thread per processo, ma solo il worker che ottiene il lock esclusivo sul file
+(accanto al DB SQLite) elimina i blocchi: dorme fino alla prossima scadenza
+(al massimo REAPER_INTERVALLO_MAX_SECONDI) e poi esegue la DELETE con relativo
+incremento di versione. Le letture ignorano già i blocchi scaduti, quindi non
+devono più aprire transazioni in scrittura.
+"""
+import os
+import threading
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: un solo processo di sviluppo, sempre leader
+    fcntl = None
+
+from sqlalchemy import func
+from app import db
+
+
+class ReaperBlocchi:
+    def __init__(self, app, percorso_lock=None, intervallo_max=30):
+        self.app = app
+        self.percorso_lock = percorso_lock
+        self.intervallo_max = intervallo_max
+        self._file_lock = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def leader(self):
+        return self._file_lock is not None
+
+    def prova_leader(self):
+        """Tenta di diventare il reaper unico tra i processi (lock non bloccante)."""
+        if self.leader:
+            return True
+        if fcntl is None or not self.percorso_lock:
+            self._file_lock = True
+            return True
+        f = open(self.percorso_lock, 'a')
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._file_lock = f
+        return True
+
+    def esegui(self):
+        """Elimina i blocchi scaduti e ritorna (numero eliminati, secondi alla prossima scadenza)."""
+        from models import Blocco
+        from routes import _pulisci_blocchi_scaduti
+        with self.app.app_context():
+            try:
+                eliminati = _pulisci_blocchi_scaduti()
+                prossima = db.session.query(func.min(Blocco.scadenza)).scalar()
+            finally:
+                db.session.remove()
+        attesa = self.intervallo_max
+        if prossima is not None:
+            attesa = min(attesa, max(0.0, (prossima - datetime.utcnow()).total_seconds()) + 0.05)
+        return eliminati, attesa
+
+    def _ciclo(self):
+        while not self._stop.is_set():
+            if not self.prova_leader():
+                self._stop.wait(self.intervallo_max)
+                continue
+            try:
+                _, attesa = self.esegui()
+            except Exception:
+                self.app.logger.exception('Reaper blocchi: errore durante la pulizia')
+                attesa = self.intervallo_max
+            self._stop.wait(attesa)
+
+    def avvia(self):
+        self._thread = threading.Thread(target=self._ciclo, name='reaper-blocchi', daemon=True)
+        self._thread.start()
+
+    def ferma(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if self._file_lock not in (None, True):
+            self._file_lock.close()
+        self._file_lock = None
+
+
+def avvia_reaper(app):
+    """Avvia il reaper per l'app (solo con DB su file: serve un percorso per il lock condiviso)."""
+    percorso_db = db.engine.url.database
+    if not percorso_db or percorso_db == ':memory:':
+        return None
+    percorso_lock = app.config.get('REAPER_LOCK_FILE') or f'{os.path.abspath(percorso_db)}.reaper.lock'
+    reaper = ReaperBlocchi(app, percorso_lock, app.config.get('REAPER_INTERVALLO_MAX_SECONDI', 30))
+    app.extensions['teatro_reaper'] = reaper
+    reaper.avvia()
+    return reaper
@@ -0,0 +1,285 @@
+"""Scrittore unico dei posti (SCRITTORE=1): blocchi, rinnovi, rilasci e prenotazioni applicati
+da un solo thread, in un solo processo, a lotti con un commit per lotto.
+
+Con più worker gunicorn ogni scrittura prende il lock di SQLite per conto suo: all'apertura
+delle vendite le transazioni si accodano su BEGIN IMMEDIATE fino al busy_timeout e poi
+falliscono con "database is locked". Con lo scrittore:
+
+- il processo che ottiene il lock esclusivo sul file <db>.scrittore.lock (come il reaper)
+  avvia il thread scrittore e accetta comandi su un socket Unix (<db>.scrittore.sock,
+  autenticato con una chiave derivata da SECRET_KEY);
+- le route eseguono nella richiesta le sole letture di verifica e inviano il comando
+  (COMANDI_SCRITTURA in routes.py) alla coda locale o, dagli altri worker, al socket;
+- il thread preleva fino a SCRITTORE_LOTTO_MAX comandi, li esegue in un'unica transazione
+  (BEGIN IMMEDIATE, un SAVEPOINT per comando) e fa un solo commit, poi risponde a ciascuno.
+
+Il lock di scrittura ha così un solo utente (oltre a reaper e admin) e un commit copre
+tutte le richieste arrivate nel frattempo. Un comando non ancora avviato entro
+SCRITTORE_ATTESA_MAX_SECONDI viene scartato e la richiesta riceve 503. Se lo scrittore non
+è raggiungibile (processo terminato, nuovo scrittore non ancora eletto) la richiesta esegue
+il comando da sé, come senza SCRITTORE.
+"""
+import hashlib
+import os
+import queue
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+try:
+    import fcntl
+except ImportError:  # Windows: un solo processo di sviluppo, sempre scrittore
+    fcntl = None
+
+from flask import current_app, g
+from sqlalchemy import text
+
+from app import db
+
+OCCUPATO = ({'error': 'Server occupato: riprova tra qualche secondo.'}, 503)
+
+
+class ScritturaAnnullata(Exception):
+    """Sollevata da un comando per annullarne le modifiche e rispondere con (corpo, stato)."""
+
+    def __init__(self, corpo, stato):
+        super().__init__(corpo.get('error'))
+        self.risultato = (corpo, stato)
+
+
+def applica(tipo, dati):
+    """Esegue il comando nella transazione della richiesta e la conferma. Ritorna (corpo, stato)."""
+    from routes import COMANDI_SCRITTURA
+    try:
+        risultato = COMANDI_SCRITTURA[tipo](**dati)
+        db.session.commit()
+        return risultato
+    except ScritturaAnnullata as e:
+        db.session.rollback()
+        return e.risultato
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception('Scrittura %s non riuscita', tipo)
+        return {'error': str(e)}, 500
+
+
+class Comando:
+    __slots__ = ('tipo', 'evento_id', 'dati', 'risultato', 'avviato', 'annullato', 'fatto')
+
+    def __init__(self, tipo, evento_id, dati):
+        self.tipo = tipo
+        self.evento_id = evento_id
+        self.dati = dati
+        self.risultato = None
+        self.avviato = False
+        self.annullato = False
+        self.fatto = threading.Event()
+
+
+class Scrittore:
+    def __init__(self, app, percorso_lock=None, percorso_socket=None, lotto_max=64, attesa_max=10):
+        self.app = app
+        self.percorso_lock = percorso_lock
+        self.percorso_socket = percorso_socket
+        self.lotto_max = lotto_max
+        self.attesa_max = attesa_max
+        self._coda = queue.Queue()
+        self._lock = threading.Lock()
+        self._file_lock = None
+        self._listener = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._locale = threading.local()
+        self._chiave = hashlib.sha256(f"{app.config['SECRET_KEY']}\0teatro-scrittore".encode()).digest()
+
+    @property
+    def leader(self):
+        return self._file_lock is not None
+
+    def prova_leader(self):
+        """Tenta di diventare lo scrittore unico tra i processi (lock non bloccante) e avvia il thread."""
+        with self._lock:
+            if self.leader:
+                return True
+            if fcntl is not None and self.percorso_lock:
+                f = open(self.percorso_lock, 'a')
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    f.close()
+                    return False
+                self._file_lock = f
+            else:
+                self._file_lock = True
+            self._thread = threading.Thread(target=self._ciclo, name='scrittore', daemon=True)
+            self._thread.start()
+            if self.percorso_socket:
+                if os.path.exists(self.percorso_socket):
+                    os.unlink(self.percorso_socket)  # lasciato da uno scrittore terminato
+                self._listener = Listener(self.percorso_socket, 'AF_UNIX', authkey=self._chiave)
+                threading.Thread(target=self._accetta, name='scrittore-socket', daemon=True).start()
+            return True
+
+    # --- Processo scrittore ---
+
+    def _ciclo(self):
+        while not self._stop.is_set():
+            try:
+                lotto = [self._coda.get(timeout=1)]
+            except queue.Empty:
+                continue
+            while len(lotto) < self.lotto_max:
+                try:
+                    lotto.append(self._coda.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.esegui_lotto(lotto)
+            except Exception:
+                self.app.logger.exception('Scrittore: lotto non eseguito')
+                for comando in lotto:
+                    if not comando.fatto.is_set():
+                        comando.risultato = ({'error': 'Errore interno'}, 500)
+                        comando.fatto.set()
+
+    def esegui_lotto(self, lotto):
+        """Esegue i comandi in un'unica transazione con un solo commit e ne imposta i risultati."""
+        from metriche import metriche_app
+        from routes import COMANDI_SCRITTURA
+        with self._lock:
+            lotto = [c for c in lotto if not c.annullato]
+            for comando in lotto:
+                comando.avviato = True
+        if not lotto:
+            return
+        with self.app.app_context():
+            g.scrittura_in_lotto = True
+            try:
+                if db.session.get_bind().dialect.name == 'sqlite':
+                    db.session.execute(text('BEGIN IMMEDIATE'))
+                for comando in lotto:
+                    g.evento_id = comando.evento_id
+                    try:
+                        with db.session.begin_nested():
+                            comando.risultato = COMANDI_SCRITTURA[comando.tipo](**comando.dati)
+                    except ScritturaAnnullata as e:
+                        comando.risultato = e.risultato
+                    except Exception as e:
+                        self.app.logger.exception('Scrittura %s non riuscita', comando.tipo)
+                        comando.risultato = ({'error': str(e)}, 500)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.exception('Scrittore: commit del lotto non riuscito')
+                for comando in lotto:
+                    comando.risultato = ({'error': str(e)}, 500)
+            finally:
+                db.session.remove()
+            metriche = metriche_app(self.app)
+            if metriche is not None:
+                metriche.osserva_lotto_scrittore(len(lotto))
+        for comando in lotto:
+            comando.fatto.set()
+
+    def _attendi(self, comando):
+        self._coda.put(comando)
+        if not comando.fatto.wait(self.attesa_max):
+            with self._lock:
+                if not comando.avviato:
+                    comando.annullato = True
+                    return None
+            comando.fatto.wait()
+        return comando.risultato
+
+    def _accetta(self):
+        while not self._stop.is_set():
+            try:
+                conn = self._listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                if self._stop.is_set():
+                    break
+                continue  # handshake fallito (chiave errata, client chiuso)
+            threading.Thread(target=self._servi, args=(conn,), name='scrittore-connessione', daemon=True).start()
+
+    def _servi(self, conn):
+        """Comandi di un altro worker sulla stessa connessione, uno alla volta."""
+        with conn:
+            while True:
+                try:
+                    tipo, evento_id, dati = conn.recv()
+                except (EOFError, OSError):
+                    return
+                risultato = self._attendi(Comando(tipo, evento_id, dati))
+                try:
+                    conn.send(risultato)
+                except OSError:
+                    return
+
+    # --- Invio dei comandi ---
+
+    def invia(self, tipo, evento_id, dati):
+        """(corpo, stato) del comando applicato dallo scrittore; None se non raggiungibile."""
+        if self.leader:
+            risultato = self._attendi(Comando(tipo, evento_id, dati))
+        else:
+            conn = getattr(self._locale, 'conn', None)
+            if conn is None:
+                try:
+                    conn = self._locale.conn = Client(self.percorso_socket, 'AF_UNIX', authkey=self._chiave)
+                except (OSError, EOFError, AuthenticationError):
+                    # Nessuno scrittore in ascolto: prova a diventarlo, altrimenti la richiesta scrive da sé
+                    return self.invia(tipo, evento_id, dati) if self.prova_leader() else None
+            try:
+                conn.send((tipo, evento_id, dati))
+                if not conn.poll(self.attesa_max + 5):
+                    raise EOFError
+                risultato = conn.recv()
+            except (OSError, EOFError):
+                # Comando inviato ma senza risposta: l'esito non è noto, la connessione non è più utilizzabile
+                self._locale.conn = None
+                conn.close()
+                return {'error': 'Scrittura non confermata: ricarica la pagina e verifica.'}, 503
+        if risultato is None:
+            from metriche import incrementa
+            incrementa('scrittore_scaduti')
+            return OCCUPATO
+        return risultato
+
+    def ferma(self):
+        self._stop.set()
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if self._file_lock not in (None, True):
+            self._file_lock.close()
+        self._file_lock = None
+
+
+def esegui(tipo, evento_id, dati):
+    """Applica un comando di COMANDI_SCRITTURA: tramite lo scrittore unico se attivo, altrimenti nella richiesta."""
+    scrittore = current_app.extensions.get('teatro_scrittore')
+    db.session.rollback()  # nessuna connessione trattenuta dalla richiesta durante l'attesa
+    risultato = scrittore.invia(tipo, evento_id, dati) if scrittore is not None else None
+    if risultato is None:
+        if scrittore is not None:
+            from metriche import incrementa
+            incrementa('scrittore_diretti')
+        risultato = applica(tipo, dati)
+    return risultato
+
+
+def avvia_scrittore(app):
+    """Crea lo scrittore del processo e tenta di diventare quello unico (con DB in memoria: sempre)."""
+    percorso_db = db.engine.url.database
+    percorso_lock = percorso_socket = None
+    if percorso_db and percorso_db != ':memory:':
+        base = os.path.abspath(percorso_db)
+        percorso_lock = app.config.get('SCRITTORE_LOCK_FILE') or f'{base}.scrittore.lock'
+        percorso_socket = app.config.get('SCRITTORE_SOCKET') or f'{base}.scrittore.sock'
+    scrittore = Scrittore(app, percorso_lock, percorso_socket,
+                          app.config.get('SCRITTORE_LOTTO_MAX', 64), app.config.get('SCRITTORE_ATTESA_MAX_SECONDI', 10))
+    app.extensions['teatro_scrittore'] = scrittore
+    scrittore.prova_leader()
+    return scrittore
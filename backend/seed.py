@@ -1,23 +1,19 @@
-"""Crea posti di esempio se la tabella è vuota. Usa Impostazioni se presenti."""
+"""Crea posti di esempio per l'evento predefinito se non ne ha. Usa Impostazioni se presenti."""
 from app import db
-from models import Posto, Impostazioni
+from models import Posto
 
 def init_seats_if_empty():
-    if Posto.query.first() is not None:
+    if Posto.query.filter_by(evento_id=1).first() is not None:
         return
-    imp = Impostazioni.query.get(1)
-    if imp and imp.numero_file and imp.numero_file >= 1 and imp.posti_per_fila and imp.posti_per_fila >= 1:
-        import string
-        letters = string.ascii_uppercase[: imp.numero_file]
-        for letter in letters:
-            for n in range(1, imp.posti_per_fila + 1):
-                db.session.add(Posto(fila=letter, numero=n, disponibile=True, riservato_staff=False))
+    from layout import genera_posti, layout_rettangolare
+    from impostazioni import impostazioni_correnti
+    imp = impostazioni_correnti()['impostazioni']
+    if imp['numero_file'] and imp['numero_file'] >= 1 and imp['posti_per_fila'] and imp['posti_per_fila'] >= 1:
+        genera_posti(layout_rettangolare(imp['numero_file'], imp['posti_per_fila']), 1, imp['gruppi_file'])
         db.session.commit()
         return
     # Default: teatro medio ~15 file, 8-12 posti per fila
     import random
-    for i, letter in enumerate('ABCDEFGHIJKLMNO'):
-        num_seats = random.randint(8, 12)
-        for n in range(1, num_seats + 1):
-            db.session.add(Posto(fila=letter, numero=n, disponibile=True, riservato_staff=False))
+    definizione = {'file': [{'fila': letter, 'posti': random.randint(8, 12)} for letter in 'ABCDEFGHIJKLMNO']}
+    genera_posti(definizione, 1)
     db.session.commit()
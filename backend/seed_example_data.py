@@ -2,13 +2,13 @@
 Inserisce valori di esempio nel DB: impostazioni, posti (se vuoto), prenotazioni.
 Eseguire dalla cartella backend con: python seed_example_data.py
 """
-import random
 import string
 from datetime import datetime, timedelta, timezone
 
 def run():
     from app import create_app, db
     from models import Impostazioni, Posto, Prenotazione, CodicePrenotazione
+    from codici import nuovo_codice
 
     app = create_app()
     with app.app_context():
@@ -31,7 +31,7 @@ def run():
         print('Impostazioni aggiornate (Teatro Verdi, Saggio di fine anno).')
 
         # 2) Posti (solo se tabella vuota)
-        if db.session.query(Posto).first() is None:
+        if db.session.query(Posto).filter_by(evento_id=1).first() is None:
             letters = string.ascii_uppercase[: imp.numero_file]
             for letter in letters:
                 for n in range(1, imp.posti_per_fila + 1):
@@ -42,11 +42,11 @@ def run():
             print('Tabella posti già presente, skip.')
 
         # 3) Prenotazioni di esempio (solo se non ci sono già prenotazioni)
-        if db.session.query(Prenotazione).filter_by(stato='confermata').count() > 0:
+        if db.session.query(Prenotazione).filter_by(evento_id=1, stato='confermata').count() > 0:
             print('Esistono già prenotazioni, skip inserimento esempio.')
             return
 
-        posti = db.session.query(Posto).order_by(Posto.fila, Posto.numero).all()
+        posti = db.session.query(Posto).filter_by(evento_id=1).order_by(Posto.fila, Posto.numero).all()
         if len(posti) < 5:
             print('Posti insufficienti per creare prenotazioni di esempio.')
             return
@@ -74,12 +74,8 @@ def run():
                 )
                 db.session.add(pren)
             # Codice prenotazione 6 cifre per questa email
-            if db.session.query(CodicePrenotazione).filter_by(email=e['email'].lower()).first() is None:
-                for _ in range(20):
-                    codice = str(random.randint(100000, 999999))
-                    if db.session.query(CodicePrenotazione).filter_by(codice=codice).first() is None:
-                        db.session.add(CodicePrenotazione(email=e['email'].lower(), codice=codice))
-                        break
+            if db.session.query(CodicePrenotazione).filter_by(evento_id=1, email=e['email'].lower()).first() is None:
+                nuovo_codice(1, e['email'].lower())
 
         db.session.commit()
         print('Inserite 7 prenotazioni di esempio (Maria, Luigi, Anna, Paolo).')
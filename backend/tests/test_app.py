@@ -0,0 +1,162 @@
+"""Test configurazione app: profilo SQLite, pool di connessioni e limiti per tipo di worker."""
+import os
+import runpy
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import text
+
+import config
+from app import create_app, db
+
+
+def _pragma(app, nome):
+    with app.app_context():
+        return db.session.execute(text(f'PRAGMA {nome}')).scalar()
+
+
+def test_profilo_produzione_in_memoria(app):
+    assert _pragma(app, 'busy_timeout') == 5000
+    assert _pragma(app, 'synchronous') == 1  # NORMAL
+
+
+def test_profilo_produzione_su_file(monkeypatch, tmp_path):
+    monkeypatch.setattr(config.Config, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'teatro.db'}")
+    app = create_app()
+    assert _pragma(app, 'journal_mode') == 'wal'
+    assert _pragma(app, 'busy_timeout') == 5000
+    with app.app_context():
+        assert db.engine.pool.size() == config.Config.SQLITE_POOL_SIZE
+
+
+def test_profilo_predefinito_su_file(monkeypatch, tmp_path):
+    monkeypatch.setattr(config.Config, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'teatro.db'}")
+    monkeypatch.setattr(config.Config, 'SQLITE_PROFILO', 'predefinito')
+    app = create_app()
+    assert _pragma(app, 'journal_mode') == 'delete'
+    assert _pragma(app, 'synchronous') == 2  # FULL
+
+
+def test_busy_timeout_da_config(monkeypatch):
+    monkeypatch.setattr(config.Config, 'SQLITE_BUSY_TIMEOUT_MS', 1234)
+    assert _pragma(create_app(), 'busy_timeout') == 1234
+
+
+def test_profilo_sconosciuto(monkeypatch):
+    monkeypatch.setattr(config.Config, 'SQLITE_PROFILO', 'turbo')
+    with pytest.raises(ValueError):
+        create_app()
+
+
+
+@pytest.mark.parametrize('modulo, attesi', [
+    ('gunicorn.workers.gthread', (6, 10)),
+    ('gunicorn.workers.ggevent', (400, 50)),
+    ('gunicorn.workers.sync', (0, 10)),
+    ('uvicorn.workers', (0, 10)),  # worker sconosciuto: solo polling
+])
+def test_limiti_dal_worker_effettivo(monkeypatch, modulo, attesi):
+    """Stream SSE e overflow del pool seguono la classe del worker avviato da gunicorn (post_fork),
+    non SERVER_MODALITA, che -k da riga di comando può contraddire."""
+    for nome in ('SERVER_WORKER', 'SERVER_THREADS', 'SERVER_CONNESSIONI'):
+        monkeypatch.setenv(nome, '')  # ripristinate a fine test
+    monkeypatch.setattr(config.Config, 'SERVER_MODALITA', 'gthread')
+    conf = runpy.run_path(os.path.join(config.Config.BASE_DIR, 'gunicorn.conf.py'))
+    server = SimpleNamespace(cfg=SimpleNamespace(threads=8, worker_connections=500))
+    conf['post_fork'](server, type('Worker', (), {'__module__': modulo})())
+    app = create_app()
+    assert (app.config['SSE_STREAM_MAX'], app.config['SQLITE_POOL_MAX_OVERFLOW']) == attesi
+
+
+def test_limiti_espliciti_hanno_la_precedenza(monkeypatch):
+    monkeypatch.setenv('SERVER_WORKER', 'sync')
+    monkeypatch.setattr(config.Config, 'SSE_STREAM_MAX', 3)
+    assert create_app().config['SSE_STREAM_MAX'] == 3
+
+
+def test_fts_tra_worker_concorrenti(monkeypatch, tmp_path):
+    """Più worker che configurano insieme l'indice full-text: uno solo lo crea e lo popola,
+    gli altri lo trovano pronto (nessun errore "already exists" né secondo 'rebuild')."""
+    import threading
+    import time
+    from sqlalchemy import event
+    from app import _configura_fts_prenotazioni
+    monkeypatch.setattr(config.Config, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'teatro.db'}")
+    apps = [create_app() for _ in range(4)]
+    with apps[0].app_context():
+        db.session.execute(text('DROP TABLE prenotazioni_fts'))
+        db.session.commit()
+    esiti, rebuild = [], []
+    barriera = threading.Barrier(len(apps))
+
+    def worker(app):
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute',
+                         lambda conn, cur, sql, *a: rebuild.append(1) if "'rebuild'" in sql else None)
+            # Allarga la finestra tra il controllo in sqlite_master e la creazione
+            event.listen(db.engine, 'after_cursor_execute',
+                         lambda conn, cur, sql, *a: time.sleep(0.05) if 'sqlite_master' in sql else None)
+            barriera.wait()
+            esiti.append(_configura_fts_prenotazioni(app))
+            db.session.remove()
+
+    threads = [threading.Thread(target=worker, args=(app,)) for app in apps]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert esiti == [True] * len(apps) and len(rebuild) == 1
+
+
+# DB creato da una versione precedente (senza eventi né indici), con una prenotazione confermata
+_DB_VECCHIO = '''
+    CREATE TABLE posti (id INTEGER PRIMARY KEY, fila VARCHAR(10) NOT NULL, numero INTEGER NOT NULL,
+                        disponibile BOOLEAN NOT NULL DEFAULT 1, riservato_staff BOOLEAN NOT NULL DEFAULT 0);
+    CREATE TABLE prenotazioni (id INTEGER PRIMARY KEY, posto_id INTEGER NOT NULL, nome VARCHAR(120) NOT NULL,
+                               nome_allieva VARCHAR(120), email VARCHAR(120) NOT NULL, timestamp DATETIME,
+                               stato VARCHAR(20) NOT NULL);
+    CREATE TABLE blocchi (id INTEGER PRIMARY KEY, posto_id INTEGER NOT NULL UNIQUE, session_id VARCHAR(64) NOT NULL,
+                          scadenza DATETIME NOT NULL);
+    CREATE TABLE codici_prenotazione (id INTEGER PRIMARY KEY, email VARCHAR(120) NOT NULL,
+                                      codice VARCHAR(6) NOT NULL UNIQUE);
+    CREATE UNIQUE INDEX ix_codici_prenotazione_email ON codici_prenotazione (email);
+    INSERT INTO posti (id, fila, numero) VALUES (1, 'A', 1);
+    INSERT INTO prenotazioni (posto_id, nome, email, stato) VALUES (1, 'Mario', 'mario@test.it', 'confermata');
+'''
+
+
+def test_migrazione_crea_indici_su_db_esistente(monkeypatch, tmp_path):
+    """Su un DB creato prima degli indici, create_app aggiunge quelli mancanti."""
+    import sqlite3
+    percorso = tmp_path / 'vecchio.db'
+    conn = sqlite3.connect(percorso)
+    conn.executescript(_DB_VECCHIO)
+    conn.close()
+    monkeypatch.setattr(config.Config, 'SQLALCHEMY_DATABASE_URI', f'sqlite:///{percorso}')
+    app = create_app()
+    with app.app_context():
+        indici = {r[1] for r in db.session.execute(text('PRAGMA index_list(prenotazioni)'))}
+        indici |= {r[1] for r in db.session.execute(text('PRAGMA index_list(blocchi)'))}
+        indici_codici = {r[1] for r in db.session.execute(text('PRAGMA index_list(codici_prenotazione)'))}
+        eventi_prenotazioni = [r[0] for r in db.session.execute(text('SELECT evento_id FROM prenotazioni'))]
+    # Le righe esistenti passano all'evento 1; il codice è unico per (evento, email)
+    assert eventi_prenotazioni == [1]
+    assert 'uq_codici_evento_email' in indici_codici and 'ix_codici_prenotazione_email' not in indici_codici
+    assert {
+        'ix_prenotazioni_posto_stato', 'ix_prenotazioni_evento_email_stato',
+        'ix_prenotazioni_evento_stato_timestamp', 'uq_prenotazioni_posto_confermata',
+        'ix_blocchi_session_posto', 'ix_blocchi_scadenza', 'ix_blocchi_evento_scadenza',
+    } <= indici
+
+
+def test_avvio_fallisce_senza_indice_prenotazione_unica(monkeypatch, tmp_path):
+    """Con prenotazioni confermate doppie l'indice unico non si crea: l'app non parte invece di
+    accettare altre doppie prenotazioni."""
+    import sqlite3
+    percorso = tmp_path / 'doppie.db'
+    conn = sqlite3.connect(percorso)
+    conn.executescript(_DB_VECCHIO + "INSERT INTO prenotazioni (posto_id, nome, email, stato) VALUES (1, 'Ada', 'ada@test.it', 'confermata');")
+    conn.close()
+    monkeypatch.setattr(config.Config, 'SQLALCHEMY_DATABASE_URI', f'sqlite:///{percorso}')
+    with pytest.raises(RuntimeError, match='uq_prenotazioni_posto_confermata'):
+        create_app()
@@ -0,0 +1,93 @@
+"""Test sala d'attesa (attesa.py): numeri della coda, ritmo di ammissione e token di ammissione."""
+import attesa
+from attesa import ArchivioCodaSQLite
+
+ADMIN = {'X-Admin-Password': 'admin123'}
+
+
+def _attiva(app):
+    # Nessun posto conta: due ammissioni al minuto, quindi i primi due numeri entrano subito
+    app.config.update({'SALA_ATTESA': True, 'SALA_ATTESA_PER_POSTO': 0, 'SALA_ATTESA_MINIMO_AL_MINUTO': 2})
+
+
+def _entra(client, session_id):
+    token = client.post('/api/coda').get_json()['token']
+    return token, client.post('/api/coda/ammissione', json={'token': token, 'session_id': session_id})
+
+
+def _apri(client, **corpo):
+    return client.put('/api/admin/coda', json=corpo, headers=ADMIN)
+
+
+def test_sala_disattivata(client):
+    assert client.get('/api/coda/stato').get_json() == {'attiva': False}
+    posto = client.get('/api/posti').get_json()[0]['id']
+    assert client.post('/api/blocchi', json={'session_id': 's', 'posto_ids': [posto]}).status_code == 200
+
+
+def test_ammissione_a_ritmo_costante(app, client, monkeypatch):
+    _attiva(app)
+    ora = [1000.0]
+    monkeypatch.setattr(attesa.time, 'time', lambda: ora[0])
+    assert _apri(client).get_json()['apertura'] == 1000.0
+    assert _entra(client, 'a')[1].status_code == 200
+    assert _entra(client, 'b')[1].status_code == 200
+    token, r = _entra(client, 'c')
+    assert r.status_code == 409
+    assert r.get_json()['posizione'] == 1 and r.headers['Retry-After'] == '30'
+    stato = client.get('/api/coda/stato')
+    assert stato.get_json() == {'attiva': True, 'apertura': 1000.0, 'ammessi_fino_a': 2, 'al_minuto': 2}
+    assert 'public' in stato.headers['Cache-Control']
+    ora[0] += 30
+    assert client.post('/api/coda/ammissione', json={'token': token, 'session_id': 'c'}).status_code == 200
+    assert client.get('/api/coda/stato').get_json()['ammessi_fino_a'] == 3
+
+
+def test_numeri_presi_prima_dell_apertura(app, client, monkeypatch):
+    """Chi arriva ore prima non fa partire il ritmo: all'apertura entrano solo i primi al_minuto numeri."""
+    _attiva(app)
+    ora = [1000.0]
+    monkeypatch.setattr(attesa.time, 'time', lambda: ora[0])
+    token, r = _entra(client, 'presto')
+    assert r.status_code == 409 and client.get('/api/coda/stato').get_json()['ammessi_fino_a'] == 0
+    altri = [_entra(client, s)[0] for s in ('b', 'c')]
+    assert _apri(client, apertura='1970-01-01T03:00:00+00:00').status_code == 200  # 10800, tra quasi 3 ore
+    r = client.post('/api/coda/ammissione', json={'token': token, 'session_id': 'presto'})
+    assert r.status_code == 409 and int(r.headers['Retry-After']) == 9800
+    ora[0] = 10800.0
+    assert client.post('/api/coda/ammissione', json={'token': token, 'session_id': 'presto'}).status_code == 200
+    assert client.post('/api/coda/ammissione', json={'token': altri[0], 'session_id': 'b'}).status_code == 200
+    assert client.post('/api/coda/ammissione', json={'token': altri[1], 'session_id': 'c'}).status_code == 409
+    assert _apri(client, apertura=None).get_json()['ammessi_fino_a'] == 0
+    assert client.put('/api/admin/coda', json={}).status_code == 401
+
+
+def test_scritture_richiedono_ammissione(app, client):
+    _attiva(app)
+    _apri(client)
+    posto = client.get('/api/posti').get_json()[0]['id']
+    corpo = {'session_id': 'a', 'posto_ids': [posto]}
+    r = client.post('/api/blocchi', json=corpo)
+    assert r.status_code == 403 and r.get_json()['coda'] is True
+    ammissione = _entra(client, 'a')[1].get_json()['ammissione']
+    assert client.post('/api/blocchi', json=corpo, headers={'X-Ammissione': ammissione}).status_code == 200
+    # Il token è legato alla sessione e all'evento
+    altra = {'session_id': 'b', 'posto_ids': [posto]}
+    assert client.post('/api/blocchi', json=altra, headers={'X-Ammissione': ammissione}).status_code == 403
+    assert client.post('/api/blocchi', json=corpo, headers={'X-Ammissione': ammissione + 'x'}).status_code == 403
+    assert client.post('/api/coda/ammissione', json={'token': 'falso', 'session_id': 'a'}).status_code == 400
+    metriche = client.get('/api/admin/metrics', headers=ADMIN).get_data(as_text=True)
+    assert 'teatro_coda_rifiutate_total 3' in metriche
+    assert 'teatro_coda_ammissioni_total 1' in metriche
+
+
+def test_archivio_sqlite_condiviso_tra_processi(tmp_path):
+    """Due archivi sullo stesso file (come due worker) assegnano numeri consecutivi e vedono la stessa apertura."""
+    percorso = str(tmp_path / 'db.coda')
+    primo, secondo = ArchivioCodaSQLite(percorso), ArchivioCodaSQLite(percorso)
+    assert secondo.apertura(1) is None
+    assert primo.prendi_numero(1) == 1
+    assert secondo.prendi_numero(1) == 2
+    assert secondo.prendi_numero(2) == 1
+    primo.imposta_apertura(1, 100.0)
+    assert secondo.apertura(1) == 100.0 and secondo.prendi_numero(1) == 3
@@ -0,0 +1,48 @@
+"""Test login admin e token firmati (autenticazione.py)."""
+from werkzeug.security import generate_password_hash
+
+
+def _login(client, password='admin123'):
+    return client.post('/api/admin/login', json={'password': password})
+
+
+def _bearer(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_login_e_token(client):
+    assert _login(client, 'sbagliata').status_code == 401
+    r = _login(client)
+    assert r.status_code == 200
+    dati = r.get_json()
+    assert dati['scade_tra'] == 3600
+    assert r.headers['Cache-Control'] == 'no-store'
+    assert client.get('/api/admin/posti', headers=_bearer(dati['token'])).status_code == 200
+    assert client.get('/api/admin/file', headers=_bearer(dati['token'])).status_code == 200
+    assert client.get('/api/admin/posti', headers=_bearer(dati['token'] + 'x')).status_code == 401
+
+
+def test_password_non_letta_da_corpo_o_query(client):
+    """La password non è più accettata nel corpo JSON o nella query string, solo via login o header."""
+    assert client.get('/api/admin/file', query_string={'password': 'admin123'}).status_code == 401
+    assert client.put('/api/admin/file/A', json={'password': 'admin123', 'riservato_staff': True}).status_code == 401
+    assert client.get('/api/admin/file', headers={'X-Admin-Password': 'admin123'}).status_code == 200
+
+
+def test_token_scaduto_o_password_cambiata(app, client):
+    token = _login(client).get_json()['token']
+    app.config['ADMIN_TOKEN_DURATA_SECONDI'] = -1
+    assert client.get('/api/admin/posti', headers=_bearer(token)).status_code == 401
+    app.config['ADMIN_TOKEN_DURATA_SECONDI'] = 3600
+    assert client.get('/api/admin/posti', headers=_bearer(token)).status_code == 200
+    app.config['ADMIN_PASSWORD'] = 'nuova'
+    assert client.get('/api/admin/posti', headers=_bearer(token)).status_code == 401
+
+
+def test_password_solo_come_hash(app, client):
+    app.config['ADMIN_PASSWORD'] = ''
+    app.config['ADMIN_PASSWORD_HASH'] = generate_password_hash('segreta')
+    assert client.get('/api/admin/posti', headers={'X-Admin-Password': 'admin123'}).status_code == 401
+    assert _login(client, 'admin123').status_code == 401
+    token = _login(client, 'segreta').get_json()['token']
+    assert client.get('/api/admin/posti', headers=_bearer(token)).status_code == 200
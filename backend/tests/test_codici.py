@@ -0,0 +1,44 @@
+"""Test assegnazione dei codici prenotazione (codici.py)."""
+from app import db
+from codici import CODICI_TOTALI, codice_da_indice, nuovo_codice, permuta
+from models import CodicePrenotazione, ContatoreCodici
+
+
+def test_permutazione_biiettiva_su_tutto_lo_spazio():
+    chiave = bytes(range(16))
+    immagini = {permuta(chiave, n) for n in range(CODICI_TOTALI)}
+    assert len(immagini) == CODICI_TOTALI
+    assert min(immagini) == 0 and max(immagini) == CODICI_TOTALI - 1
+    # Chiavi diverse danno sequenze diverse; i primi codici non sono consecutivi
+    primi = [permuta(chiave, n) for n in range(5)]
+    assert primi != [permuta(b'x' * 16, n) for n in range(5)]
+    assert primi != sorted(primi)
+
+
+def test_codici_unici_e_collisioni_con_codici_esistenti(app):
+    with app.app_context():
+        assert nuovo_codice(1, 'a@test.it') is not None
+        chiave = bytes.fromhex(db.session.get(ContatoreCodici, 1).chiave)
+        # Codici casuali assegnati prima del contatore che coincidono con i prossimi della permutazione
+        for i, n in enumerate((1, 2)):
+            db.session.add(CodicePrenotazione(evento_id=1, email=f'vecchio{i}@test.it', codice=codice_da_indice(chiave, n)))
+        db.session.commit()
+        codice = nuovo_codice(1, 'b@test.it')
+        assert codice == codice_da_indice(chiave, 3)
+        assert db.session.get(ContatoreCodici, 1).prossimo == 4
+        codici = [c for (c,) in db.session.query(CodicePrenotazione.codice)]
+        assert len(codici) == len(set(codici)) == 4
+        assert all(len(c) == 6 and 100000 <= int(c) <= 999999 for c in codici)
+
+
+def test_codici_esauriti(app, client):
+    with app.app_context():
+        nuovo_codice(1, 'a@test.it')
+        db.session.get(ContatoreCodici, 1).prossimo = CODICI_TOTALI
+        db.session.commit()
+    posto = next(p['id'] for p in client.get('/api/posti').get_json() if p['stato'] == 'disponibile')
+    r = client.post('/api/prenotazioni', json={'nome': 'M', 'email': 'nuova@test.it', 'posto_ids': [posto]})
+    assert r.status_code == 500
+    assert r.get_json()['error'] == 'Codici prenotazione esauriti.'
+    stato = {p['id']: p['stato'] for p in client.get('/api/posti').get_json()}
+    assert stato[posto] == 'disponibile'  # prenotazione annullata insieme al codice
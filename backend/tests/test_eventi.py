@@ -0,0 +1,86 @@
+"""Test eventi: sala copiata, stato dei posti e codici separati per evento."""
+
+ADMIN = {'X-Admin-Password': 'admin123'}
+
+
+def _crea_evento(client, **dati):
+    r = client.post('/api/admin/eventi', json={'nome': 'Replica', 'data_ora': '2026-12-20T21:00', **dati}, headers=ADMIN)
+    assert r.status_code == 201
+    return r.get_json()
+
+
+def test_crea_evento_copia_sala(client):
+    """POST /api/admin/eventi copia i posti dell'evento 1 in nuovi posti dell'evento."""
+    posti_1 = client.get('/api/posti').get_json()
+    evento = _crea_evento(client)
+    assert evento['nome'] == 'Replica' and evento['data_ora'] == '2026-12-20T21:00:00'
+    assert evento['posti'] == len(posti_1)
+    posti_2 = client.get(f"/api/eventi/{evento['id']}/posti").get_json()
+    assert [(p['fila'], p['numero']) for p in posti_2] == [(p['fila'], p['numero']) for p in posti_1]
+    assert not {p['id'] for p in posti_2} & {p['id'] for p in posti_1}
+    assert [e['id'] for e in client.get('/api/eventi').get_json()] == [1, evento['id']]
+    spettacolo = client.get(f"/api/eventi/{evento['id']}/spettacolo").get_json()
+    assert spettacolo['evento_id'] == evento['id'] and spettacolo['nome_spettacolo'] == 'Replica'
+    assert client.post('/api/admin/eventi', json={}).status_code == 401
+
+
+def test_evento_inesistente(client):
+    assert client.get('/api/eventi/999/posti').status_code == 404
+
+
+def test_prenotazioni_separate_per_evento(client):
+    """Una prenotazione nell'evento 2 non cambia mappa, versione e codici dell'evento 1."""
+    evento = _crea_evento(client)
+    base = f"/api/eventi/{evento['id']}"
+    posto_1 = client.get('/api/posti').get_json()[0]['id']
+    posto_2 = client.get(f'{base}/posti').get_json()[0]['id']
+    versione_1 = int(client.get('/api/posti').headers['X-Versione-Mappa'])
+
+    r = client.post(f'{base}/prenotazioni', json={'nome': 'Mario', 'email': 'mario@test.it', 'posto_ids': [posto_2]})
+    assert r.status_code == 200
+    codice_2 = r.get_json()['codice']
+    assert client.get('/api/posti').get_json()[0]['stato'] == 'disponibile'
+    assert int(client.get('/api/posti').headers['X-Versione-Mappa']) == versione_1
+    assert client.get(f'{base}/posti').get_json()[0]['stato'] == 'occupato'
+    assert client.get('/api/prenotazioni').get_json() == []
+    assert len(client.get(f'{base}/prenotazioni').get_json()) == 1
+
+    # I posti di un altro evento non sono prenotabili né bloccabili da qui
+    r = client.post(f'{base}/prenotazioni', json={'nome': 'Mario', 'email': 'mario@test.it', 'posto_ids': [posto_1]})
+    assert r.status_code == 400 and r.get_json()['conflitti'][0]['motivo'] == 'non_trovato'
+    r = client.post(f'{base}/blocchi', json={'session_id': 's1', 'posto_ids': [posto_1]})
+    assert r.get_json()['bloccati'] == []
+
+    # Il codice vale per l'evento in cui è stato assegnato
+    r = client.post('/api/prenotazioni', json={'nome': 'Mario', 'email': 'mario@test.it', 'posto_ids': [posto_1]})
+    codice_1 = r.get_json()['codice']
+    assert r.get_json()['codice_nuovo'] and codice_1 != codice_2
+    r = client.post(f'{base}/prenotazioni/recupera', json={'email': 'mario@test.it', 'codice': codice_2})
+    assert [p['posto_id'] for p in r.get_json()['prenotazioni']] == [posto_2]
+    r = client.post(f'{base}/prenotazioni/recupera', json={'email': 'mario@test.it', 'codice': codice_1})
+    assert r.status_code == 404
+
+
+def test_modifica_evento_archivia(client):
+    evento = _crea_evento(client)
+    r = client.put(f"/api/admin/eventi/{evento['id']}", json={'attivo': False}, headers=ADMIN)
+    assert r.status_code == 200 and r.get_json()['attivo'] is False
+    assert [e['id'] for e in client.get('/api/eventi').get_json()] == [1]
+    assert len(client.get('/api/eventi', headers=ADMIN).get_json()) == 2
+
+
+def test_evento_archiviato_non_prenotabile(client):
+    """Archiviato l'evento, blocchi e prenotazioni sono rifiutati (verifica sotto il lock di scrittura)."""
+    evento = _crea_evento(client)
+    base = f"/api/eventi/{evento['id']}"
+    a, b = [p['id'] for p in client.get(f'{base}/posti').get_json()[:2]]
+    assert client.post(f'{base}/blocchi', json={'session_id': 's', 'posto_ids': [a]}).status_code == 200
+    client.put(f"/api/admin/eventi/{evento['id']}", json={'attivo': False}, headers=ADMIN)
+    r = client.post(f'{base}/blocchi', json={'session_id': 's', 'posto_ids': [b]})
+    assert r.status_code == 403 and 'archiviato' in r.get_json()['error']
+    r = client.post(f'{base}/prenotazioni', json={'nome': 'A', 'email': 'a@test.it', 'session_id': 's', 'posto_ids': [a]})
+    assert r.status_code == 403
+    assert {p['stato'] for p in client.get(f'{base}/posti').get_json()} == {'disponibile', 'bloccato'}
+    client.put(f"/api/admin/eventi/{evento['id']}", json={'attivo': True}, headers=ADMIN)
+    r = client.post(f'{base}/prenotazioni', json={'nome': 'A', 'email': 'a@test.it', 'session_id': 's', 'posto_ids': [a]})
+    assert r.status_code == 200
@@ -0,0 +1,53 @@
+"""Test cache delle impostazioni ed eventi (impostazioni.py) e Cache-Control di /api/spettacolo."""
+from sqlalchemy import text
+
+from app import db
+
+ADMIN = {'X-Admin-Password': 'admin123'}
+
+
+def test_spettacolo_cacheabile_con_etag(client, conta_query):
+    r = client.get('/api/spettacolo')
+    assert r.status_code == 200
+    assert r.headers['Cache-Control'] == 'public, max-age=30, stale-while-revalidate=300'
+    etag = r.headers['ETag']
+    with conta_query() as q:
+        r = client.get('/api/spettacolo', headers={'If-None-Match': etag})
+    assert r.status_code == 304
+    assert q.numero == 1, q  # solo la versione delle impostazioni
+    with conta_query() as q:
+        assert client.get('/api/admin/impostazioni', headers=ADMIN).status_code == 200
+        assert client.get('/api/eventi').status_code == 200
+    assert q.numero == 2, q
+
+
+def test_modifiche_admin_invalidano_la_cache(client):
+    prima = client.get('/api/spettacolo')
+    r = client.put('/api/admin/impostazioni', headers=ADMIN, json={
+        'nome_teatro': 'Teatro Verdi', 'gruppi_file': [{'lettere': 'A-C', 'nome': 'Platea'}]})
+    assert r.status_code == 200
+    dopo = client.get('/api/spettacolo', headers={'If-None-Match': prima.headers['ETag']})
+    assert dopo.status_code == 200
+    assert dopo.get_json()['nome_teatro'] == 'Teatro Verdi'
+    assert dopo.get_json()['gruppi_file'] == [{'lettere': 'A-C', 'nome': 'Platea'}]
+    assert client.get('/api/admin/impostazioni', headers=ADMIN).get_json()['nome_teatro'] == 'Teatro Verdi'
+
+    r = client.put('/api/admin/eventi/1', headers=ADMIN, json={'nome': 'Prima', 'attivo': False})
+    assert r.status_code == 200
+    assert client.get('/api/spettacolo').get_json()['nome_spettacolo'] == 'Prima'
+    assert client.get('/api/eventi').get_json() == []
+    assert [e['nome'] for e in client.get('/api/eventi', headers=ADMIN).get_json()] == ['Prima']
+
+
+def test_versione_in_db_invalida_gli_altri_worker(app, client):
+    """Una modifica fatta da un altro processo è vista solo quando cambia la versione in DB."""
+    client.put('/api/admin/impostazioni', headers=ADMIN, json={'nome_teatro': 'Verdi'})
+    assert client.get('/api/spettacolo').get_json()['nome_teatro'] == 'Verdi'
+    with app.app_context():
+        db.session.execute(text("UPDATE impostazioni SET nome_teatro = 'Altro' WHERE id = 1"))
+        db.session.commit()
+    assert client.get('/api/spettacolo').get_json()['nome_teatro'] == 'Verdi'
+    with app.app_context():
+        db.session.execute(text('UPDATE impostazioni SET versione = versione + 1 WHERE id = 1'))
+        db.session.commit()
+    assert client.get('/api/spettacolo').get_json()['nome_teatro'] == 'Altro'
@@ -0,0 +1,95 @@
+"""Test layout sala: validazione, generazione in blocco, import/export JSON."""
+import pytest
+
+ADMIN = {'X-Admin-Password': 'admin123'}
+
+LAYOUT = {
+    'nome': 'Sala piccola',
+    'file': [
+        {'fila': 'A', 'posti': 6, 'corridoi': [3], 'non_disponibili': [1]},
+        {'fila': 'B', 'posti': 8, 'corridoi': [4], 'offset': -1},
+        {'fila': 'C', 'posti': 4, 'settore': 'Galleria', 'y': 5},
+    ],
+}
+
+
+def test_valida_layout_errori():
+    from layout import valida_layout
+    with pytest.raises(ValueError):
+        valida_layout({'file': []})
+    with pytest.raises(ValueError):
+        valida_layout({'file': [{'fila': 'A', 'posti': 3}, {'fila': 'a', 'posti': 2}]})
+    with pytest.raises(ValueError):
+        valida_layout({'file': [{'fila': 'A', 'posti': 3, 'corridoi': [4]}]})
+
+
+def test_righe_posti_coordinate_e_settori():
+    from layout import righe_posti, valida_layout
+    righe = righe_posti(valida_layout(LAYOUT), 1, [{'lettere': 'A-B', 'nome': 'Platea'}])
+    assert len(righe) == 18
+    fila_a = [r for r in righe if r['fila'] == 'A']
+    assert [r['x'] for r in fila_a] == [0, 1, 2, 4, 5, 6]
+    assert fila_a[0]['disponibile'] is False and fila_a[0]['settore'] == 'Platea'
+    fila_c = [r for r in righe if r['fila'] == 'C']
+    assert {r['settore'] for r in fila_c} == {'Galleria'} and {r['y'] for r in fila_c} == {5}
+
+
+def test_genera_posti_da_layout_e_export(client):
+    """Import del layout, rigenerazione dei posti dell'evento e export della sala attuale."""
+    r = client.post('/api/admin/layout', json=LAYOUT, headers=ADMIN)
+    assert r.status_code == 201
+    layout = r.get_json()
+    assert layout['posti'] == 18
+    r = client.post('/api/admin/impostazioni/genera-posti', json={'layout_id': layout['id']}, headers=ADMIN)
+    assert r.status_code == 200 and r.get_json()['creati'] == 18
+    posti = client.get('/api/posti').get_json()
+    assert [sum(1 for p in posti if p['fila'] == f) for f in 'ABC'] == [6, 8, 4]
+    assert posti[0]['stato'] == 'non_disponibile' and posti[0]['x'] == 0
+
+    esportato = client.get('/api/admin/posti/layout', headers=ADMIN).get_json()
+    file = {f['fila']: f for f in esportato['file']}
+    assert file['A']['corridoi'] == [3] and file['A']['non_disponibili'] == [1]
+    assert file['B']['offset'] == -1 and file['C']['y'] == 5
+
+    assert client.get(f"/api/admin/layout/{layout['id']}", headers=ADMIN).get_json()['nome'] == 'Sala piccola'
+    assert client.post('/api/admin/layout', json={'file': [{'fila': 'A', 'posti': 0}]}, headers=ADMIN).status_code == 400
+
+
+
+@pytest.mark.parametrize('larghezza', [2, 0.5])
+def test_export_conserva_larghezza_corridoio(larghezza):
+    """Layout -> posti -> layout: stessa larghezza dei corridoi e stesse coordinate."""
+    from types import SimpleNamespace
+    from layout import layout_da_posti, righe_posti, valida_layout
+    definizione = valida_layout({**LAYOUT, 'larghezza_corridoio': larghezza})
+    righe = righe_posti(definizione, 1)
+    esportato = layout_da_posti([SimpleNamespace(**r) for r in righe], 'Sala piccola')
+    assert esportato['larghezza_corridoio'] == larghezza
+    assert {f['fila']: f.get('corridoi') for f in esportato['file']} == {'A': [3], 'B': [4], 'C': None}
+    assert righe_posti(valida_layout(esportato), 1) == righe
+
+
+def test_genera_posti_fallito_non_svuota_la_sala(client, monkeypatch):
+    """Se l'INSERT dei nuovi posti fallisce, posti e versione dell'evento restano quelli di prima."""
+    import layout
+    r = client.get('/api/posti')
+    prima, versione = r.get_json(), r.headers['X-Versione-Mappa']
+
+    def rotto(definizione, evento_id, gruppi_file=None):
+        raise RuntimeError('vincolo violato')
+
+    monkeypatch.setattr(layout, 'genera_posti', rotto)
+    r = client.post('/api/admin/impostazioni/genera-posti', json={'layout': LAYOUT}, headers=ADMIN)
+    assert r.status_code == 500
+    r = client.get('/api/posti')
+    assert r.get_json() == prima and r.headers['X-Versione-Mappa'] == versione
+    monkeypatch.undo()
+    assert client.post('/api/admin/impostazioni/genera-posti', json={'layout': LAYOUT}, headers=ADMIN).get_json()['creati'] == 18
+    assert int(client.get('/api/posti').headers['X-Versione-Mappa']) == int(versione) + 1  # un solo 'rigenerato'
+
+def test_evento_da_layout_grande(client):
+    """Un evento da 2000 posti è creato dal layout con un solo INSERT."""
+    grande = {'file': [{'fila': f'R{i}', 'posti': 50} for i in range(40)]}
+    r = client.post('/api/admin/eventi', json={'nome': 'Grande', 'layout': grande}, headers=ADMIN)
+    assert r.status_code == 201 and r.get_json()['posti'] == 2000
+    assert len(client.get(f"/api/eventi/{r.get_json()['id']}/posti").get_json()) == 2000
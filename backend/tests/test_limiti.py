@@ -0,0 +1,85 @@
+"""Test controllo di ammissione (limiti.py): token bucket, varco di concorrenza e 429."""
+from limiti import ArchivioSQLite, _stato
+
+ADMIN = {'X-Admin-Password': 'admin123'}
+
+
+def _attiva(app, **config):
+    app.config.update({'LIMITI': True, **config})
+
+
+def test_limite_per_sessione_e_ip(app, client):
+    _attiva(app, LIMITI_REGOLE={'blocchi': {'sessione': (0.01, 2), 'ip': (0.01, 3)}})
+    posto = client.get('/api/posti').get_json()[0]['id']
+
+    def blocca(session_id):
+        return client.post('/api/blocchi', json={'session_id': session_id, 'posto_ids': [posto]})
+
+    assert blocca('a').status_code == 200
+    assert blocca('a').status_code == 200
+    r = blocca('a')
+    assert r.status_code == 429
+    assert int(r.headers['Retry-After']) >= 1
+    assert blocca('b').status_code == 409  # altra sessione, stesso IP: resta un gettone per l'IP
+    assert blocca('c').status_code == 429
+    assert client.get('/api/posti').status_code == 200  # le letture non sono limitate
+    # Rinnovi e rilasci hanno una classe propria
+    assert client.delete('/api/blocchi', json={'session_id': 'a', 'posto_ids': [posto]}).status_code == 200
+
+
+def test_selezione_di_una_fila_con_i_limiti_predefiniti(app, client):
+    """Sequenza di App.tsx con i limiti di default: 8 posti cliccati in fretta, uno tolto e
+    sostituito, rinnovo periodico e deselezione completa; nessun 429."""
+    from config import Config
+    _attiva(app, LIMITI_REGOLE=Config.LIMITI_REGOLE)
+    fila = [p['id'] for p in client.get('/api/posti').get_json() if p['stato'] == 'disponibile'][:9]
+    sessione = {'session_id': 'famiglia'}
+    stati = []
+    selezionati = []
+    for posto in fila[:8]:
+        selezionati.append(posto)
+        stati.append(client.post('/api/blocchi', json={**sessione, 'posto_ids': selezionati}).status_code)
+    tolto = selezionati.pop(3)
+    stati.append(client.delete('/api/blocchi', json={**sessione, 'posto_ids': [tolto]}).status_code)
+    stati.append(client.post('/api/blocchi', json={**sessione, 'posto_ids': selezionati}).status_code)
+    selezionati.append(fila[8])
+    stati.append(client.post('/api/blocchi', json={**sessione, 'posto_ids': selezionati}).status_code)
+    stati.append(client.put('/api/blocchi/rinnovo', json={**sessione, 'posto_ids': selezionati}).status_code)
+    stati.append(client.delete('/api/blocchi', json={**sessione, 'posto_ids': selezionati}).status_code)
+    assert stati == [200] * len(stati)
+
+
+def test_login_limitato_per_ip(app, client):
+    _attiva(app, LIMITI_REGOLE={'login': {'ip': (0.01, 2)}})
+    for _ in range(2):
+        assert client.post('/api/admin/login', json={'password': 'x'}).status_code == 401
+    assert client.post('/api/admin/login', json={'password': 'admin123'}).status_code == 429
+    metriche = client.get('/api/admin/metrics', headers=ADMIN).get_data(as_text=True)
+    assert 'teatro_richieste_rifiutate_total{classe="login",motivo="frequenza"} 1' in metriche
+
+
+def test_varco_di_concorrenza(app, client):
+    _attiva(app, LIMITI_REGOLE={}, SCRITTURE_CONCORRENTI=1, SCRITTURE_ATTESA_MAX_SECONDI=0.05)
+    posto = client.get('/api/posti').get_json()[0]['id']
+    corpo = {'session_id': 's', 'posto_ids': [posto]}
+    with app.app_context():
+        varco = _stato(app)['varco']
+    varco.acquire()  # una scrittura in corso occupa l'unico posto
+    r = client.post('/api/blocchi', json=corpo)
+    assert r.status_code == 429 and r.headers['Retry-After'] == '1'
+    varco.release()
+    assert client.post('/api/blocchi', json=corpo).status_code == 200
+    assert client.delete('/api/blocchi', json=corpo).status_code == 200  # il varco è stato rilasciato
+    metriche = client.get('/api/admin/metrics', headers=ADMIN).get_data(as_text=True)
+    assert 'teatro_richieste_rifiutate_total{classe="blocchi",motivo="occupato"} 1' in metriche
+
+
+def test_archivio_sqlite_condiviso_tra_processi(tmp_path):
+    """Due archivi sullo stesso file (come due worker) consumano gli stessi gettoni."""
+    percorso = str(tmp_path / 'db.limiti')
+    primo, secondo = ArchivioSQLite(percorso), ArchivioSQLite(percorso)
+    assert primo.preleva('k', 1, 2, 100.0) == 0
+    assert secondo.preleva('k', 1, 2, 100.0) == 0
+    assert primo.preleva('k', 1, 2, 100.0) == 1.0
+    assert secondo.preleva('k', 1, 2, 100.5) == 0.5
+    assert primo.preleva('k', 1, 2, 101.0) == 0  # un gettone ricaricato dopo 1 s
@@ -0,0 +1,67 @@
+"""Test metriche per route/SQL e endpoint /api/admin/metrics (metriche.py)."""
+import logging
+import re
+from datetime import datetime, timedelta
+
+from app import db
+from models import Blocco
+from scadenze import ReaperBlocchi
+
+ADMIN = {'X-Admin-Password': 'admin123'}
+
+
+def _valore(testo, nome, **etichette):
+    """Valore di una serie nel testo Prometheus (etichette nell'ordine di esposizione)."""
+    sel = ','.join(f'{k}="{v}"' for k, v in etichette.items())
+    m = re.search(rf'^{re.escape(nome)}{re.escape("{" + sel + "}" if sel else "")} (\S+)$', testo, re.M)
+    return float(m.group(1)) if m else None
+
+
+def test_metrics_richiede_admin(client):
+    assert client.get('/api/admin/metrics').status_code == 401
+    r = client.get('/api/admin/metrics', headers=ADMIN)
+    assert r.status_code == 200
+    assert r.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    assert '# TYPE teatro_richieste_durata_secondi histogram' in r.get_data(as_text=True)
+
+
+def test_metrics_route_sql_e_lock(client):
+    # All'avvio l'indice full-text è configurato sotto BEGIN IMMEDIATE
+    lock_avvio = _valore(client.get('/api/admin/metrics', headers=ADMIN).get_data(as_text=True),
+                         'teatro_sqlite_attesa_lock_secondi_count')
+    posti = client.get('/api/posti').get_json()
+    client.get('/api/eventi/1/posti')
+    libero = next(p['id'] for p in posti if p['stato'] == 'disponibile')
+    r = client.post('/api/prenotazioni', json={'nome': 'Anna', 'email': 'anna@test.it', 'posto_ids': [libero]})
+    assert r.status_code == 200
+    testo = client.get('/api/admin/metrics', headers=ADMIN).get_data(as_text=True)
+
+    assert _valore(testo, 'teatro_richieste_durata_secondi_count', metodo='GET', route='/api/posti', stato=200) == 1
+    assert _valore(testo, 'teatro_richieste_durata_secondi_count',
+                   metodo='GET', route='/api/eventi/<int:evento_id>/posti', stato=200) == 1
+    # Le istruzioni SQL della richiesta sono contate: la mappa non è vuota
+    assert _valore(testo, 'teatro_richieste_sql_istruzioni_sum', metodo='GET', route='/api/posti') >= 1
+    assert _valore(testo, 'teatro_richieste_sql_istruzioni_sum', metodo='POST', route='/api/prenotazioni') >= 3
+    # La prenotazione prende il lock di scrittura con BEGIN IMMEDIATE
+    assert _valore(testo, 'teatro_sqlite_attesa_lock_secondi_count') == lock_avvio + 1
+    assert _valore(testo, 'teatro_sqlite_lock_errori_total') == 0
+
+
+def test_metrics_blocchi_scaduti(app, client):
+    posti = client.get('/api/posti').get_json()
+    libero = next(p['id'] for p in posti if p['stato'] == 'disponibile')
+    client.post('/api/blocchi', json={'session_id': 'sess-1', 'posto_ids': [libero]})
+    with app.app_context():
+        Blocco.query.update({'scadenza': datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+    assert ReaperBlocchi(app).esegui()[0] == 1
+    testo = client.get('/api/admin/metrics', headers=ADMIN).get_data(as_text=True)
+    assert _valore(testo, 'teatro_blocchi_scaduti_total') == 1
+
+
+def test_richiesta_lenta_nel_log(app, client, caplog):
+    app.config['METRICHE_RICHIESTA_LENTA_MS'] = 0.001
+    with caplog.at_level(logging.WARNING, logger=app.logger.name):
+        client.get('/api/posti')
+    messaggi = [r.getMessage() for r in caplog.records if 'Richiesta lenta' in r.getMessage()]
+    assert messaggi and 'GET /api/posti' in messaggi[0] and 'SELECT' in messaggi[0]
@@ -29,3 +29,20 @@ def test_prenotazione_to_dict():
         assert d['email'] == 'test@test.it'
         assert '2025-01-15' in (d['timestamp'] or '')
         assert d['stato'] == 'confermata'
+
+
+def test_una_sola_prenotazione_confermata_per_posto():
+    """L'indice unico parziale impedisce due prenotazioni confermate sullo stesso posto."""
+    import pytest
+    from sqlalchemy.exc import IntegrityError
+    from app import db
+
+    app = create_app()
+    with app.app_context():
+        db.session.add(Prenotazione(posto_id=1, nome='A', email='a@test.it', stato='cancellata'))
+        db.session.add(Prenotazione(posto_id=1, nome='B', email='b@test.it', stato='confermata'))
+        db.session.commit()
+        db.session.add(Prenotazione(posto_id=1, nome='C', email='c@test.it', stato='confermata'))
+        with pytest.raises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
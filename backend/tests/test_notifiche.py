@@ -0,0 +1,139 @@
+"""Test hub SSE (fan-out modifiche mappa posti) e stream /api/posti/stream."""
+import threading
+import time
+
+from notifiche import HubModifiche, evento_sse
+
+
+def test_evento_sse_formato():
+    assert evento_sse('posti', {'versione': 3}, 3) == 'id: 3\nevent: posti\ndata: {"versione":3}\n\n'
+
+
+def test_hub_timeout_senza_modifiche():
+    hub = HubModifiche(intervallo=0.01)
+    versione, payload = hub.attendi(5, 0.05, lambda: 5, lambda since: {'versione': 5})
+    assert versione == 5 and payload is None
+
+
+def test_hub_non_risveglia_stream_piu_avanti_dell_hub():
+    """Uno stream che ha già letto una versione più recente di quella dell'hub attende
+    (il timeout) invece di tornare subito con la versione vecchia."""
+    hub = HubModifiche(intervallo=0.01)
+    hub.attendi(1, 0.02, lambda: 1, lambda since: None)  # hub alla versione 1
+    inizio = time.monotonic()
+    versione, payload = hub.attendi(3, 0.05, lambda: 3, lambda since: {'versione': 3, 'posti': []})
+    assert (versione, payload) == (3, None)
+    assert time.monotonic() - inizio >= 0.04
+
+
+def test_hub_condivide_delta_tra_stream_allineati():
+    """Un solo stream interroga la versione; il delta è calcolato una volta e condiviso."""
+    hub = HubModifiche(intervallo=0.01)
+    hub.attendi(1, 0.02, lambda: 1, lambda since: None)  # allinea l'hub alla versione 1
+    versione_db = [1]
+    letture = []
+    delta_calcolati = []
+    lock = threading.Lock()
+
+    def leggi():
+        with lock:
+            letture.append(threading.get_ident())
+        return versione_db[0]
+
+    def calcola(since):
+        delta_calcolati.append(since)
+        return {'versione': versione_db[0], 'posti': [{'id': 7}]}
+
+    risultati = []
+
+    def stream():
+        risultati.append(hub.attendi(1, 2, leggi, calcola))
+
+    threads = [threading.Thread(target=stream) for _ in range(5)]
+    for t in threads:
+        t.start()
+    versione_db[0] = 2
+    for t in threads:
+        t.join()
+    assert delta_calcolati == [1]
+    assert all(r == (2, {'versione': 2, 'posti': [{'id': 7}]}) for r in risultati)
+
+
+def _eventi(testo):
+    return [blocco for blocco in testo.split('\n\n') if blocco.strip()]
+
+
+def test_stream_senza_versione_invia_resync(app, client):
+    app.config['SSE_DURATA_MAX_SECONDI'] = 0.05
+    r = client.get('/api/posti/stream')
+    assert r.status_code == 200
+    assert r.mimetype == 'text/event-stream'
+    eventi = _eventi(r.get_data(as_text=True))
+    assert eventi[0] == 'retry: 3000'
+    assert 'event: resync' in eventi[1]
+
+
+def test_stream_last_event_id_riprende_modifiche(app, client):
+    """Con Last-Event-ID lo stream invia subito le modifiche perse, con lo stato per la sessione."""
+    app.config['SSE_DURATA_MAX_SECONDI'] = 0.05
+    r = client.get('/api/posti')
+    versione = int(r.headers['X-Versione-Mappa'])
+    posto_id = next(p['id'] for p in r.get_json() if p['stato'] == 'disponibile')
+    client.post('/api/blocchi', json={'session_id': 'sess-sse', 'posto_ids': [posto_id]})
+
+    testo = client.get(
+        '/api/posti/stream',
+        query_string={'session_id': 'sess-sse'},
+        headers={'Last-Event-ID': str(versione)},
+    ).get_data(as_text=True)
+    evento = next(e for e in _eventi(testo) if 'event: posti' in e)
+    assert f'id: {versione + 1}' in evento
+    assert '"stato":"bloccato_da_me"' in evento
+    assert '_sessioni' not in evento
+
+
+def test_stream_heartbeat(app, client):
+    app.config['SSE_DURATA_MAX_SECONDI'] = 0.2
+    app.config['SSE_HEARTBEAT_SECONDI'] = 0.05
+    app.config['SSE_INTERVALLO_CONTROLLO'] = 0.01
+    versione = int(client.get('/api/posti').headers['X-Versione-Mappa'])
+    testo = client.get('/api/posti/stream', query_string={'since': versione}).get_data(as_text=True)
+    assert ': ping' in _eventi(testo)
+
+
+
+def test_stream_salta_delta_vuoti(app, client):
+    """Una nuova versione senza posti cambiati non genera un evento 'posti': avanza solo l'id."""
+    import routes
+    from app import db
+    app.config['SSE_DURATA_MAX_SECONDI'] = 0.3
+    app.config['SSE_INTERVALLO_CONTROLLO'] = 0.01
+    versione = int(client.get('/api/posti').headers['X-Versione-Mappa'])
+
+    def modifica_vuota():
+        time.sleep(0.05)
+        with app.test_request_context('/api/posti'):
+            routes._registra_modifica('rinnovato', [], 1)
+            db.session.commit()
+
+    t = threading.Thread(target=modifica_vuota)
+    t.start()
+    testo = client.get('/api/posti/stream', query_string={'since': versione}).get_data(as_text=True)
+    t.join()
+    assert f'id: {versione + 1}' in _eventi(testo)
+    assert 'event: posti' not in testo
+
+def test_stream_oltre_il_limite_503(app, client):
+    """Oltre SSE_STREAM_MAX stream aperti nel processo la risposta è 503 (il client resta sul polling);
+    chiudendo uno stream il posto si libera."""
+    app.config['SSE_STREAM_MAX'] = 1
+    app.config['SSE_DURATA_MAX_SECONDI'] = 0.05
+    aperto = client.get('/api/posti/stream', buffered=False)
+    assert aperto.status_code == 200
+    rifiutato = client.get('/api/posti/stream')
+    assert rifiutato.status_code == 503
+    assert rifiutato.headers['Retry-After']
+    aperto.close()
+    assert client.get('/api/posti/stream').status_code == 200
+    app.config['SSE_STREAM_MAX'] = 0
+    assert client.get('/api/posti/stream').status_code == 503
@@ -0,0 +1,73 @@
+"""Limiti sul numero di query SQL (regressioni N+1): il numero di istruzioni per richiesta
+non deve crescere con la dimensione della sala né con il numero di posti della richiesta."""
+import pytest
+
+ADMIN = {'X-Admin-Password': 'admin123'}
+
+
+def _crea_sala(client, numero_file, posti_per_fila):
+    """Nuovo evento con una sala numero_file x posti_per_fila, qualche prenotazione e un blocco.
+    Ritorna (prefisso delle route dell'evento, id dei posti liberi)."""
+    definizione = {'file': [{'fila': chr(ord('A') + i), 'posti': posti_per_fila} for i in range(numero_file)]}
+    evento = client.post('/api/admin/eventi', json={'layout': definizione}, headers=ADMIN).get_json()
+    base = f"/api/eventi/{evento['id']}"
+    ids = [p['id'] for p in client.get(f'{base}/posti').get_json()]
+    client.post(f'{base}/prenotazioni', json={'nome': 'Anna', 'email': 'anna@test.it', 'posto_ids': ids[:5]})
+    client.post(f'{base}/blocchi', json={'session_id': 'sess-altra', 'posto_ids': ids[5:8]})
+    return base, ids[8:]
+
+
+LETTURE = [
+    # (nome, metodo del client, percorso relativo all'evento, kwargs, massimo di istruzioni)
+    ('mappa', 'get', '/posti', {'query_string': {'session_id': 'sess-mia'}}, 4),
+    ('stato compatto', 'get', '/posti/stato', {}, 4),
+    ('mappa admin', 'get', '/admin/posti', {'headers': ADMIN}, 3),
+    ('export', 'get', '/admin/export', {'headers': ADMIN}, 2),
+    ('export csv persone', 'get', '/admin/export', {'headers': ADMIN, 'query_string': {'formato': 'csv', 'vista': 'persone'}}, 2),
+]
+
+
+@pytest.mark.parametrize('nome,metodo,percorso,kwargs,massimo', LETTURE, ids=[x[0] for x in LETTURE])
+def test_letture_non_crescono_con_la_sala(client, conta_query, nome, metodo, percorso, kwargs, massimo):
+    conteggi = []
+    for numero_file, posti_per_fila in ((10, 10), (20, 100)):
+        base, _ = _crea_sala(client, numero_file, posti_per_fila)
+        # Dopo l'ultima modifica lo snapshot della mappa va ricostruito: è il caso peggiore
+        with conta_query() as q:
+            r = getattr(client, metodo)(base + percorso, **kwargs)
+            r.get_data()  # le risposte in streaming eseguono le query mentre vengono lette
+        assert r.status_code == 200
+        assert q.numero <= massimo, q
+        conteggi.append(q.numero)
+    assert conteggi[0] == conteggi[1], f'{nome}: {conteggi[0]} query con 100 posti, {conteggi[1]} con 2000'
+
+
+def test_mappa_da_snapshot_una_query(client, conta_query):
+    """Con la mappa invariata basta leggere la versione."""
+    base, _ = _crea_sala(client, 20, 100)
+    client.get(f'{base}/posti')
+    with conta_query() as q:
+        assert client.get(f'{base}/posti').status_code == 200
+    assert q.numero <= 1, q
+
+
+@pytest.mark.parametrize('percorso,corpo,massimo', [
+    ('/prenotazioni', {'nome': 'Bea', 'email': 'bea@test.it'}, 13),
+    ('/blocchi', {'session_id': 'sess-mia'}, 6),  # compreso BEGIN IMMEDIATE
+])
+def test_scritture_non_crescono_con_i_posti(client, conta_query, percorso, corpo, massimo):
+    """Prenotare o bloccare 1 o 10 posti, in una sala da 100 o 2000, costa lo stesso numero di query."""
+    conteggi = {}
+    for numero_file, posti_per_fila in ((10, 10), (20, 100)):
+        base, liberi = _crea_sala(client, numero_file, posti_per_fila)
+        for n in (1, 10):
+            dati = {**corpo, 'posto_ids': liberi[:n]}
+            if 'email' in dati:  # email nuova: ogni prenotazione genera il proprio codice
+                dati['email'] = f'{numero_file}-{n}-{dati["email"]}'
+            with conta_query() as q:
+                r = client.post(base + percorso, json=dati)
+            assert r.status_code == 200, r.get_json()
+            assert q.numero <= massimo, q
+            conteggi[(numero_file * posti_per_fila, n)] = q.numero
+            liberi = liberi[n:]
+    assert len(set(conteggi.values())) == 1, conteggi
@@ -189,3 +189,398 @@ def test_admin_file_put_riservata(client):
     data = r.get_json()
     assert 'aggiornati' in data
     assert data['aggiornati'] >= 0
+
+
+def test_get_posti_stati_mappa(client):
+    """GET /api/posti calcola gli stati di tutti i posti in blocco, senza dati personali;
+    /api/admin/posti aggiunge nome, allieva ed email di chi ha prenotato."""
+    posti = client.get('/api/posti').get_json()
+    liberi = [p['id'] for p in posti if p['stato'] == 'disponibile']
+    client.post('/api/prenotazioni', json={'nome': 'Anna', 'nome_allieva': 'Sara', 'email': 'anna@test.it', 'posto_ids': [liberi[0]]})
+    client.post('/api/blocchi', json={'session_id': 'sess-mia', 'posto_ids': [liberi[1]]})
+    client.post('/api/blocchi', json={'session_id': 'sess-altra', 'posto_ids': [liberi[2]]})
+
+    by_id = {p['id']: p for p in client.get('/api/posti', query_string={'session_id': 'sess-mia'}).get_json()}
+    assert by_id[liberi[0]]['stato'] == 'occupato'
+    assert by_id[liberi[1]]['stato'] == 'bloccato_da_me'
+    assert by_id[liberi[2]]['stato'] == 'bloccato'
+    assert by_id[liberi[3]]['stato'] == 'disponibile'
+    assert not any(k.startswith('prenotazione_') for p in by_id.values() for k in p)
+
+    r = client.get('/api/admin/posti', headers={'X-Admin-Password': 'admin123'})
+    admin = {p['id']: p for p in r.get_json()}
+    assert admin[liberi[0]]['prenotazione_nome'] == 'Anna'
+    assert admin[liberi[0]]['prenotazione_nome_allieva'] == 'Sara'
+    assert admin[liberi[0]]['prenotazione_email'] == 'anna@test.it'
+    assert admin[liberi[2]]['stato'] == 'bloccato'
+    assert 'prenotazione_nome' not in admin[liberi[3]]
+    assert r.headers['Cache-Control'] == 'no-store'
+
+
+def test_get_posti_etag_304(client):
+    """GET /api/posti restituisce ETag; con If-None-Match invariato risponde 304 senza corpo."""
+    r = client.get('/api/posti')
+    etag = r.headers.get('ETag')
+    assert etag
+    r2 = client.get('/api/posti', headers={'If-None-Match': etag})
+    assert r2.status_code == 304
+    assert r2.get_data() == b''
+    assert r2.headers.get('ETag') == etag
+
+
+def test_get_posti_etag_cambia_dopo_modifica(client):
+    """Ogni modifica (blocco, prenotazione) incrementa la versione e invalida lo snapshot."""
+    r = client.get('/api/posti')
+    etag = r.headers['ETag']
+    posto_id = next(p['id'] for p in r.get_json() if p['stato'] == 'disponibile')
+    client.post('/api/blocchi', json={'session_id': 'sess-x', 'posto_ids': [posto_id]})
+    r2 = client.get('/api/posti', headers={'If-None-Match': etag})
+    assert r2.status_code == 200
+    assert r2.headers['ETag'] != etag
+    stato = {p['id']: p['stato'] for p in r2.get_json()}
+    assert stato[posto_id] == 'bloccato'
+
+
+def test_get_posti_snapshot_sovrappone_sessione(client):
+    """Lo snapshot condiviso mostra 'bloccato_da_me' solo alla sessione che ha il blocco."""
+    posti = client.get('/api/posti').get_json()
+    posto_id = next(p['id'] for p in posti if p['stato'] == 'disponibile')
+    client.post('/api/blocchi', json={'session_id': 'sess-a', 'posto_ids': [posto_id]})
+    ra = client.get('/api/posti', query_string={'session_id': 'sess-a'})
+    rb = client.get('/api/posti', query_string={'session_id': 'sess-b'})
+    assert {p['id']: p['stato'] for p in ra.get_json()}[posto_id] == 'bloccato_da_me'
+    assert {p['id']: p['stato'] for p in rb.get_json()}[posto_id] == 'bloccato'
+    assert ra.headers['ETag'] != rb.headers['ETag']
+    # Lo snapshot non è stato modificato dalla sovrapposizione
+    rb2 = client.get('/api/posti', query_string={'session_id': 'sess-b'})
+    assert {p['id']: p['stato'] for p in rb2.get_json()}[posto_id] == 'bloccato'
+
+
+def test_get_posti_blocco_scaduto_invalida_snapshot(app, client):
+    """Alla scadenza del primo blocco lo snapshot viene ricostruito senza scritture."""
+    from datetime import datetime, timedelta
+    from app import db
+    from models import Blocco
+
+    posti = client.get('/api/posti').get_json()
+    posto_id = next(p['id'] for p in posti if p['stato'] == 'disponibile')
+    client.post('/api/blocchi', json={'session_id': 'sess-s', 'posto_ids': [posto_id]})
+    etag = client.get('/api/posti').headers['ETag']
+    with app.app_context():
+        Blocco.query.filter_by(posto_id=posto_id).update({'scadenza': datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+        app.extensions['teatro_mappa']['snapshot'][1]['valido_fino'] = datetime.utcnow() - timedelta(seconds=1)
+    r = client.get('/api/posti', headers={'If-None-Match': etag})
+    assert r.status_code == 200
+    assert {p['id']: p['stato'] for p in r.get_json()}[posto_id] == 'disponibile'
+
+
+def test_posti_changes_delta(client):
+    """GET /api/posti/changes?since=v restituisce solo i posti cambiati dopo v."""
+    r = client.get('/api/posti')
+    versione = int(r.headers['X-Versione-Mappa'])
+    liberi = [p['id'] for p in r.get_json() if p['stato'] == 'disponibile']
+    client.post('/api/blocchi', json={'session_id': 'sess-d', 'posto_ids': [liberi[0]]})
+    client.post('/api/prenotazioni', json={'nome': 'B', 'email': 'b@test.it', 'posto_ids': [liberi[1]]})
+
+    d = client.get('/api/posti/changes', query_string={'since': versione, 'session_id': 'sess-d'}).get_json()
+    assert d['resync'] is False
+    assert d['versione'] == versione + 2
+    stati = {p['id']: p['stato'] for p in d['posti']}
+    assert stati == {liberi[0]: 'bloccato_da_me', liberi[1]: 'occupato'}
+    assert [(m['posto_id'], m['evento']) for m in d['modifiche']] == [(liberi[0], 'bloccato'), (liberi[1], 'prenotato')]
+
+    vuoto = client.get('/api/posti/changes', query_string={'since': d['versione']}).get_json()
+    assert vuoto['posti'] == [] and vuoto['modifiche'] == []
+
+
+def test_posti_changes_rilascio_e_cancellazione(client):
+    """Rilascio blocco e cancellazione prenotazione compaiono nel registro modifiche."""
+    r = client.get('/api/posti')
+    liberi = [p['id'] for p in r.get_json() if p['stato'] == 'disponibile']
+    client.post('/api/blocchi', json={'session_id': 'sess-r', 'posto_ids': [liberi[0]]})
+    pren = client.post('/api/prenotazioni', json={'nome': 'C', 'email': 'c@test.it', 'posto_ids': [liberi[1]]}).get_json()
+    versione = int(client.get('/api/posti').headers['X-Versione-Mappa'])
+    client.delete('/api/blocchi', json={'session_id': 'sess-r', 'posto_ids': [liberi[0]]})
+    client.delete(f"/api/prenotazioni/{pren['prenotazioni'][0]['id']}")
+
+    d = client.get('/api/posti/changes', query_string={'since': versione}).get_json()
+    assert [(m['posto_id'], m['evento']) for m in d['modifiche']] == [(liberi[0], 'rilasciato'), (liberi[1], 'cancellato')]
+    assert all(p['stato'] == 'disponibile' for p in d['posti'])
+
+
+def test_posti_changes_resync(client):
+    """Versione mancante, futura o mappa rigenerata -> resync richiesto."""
+    assert client.get('/api/posti/changes').get_json()['resync'] is True
+    versione = int(client.get('/api/posti').headers['X-Versione-Mappa'])
+    assert client.get('/api/posti/changes', query_string={'since': versione + 5}).get_json()['resync'] is True
+
+    headers = {'X-Admin-Password': 'admin123'}
+    client.put('/api/admin/impostazioni', json={'numero_file': 2, 'posti_per_fila': 3}, headers=headers)
+    assert client.post('/api/admin/impostazioni/genera-posti', headers=headers).status_code == 200
+    d = client.get('/api/posti/changes', query_string={'since': versione}).get_json()
+    assert d['resync'] is True
+
+
+def test_posti_changes_fuori_registro(app, client):
+    """Una versione più vecchia di MODIFICHE_MAX_VERSIONI richiede resync."""
+    app.config['MODIFICHE_MAX_VERSIONI'] = 1
+    r = client.get('/api/posti')
+    versione = int(r.headers['X-Versione-Mappa'])
+    liberi = [p['id'] for p in r.get_json() if p['stato'] == 'disponibile']
+    client.post('/api/blocchi', json={'session_id': 'sess-f', 'posto_ids': [liberi[0]]})
+    assert client.get('/api/posti/changes', query_string={'since': versione}).get_json()['resync'] is False
+    client.post('/api/blocchi', json={'session_id': 'sess-f', 'posto_ids': [liberi[1]]})
+    assert client.get('/api/posti/changes', query_string={'since': versione}).get_json()['resync'] is True
+
+
+def test_crea_prenotazione_piu_posti_in_un_insert(client):
+    """Più posti prenotati insieme: stesso codice, blocchi rilasciati, timestamp valorizzato."""
+    posti = client.get('/api/posti').get_json()
+    liberi = [p['id'] for p in posti if p['stato'] == 'disponibile'][:4]
+    client.post('/api/blocchi', json={'session_id': 'sess-p', 'posto_ids': liberi})
+    r = client.post('/api/prenotazioni', json={'nome': 'Gruppo', 'email': 'Gruppo@Test.it', 'posto_ids': liberi, 'session_id': 'sess-p'})
+    assert r.status_code == 200
+    data = r.get_json()
+    assert [p['posto_id'] for p in data['prenotazioni']] == liberi
+    assert all(p['email'] == 'gruppo@test.it' and p['timestamp'] for p in data['prenotazioni'])
+    assert len(data['codice']) == 6 and data['codice_nuovo'] is True
+    stati = {p['id']: p['stato'] for p in client.get('/api/posti', query_string={'session_id': 'sess-p'}).get_json()}
+    assert all(stati[pid] == 'occupato' for pid in liberi)
+
+    altro = [p['id'] for p in posti if p['stato'] == 'disponibile'][4]
+    r2 = client.post('/api/prenotazioni', json={'nome': 'Gruppo', 'email': 'gruppo@test.it', 'posto_ids': [altro]})
+    assert r2.get_json()['codice'] == data['codice']
+    assert r2.get_json()['codice_nuovo'] is False
+
+
+def test_crea_prenotazione_conflitti_per_posto(client):
+    """Tutti i posti non prenotabili sono riportati in una sola risposta; nessun posto viene prenotato."""
+    posti = client.get('/api/posti').get_json()
+    liberi = [p['id'] for p in posti if p['stato'] == 'disponibile']
+    client.post('/api/prenotazioni', json={'nome': 'A', 'email': 'a@test.it', 'posto_ids': [liberi[0]]})
+    client.post('/api/blocchi', json={'session_id': 'sess-altra', 'posto_ids': [liberi[1]]})
+
+    r = client.post('/api/prenotazioni', json={'nome': 'B', 'email': 'b@test.it', 'posto_ids': [liberi[2], liberi[0], 999999, liberi[1]]})
+    assert r.status_code == 400
+    data = r.get_json()
+    assert [(c['posto_id'], c['motivo']) for c in data['conflitti']] == [
+        (liberi[0], 'occupato'), (999999, 'non_trovato'), (liberi[1], 'bloccato'),
+    ]
+    assert data['error'] == data['conflitti'][0]['messaggio']
+    assert 'già occupato' in data['error']
+    stati = {p['id']: p['stato'] for p in client.get('/api/posti').get_json()}
+    assert stati[liberi[2]] == 'disponibile'
+
+
+def test_crea_prenotazione_conflitto_rilevato_da_indice_unico(client, monkeypatch):
+    """Se un'altra prenotazione arriva dopo la verifica, l'indice unico rileva il conflitto."""
+    import routes
+    posti = client.get('/api/posti').get_json()
+    liberi = [p['id'] for p in posti if p['stato'] == 'disponibile']
+    client.post('/api/prenotazioni', json={'nome': 'Primo', 'email': 'primo@test.it', 'posto_ids': [liberi[0]]})
+    etichette = {p['id']: f"{p['fila']}{p['numero']}" for p in posti}
+    monkeypatch.setattr(routes, '_verifica_posti_prenotabili', lambda ids, sid: (etichette, []))
+
+    r = client.post('/api/prenotazioni', json={'nome': 'Secondo', 'email': 'secondo@test.it', 'posto_ids': [liberi[1], liberi[0]]})
+    assert r.status_code == 400
+    assert [(c['posto_id'], c['motivo']) for c in r.get_json()['conflitti']] == [(liberi[0], 'occupato')]
+    stati = {p['id']: p['stato'] for p in client.get('/api/posti').get_json()}
+    assert stati[liberi[1]] == 'disponibile'
+
+
+def test_crea_prenotazione_riverifica_posti_sotto_lock(client, monkeypatch):
+    """Un posto riservato dall'admin o eliminato dopo la verifica non viene prenotato."""
+    import routes
+    posti = client.get('/api/posti').get_json()
+    liberi = [p['id'] for p in posti if p['stato'] == 'disponibile']
+    etichette = {p['id']: f"{p['fila']}{p['numero']}" for p in posti}
+    monkeypatch.setattr(routes, '_verifica_posti_prenotabili', lambda ids, sid: (etichette, []))
+    client.put(f'/api/admin/posti/{liberi[0]}', json={'riservato_staff': True}, headers={'X-Admin-Password': 'admin123'})
+
+    r = client.post('/api/prenotazioni', json={'nome': 'A', 'email': 'a@test.it', 'posto_ids': [liberi[1], liberi[0], 999999]})
+    assert r.status_code == 400
+    assert [(c['posto_id'], c['motivo']) for c in r.get_json()['conflitti']] == [
+        (liberi[0], 'non_disponibile'), (999999, 'non_trovato'),
+    ]
+    stati = {p['id']: p['stato'] for p in client.get('/api/posti').get_json()}
+    assert stati[liberi[1]] == 'disponibile'
+
+
+def test_blocca_posti_conflitti_e_rinnovo(client):
+    """POST /api/blocchi: i posti di altre sessioni sono conflitti (409), i propri vengono rinnovati."""
+    r = client.get('/api/posti')
+    versione = int(r.headers['X-Versione-Mappa'])
+    liberi = [p['id'] for p in r.get_json() if p['stato'] == 'disponibile']
+    etichette = {p['id']: f"{p['fila']}{p['numero']}" for p in r.get_json()}
+    client.post('/api/blocchi', json={'session_id': 'sess-altra', 'posto_ids': [liberi[0]]})
+    client.post('/api/blocchi', json={'session_id': 'sess-mia', 'posto_ids': [liberi[1]]})
+
+    r = client.post('/api/blocchi', json={'session_id': 'sess-mia', 'posto_ids': [liberi[0], liberi[1], liberi[2]]})
+    assert r.status_code == 409
+    data = r.get_json()
+    assert data['bloccati'] == [liberi[1], liberi[2]]
+    assert data['conflitti'] == [liberi[0]]
+    assert data['conflitti_etichette'] == [etichette[liberi[0]]]
+
+    modifiche = client.get('/api/posti/changes', query_string={'since': versione}).get_json()['modifiche']
+    # Il rinnovo del proprio blocco non è una transizione di stato
+    assert [(m['posto_id'], m['evento']) for m in modifiche] == [
+        (liberi[0], 'bloccato'), (liberi[1], 'bloccato'), (liberi[2], 'bloccato'),
+    ]
+
+
+
+def test_rinnovo_non_cambia_versione_ne_etag(client):
+    """Rinnovare i propri blocchi (PUT o di nuovo POST) non cambia lo stato: il polling resta su 304."""
+    posto = client.get('/api/posti').get_json()[0]['id']
+    client.post('/api/blocchi', json={'session_id': 's', 'posto_ids': [posto]})
+    r = client.get('/api/posti')
+    etag, versione = r.headers['ETag'], r.headers['X-Versione-Mappa']
+    assert client.put('/api/blocchi/rinnovo', json={'session_id': 's', 'posto_ids': [posto]}).status_code == 200
+    assert client.post('/api/blocchi', json={'session_id': 's', 'posto_ids': [posto]}).status_code == 200
+    r = client.get('/api/posti', headers={'If-None-Match': etag})
+    assert r.status_code == 304 and r.headers['X-Versione-Mappa'] == versione
+
+def test_blocca_posti_ignora_occupati_e_riservati(client):
+    """Posti occupati, riservati o inesistenti non vengono bloccati né segnalati come conflitti."""
+    posti = client.get('/api/posti').get_json()
+    liberi = [p['id'] for p in posti if p['stato'] == 'disponibile']
+    client.post('/api/prenotazioni', json={'nome': 'A', 'email': 'a@test.it', 'posto_ids': [liberi[0]]})
+    client.put(f'/api/admin/posti/{liberi[1]}', json={'riservato_staff': True}, headers={'X-Admin-Password': 'admin123'})
+    r = client.post('/api/blocchi', json={'session_id': 'sess-x', 'posto_ids': [liberi[0], liberi[1], 999999, liberi[2]]})
+    assert r.status_code == 200
+    assert r.get_json()['bloccati'] == [liberi[2]]
+
+
+def _prenota_per_export(client):
+    liberi = [p for p in client.get('/api/posti').get_json() if p['stato'] == 'disponibile']
+    client.post('/api/prenotazioni', json={'nome': 'Anna', 'email': 'anna@test.it', 'posto_ids': [liberi[0]['id']]})
+    client.post('/api/prenotazioni', json={'nome': 'Bruno', 'email': 'bruno@test.it', 'nome_allieva': 'Sofia',
+                                          'posto_ids': [liberi[2]['id'], liberi[1]['id']]})
+    return liberi
+
+
+def test_admin_export_json(client):
+    """GET /api/admin/export: bySeat ordinato per posto, byPerson per numero di posti."""
+    liberi = _prenota_per_export(client)
+    r = client.get('/api/admin/export', headers={'X-Admin-Password': 'admin123'})
+    assert r.status_code == 200
+    assert r.is_streamed
+    data = r.get_json()
+    etichette = [f"{p['fila']}{p['numero']}" for p in liberi[:3]]
+    assert [s['posto'] for s in data['bySeat']] == etichette
+    assert data['bySeat'][1]['nome_allieva'] == 'Sofia'
+    assert [p['nome'] for p in data['byPerson']] == ['Bruno', 'Anna']
+    assert data['byPerson'][0]['count'] == 2
+    assert data['byPerson'][0]['posti'] == etichette[1:3]
+    assert 'timestamp' in data['byPerson'][0]
+
+
+def test_admin_export_csv_e_ndjson(client):
+    """Formato da ?formato o da Accept; vista per posti o per persone."""
+    _prenota_per_export(client)
+    headers = {'X-Admin-Password': 'admin123'}
+    r = client.get('/api/admin/export', query_string={'formato': 'csv', 'vista': 'persone'}, headers=headers)
+    assert r.mimetype == 'text/csv'
+    assert 'attachment' in r.headers['Content-Disposition']
+    righe = r.get_data(as_text=True).splitlines()
+    assert righe[0] == 'nome,nome_allieva,email,count,posti,timestamp'
+    assert righe[1].startswith('Bruno,Sofia,bruno@test.it,2,')
+    r = client.get('/api/admin/export', headers=dict(headers, Accept='application/x-ndjson'))
+    assert r.mimetype == 'application/x-ndjson'
+    assert len(r.get_data(as_text=True).splitlines()) == 3
+    assert client.get('/api/admin/export', query_string={'formato': 'xml'}, headers=headers).status_code == 400
+    assert client.get('/api/admin/export').status_code == 401
+
+
+def _prenota_tre(client):
+    liberi = [p['id'] for p in client.get('/api/posti').get_json() if p['stato'] == 'disponibile']
+    for i, (nome, email, allieva) in enumerate([('Mario Rossi', 'mario@test.it', ''), ('Anna Verdi', 'anna@test.it', 'Sofia'),
+                                                ('Luca Bianchi', 'luca@test.it', 'Giulia')]):
+        r = client.post('/api/prenotazioni', json={'nome': nome, 'email': email, 'nome_allieva': allieva, 'posto_ids': [liberi[i]]})
+        assert r.status_code == 200
+    return liberi
+
+
+def test_list_prenotazioni_paginata(client):
+    """GET /api/prenotazioni?limit=N pagina con cursore su (timestamp, id) senza ripetizioni."""
+    _prenota_tre(client)
+    tutte = client.get('/api/prenotazioni').get_json()
+    assert isinstance(tutte, list) and len(tutte) == 3
+    visti = []
+    cursore = None
+    while True:
+        params = {'limit': 2, **({'cursor': cursore} if cursore else {})}
+        pagina = client.get('/api/prenotazioni', query_string=params).get_json()
+        visti += [p['id'] for p in pagina['prenotazioni']]
+        cursore = pagina['next_cursor']
+        if not cursore:
+            break
+    assert visti == sorted(visti, reverse=True)
+    assert sorted(visti) == sorted(p['id'] for p in tutte)
+    assert client.get('/api/prenotazioni', query_string={'cursor': 'xyz'}).status_code == 400
+
+
+def test_admin_cerca_prenotazioni(client):
+    """GET /api/admin/prenotazioni: filtri email, fila, stato e ricerca testuale (FTS o LIKE)."""
+    _prenota_tre(client)
+    headers = {'X-Admin-Password': 'admin123'}
+    assert client.get('/api/admin/prenotazioni').status_code == 401
+
+    def cerca(**params):
+        r = client.get('/api/admin/prenotazioni', query_string=params, headers=headers)
+        assert r.status_code == 200
+        return [p['nome'] for p in r.get_json()['prenotazioni']]
+
+    assert cerca(email='ANNA@test.it') == ['Anna Verdi']
+    assert cerca(q='giul') == ['Luca Bianchi']
+    assert cerca(q='mario test') == ['Mario Rossi']
+    assert cerca(nome='ross') == ['Mario Rossi']
+    assert len(cerca(fila='A')) >= 1
+    anna = client.get('/api/admin/prenotazioni', query_string={'email': 'anna@test.it'}, headers=headers).get_json()
+    client.delete(f"/api/prenotazioni/{anna['prenotazioni'][0]['id']}")
+    assert cerca(q='anna') == []
+    assert cerca(q='anna', stato='cancellata') == ['Anna Verdi']
+    assert len(cerca(stato='tutte')) == 3
+
+
+def test_admin_cerca_prenotazioni_senza_fts(app, client):
+    """Senza FTS5 la ricerca testuale ripiega su LIKE."""
+    _prenota_tre(client)
+    app.extensions['teatro_fts_prenotazioni'] = False
+    r = client.get('/api/admin/prenotazioni', query_string={'q': 'sofia'}, headers={'X-Admin-Password': 'admin123'})
+    assert [p['nome'] for p in r.get_json()['prenotazioni']] == ['Anna Verdi']
+
+
+def _decodifica_stati(dati, n):
+    codici = ['disponibile', 'occupato', 'non_disponibile', 'bloccato']
+    return [codici[(dati[i >> 2] >> ((i & 3) * 2)) & 3] for i in range(n)]
+
+
+def test_posti_compatti_layout_e_stato(client):
+    """Layout statico + vettore di stati a 2 bit equivalenti a GET /api/posti."""
+    import base64
+    liberi = [p['id'] for p in client.get('/api/posti').get_json() if p['stato'] == 'disponibile']
+    client.post('/api/prenotazioni', json={'nome': 'Mario', 'email': 'mario@test.it', 'posto_ids': [liberi[0]]})
+    client.post('/api/blocchi', json={'session_id': 'altra', 'posto_ids': [liberi[1]]})
+    client.post('/api/blocchi', json={'session_id': 'mia', 'posto_ids': [liberi[2]]})
+    client.put(f'/api/admin/posti/{liberi[3]}', json={'riservato_staff': True}, headers={'X-Admin-Password': 'admin123'})
+
+    r = client.get('/api/posti/stato', query_string={'session_id': 'mia'})
+    stato = r.get_json()
+    layout = client.get('/api/posti/layout', query_string={'v': stato['layout']})
+    assert 'immutable' in layout.headers['Cache-Control']
+    ids = [p['id'] for p in layout.get_json()['posti']]
+    stati = _decodifica_stati(base64.b64decode(stato['stati']), stato['n'])
+    assert stato['miei'] == [liberi[2]]
+    mappa = {p['id']: p['stato'] for p in client.get('/api/posti', query_string={'session_id': 'mia'}).get_json()}
+    atteso = [mappa[pid] if mappa[pid] != 'bloccato_da_me' else 'bloccato' for pid in ids]
+    assert stati == atteso
+
+    assert client.get('/api/posti/stato', query_string={'session_id': 'mia'},
+                      headers={'If-None-Match': r.headers['ETag']}).status_code == 304
+    binario = client.get('/api/posti/stato', headers={'Accept': 'application/octet-stream'})
+    assert binario.mimetype == 'application/octet-stream'
+    assert binario.data == base64.b64decode(stato['stati'])
+    assert binario.headers['X-Layout-Mappa'] == stato['layout']
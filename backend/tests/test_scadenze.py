@@ -0,0 +1,91 @@
+"""Test reaper dei blocchi scaduti (scadenze.py)."""
+from datetime import datetime, timedelta
+
+from app import db
+from models import Blocco, ModificaPosto
+from scadenze import ReaperBlocchi
+
+
+def _blocca(client, session_id):
+    posti = client.get('/api/posti').get_json()
+    posto_id = next(p['id'] for p in posti if p['stato'] == 'disponibile')
+    client.post('/api/blocchi', json={'session_id': session_id, 'posto_ids': [posto_id]})
+    return posto_id
+
+
+def _fai_scadere(app, posto_id):
+    with app.app_context():
+        Blocco.query.filter_by(posto_id=posto_id).update({'scadenza': datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+
+
+def test_get_posti_non_elimina_blocchi_scaduti(app, client):
+    """Le letture ignorano i blocchi scaduti senza eliminarli (niente scritture sul percorso di lettura)."""
+    posto_id = _blocca(client, 'sess-1')
+    _fai_scadere(app, posto_id)
+    stati = {p['id']: p['stato'] for p in client.get('/api/posti').get_json()}
+    assert stati[posto_id] == 'disponibile'
+    with app.app_context():
+        assert Blocco.query.filter_by(posto_id=posto_id).count() == 1
+
+
+def test_reaper_elimina_e_registra_scadenza(app, client):
+    posto_id = _blocca(client, 'sess-2')
+    versione = int(client.get('/api/posti').headers['X-Versione-Mappa'])
+    _fai_scadere(app, posto_id)
+    eliminati, attesa = ReaperBlocchi(app, intervallo_max=30).esegui()
+    assert eliminati == 1
+    assert attesa == 30
+    with app.app_context():
+        assert Blocco.query.count() == 0
+        assert [(m.posto_id, m.evento) for m in ModificaPosto.query.filter(ModificaPosto.versione > versione)] == [(posto_id, 'scaduto')]
+
+
+
+def test_reaper_sotto_il_lock_con_returning(app, client, conta_query):
+    """Il reaper prende il lock di scrittura ed elimina con DELETE ... RETURNING: registra come scaduti
+    solo i blocchi eliminati, non quelli rinnovati (scadenza futura) al momento del DELETE."""
+    scaduto = _blocca(client, 'sess-4')
+    rinnovato = _blocca(client, 'sess-5')
+    versione = int(client.get('/api/posti').headers['X-Versione-Mappa'])
+    _fai_scadere(app, scaduto)
+    with conta_query() as q:
+        eliminati, _ = ReaperBlocchi(app, intervallo_max=30).esegui()
+    assert eliminati == 1
+    assert q.istruzioni[0].startswith('BEGIN IMMEDIATE')
+    assert not any(i.lstrip().upper().startswith('SELECT') and 'blocchi' in i and 'min(' not in i for i in q.istruzioni), q
+    assert any(i.startswith('DELETE FROM blocchi') and 'RETURNING' in i for i in q.istruzioni), q
+    with app.app_context():
+        assert [b.posto_id for b in Blocco.query] == [rinnovato]
+        assert [(m.posto_id, m.evento) for m in ModificaPosto.query.filter(ModificaPosto.versione > versione)] == [(scaduto, 'scaduto')]
+
+def test_reaper_attende_prossima_scadenza(app, client):
+    _blocca(client, 'sess-3')
+    _, attesa = ReaperBlocchi(app, intervallo_max=3600).esegui()
+    durata = app.config['BLOCCO_DURATA_MINUTI'] * 60
+    assert durata - 5 < attesa <= durata + 1
+
+
+def test_reaper_un_solo_leader(app, tmp_path):
+    percorso = str(tmp_path / 'reaper.lock')
+    primo = ReaperBlocchi(app, percorso)
+    secondo = ReaperBlocchi(app, percorso)
+    try:
+        assert primo.prova_leader() is True
+        assert secondo.prova_leader() is False
+        primo.ferma()
+        assert secondo.prova_leader() is True
+    finally:
+        primo.ferma()
+        secondo.ferma()
+
+
+def test_blocca_posto_con_blocco_scaduto_di_altra_sessione(app, client):
+    """Un blocco scaduto non ancora eliminato dal reaper non impedisce un nuovo blocco."""
+    posto_id = _blocca(client, 'sess-vecchia')
+    _fai_scadere(app, posto_id)
+    r = client.post('/api/blocchi', json={'session_id': 'sess-nuova', 'posto_ids': [posto_id]})
+    assert r.status_code == 200
+    assert r.get_json()['bloccati'] == [posto_id]
+    stati = {p['id']: p['stato'] for p in client.get('/api/posti', query_string={'session_id': 'sess-nuova'}).get_json()}
+    assert stati[posto_id] == 'bloccato_da_me'
@@ -0,0 +1,72 @@
+"""Test scrittore unico (scrittore.py): comandi a lotti con un commit, socket tra processi, ripiego."""
+from sqlalchemy import event
+
+import routes
+from app import db
+from models import Blocco, Prenotazione
+from scrittore import Comando, Scrittore, avvia_scrittore
+
+ADMIN = {'X-Admin-Password': 'admin123'}
+
+
+def test_route_tramite_scrittore(app, client):
+    with app.app_context():
+        scrittore = avvia_scrittore(app)
+    try:
+        a, b = [p['id'] for p in client.get('/api/posti').get_json()[:2]]
+        assert client.post('/api/blocchi', json={'session_id': 's1', 'posto_ids': [a, b]}).get_json()['bloccati'] == [a, b]
+        r = client.post('/api/blocchi', json={'session_id': 's2', 'posto_ids': [a]})
+        assert r.status_code == 409 and r.get_json()['conflitti'] == [a]
+        r = client.post('/api/prenotazioni', json={
+            'posto_ids': [a], 'nome': 'Mario', 'email': 'm@example.com', 'session_id': 's1'})
+        assert r.status_code == 200 and len(r.get_json()['codice']) == 6
+        assert client.delete('/api/blocchi', json={'session_id': 's1', 'posto_ids': [b]}).status_code == 200
+        stati = {p['id']: p['stato'] for p in client.get('/api/posti').get_json()}
+        assert stati[a] == 'occupato' and stati[b] == 'disponibile'
+        metriche = client.get('/api/admin/metrics', headers=ADMIN).get_data(as_text=True)
+        assert 'teatro_scrittore_lotto_comandi_count 4' in metriche
+    finally:
+        scrittore.ferma()
+
+
+def test_lotto_con_un_solo_commit(app, monkeypatch):
+    with app.app_context():
+        a, b, c = [p.id for p in routes.Posto.query.order_by(routes.Posto.id).limit(3)]
+        commit = []
+        event.listen(db.engine, 'commit', lambda conn: commit.append(1))
+        # Il terzo comando fallisce dopo aver scritto: solo le sue modifiche vengono annullate
+        originale = routes._assegna_codice
+        monkeypatch.setattr(routes, '_assegna_codice', lambda email: (None, False) if email == 'x@example.com' else originale(email))
+        prenota = {'nome': 'N', 'nome_allieva': '', 'session_id': '', 'etichette': {a: 'A1', b: 'A2', c: 'A3'}}
+        lotto = [
+            Comando('blocca', 1, {'session_id': 's1', 'posto_ids': [a]}),
+            Comando('blocca', 1, {'session_id': 's2', 'posto_ids': [a]}),
+            Comando('prenota', 1, {**prenota, 'posto_ids': [b], 'email_lower': 'x@example.com'}),
+            Comando('prenota', 1, {**prenota, 'posto_ids': [c], 'email_lower': 'y@example.com'}),
+            Comando('prenota', 1, {**prenota, 'posto_ids': [c], 'email_lower': 'z@example.com'}),
+        ]
+        Scrittore(app).esegui_lotto(lotto)
+        assert [c.risultato[1] for c in lotto] == [200, 409, 500, 200, 400]
+        assert lotto[4].risultato[0]['conflitti'][0]['motivo'] == 'occupato'
+        assert len(commit) == 1 and all(c.fatto.is_set() for c in lotto)
+        assert {p.posto_id for p in Prenotazione.query} == {c}
+        assert [(bl.posto_id, bl.session_id) for bl in Blocco.query] == [(a, 's1')]
+
+
+def test_altri_processi_tramite_socket(app, tmp_path):
+    """Un secondo Scrittore sugli stessi file (come un altro worker) invia i comandi al primo;
+    quando il primo si ferma, il successivo diventa scrittore."""
+    percorsi = (str(tmp_path / 'db.scrittore.lock'), str(tmp_path / 'db.scrittore.sock'))
+    primo, secondo = Scrittore(app, *percorsi), Scrittore(app, *percorsi)
+    with app.app_context():
+        posto = routes.Posto.query.first().id
+        assert primo.prova_leader() and not secondo.prova_leader()
+        r = secondo.invia('blocca', 1, {'session_id': 's', 'posto_ids': [posto]})
+        assert r == ({'ok': True, 'bloccati': [posto]}, 200) and not secondo.leader
+        primo.ferma()
+        terzo = Scrittore(app, *percorsi)
+        try:
+            assert terzo.invia('rilascia', 1, {'session_id': 's', 'posto_ids': [posto]}) == ({'ok': True}, 200)
+            assert terzo.leader and Blocco.query.count() == 0
+        finally:
+            terzo.ferma()
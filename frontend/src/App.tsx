@@ -1,13 +1,15 @@
 import { useState, useEffect, useCallback, useRef } from 'react'
 import type { Posto } from './types'
-import { getPosti, getSpettacolo, bloccaPosti, rinnovaBlocchi, rilascioBlocchi } from './services/api'
+import { getPostiCompatti, getSpettacolo, bloccaPosti, rinnovaBlocchi, rilascioBlocchi, apriStreamPosti, unisciPosti } from './services/api'
 import { TeatroMap } from './components/TeatroMap'
 import { BookingForm } from './components/BookingForm'
 import { RecuperaPrenotazione } from './components/RecuperaPrenotazione'
 import { AdminPanel } from './components/AdminPanel'
+import { SalaAttesa } from './components/SalaAttesa'
 import styles from './App.module.css'
 
 const POLL_INTERVAL_MS = 4000
+const POLL_INTERVAL_STREAM_MS = 30000 // con lo stream SSE connesso il polling resta solo come riserva
 const RINNOVO_BLOCCHI_MS = 2 * 60 * 1000 // rinnovo ogni 2 minuti
 const SESSION_STORAGE_KEY = 'teatro-prenotazioni-session-id'
 
@@ -34,6 +36,7 @@ function App() {
   const [successCodice, setSuccessCodice] = useState<string | null>(null)
   const [copiedCodice, setCopiedCodice] = useState(false)
   const [showAdmin, setShowAdmin] = useState(false)
+  const [ammesso, setAmmesso] = useState(false) // false finché la sala d'attesa (se attiva) non ammette
   const [hintVisto, setHintVisto] = useState(() => {
     try {
       return typeof sessionStorage !== 'undefined' && sessionStorage.getItem('teatro-prenotazioni-hint-visto') === '1'
@@ -55,7 +58,7 @@ function App() {
 
   const fetchPosti = useCallback(async () => {
     try {
-      const data = await getPosti(sessionId)
+      const data = await getPostiCompatti(sessionId)
       setPosti(data)
       if (erroreDaFetchRef.current) {
         setError('')
@@ -67,12 +70,28 @@ function App() {
     }
   }, [sessionId])
 
+  const [streamConnesso, setStreamConnesso] = useState(false)
+
+  useEffect(() => {
+    if (typeof EventSource === 'undefined') return
+    return apriStreamPosti(sessionId, {
+      onPosti: (aggiornati) => setPosti((prev) => unisciPosti(prev, aggiornati)),
+      onResync: fetchPosti,
+      onStato: setStreamConnesso,
+    })
+  }, [sessionId, fetchPosti])
+
   useEffect(() => {
     fetchPosti()
-    const t = setInterval(fetchPosti, POLL_INTERVAL_MS)
-    return () => clearInterval(t)
   }, [fetchPosti])
 
+  // Solo l'intervallo dipende dallo stream: alla riconnessione (ogni SSE_DURATA_MAX_SECONDI) nessun
+  // caricamento completo in più, le modifiche perse arrivano dallo stream con Last-Event-ID
+  useEffect(() => {
+    const t = setInterval(fetchPosti, streamConnesso ? POLL_INTERVAL_STREAM_MS : POLL_INTERVAL_MS)
+    return () => clearInterval(t)
+  }, [fetchPosti, streamConnesso])
+
   useEffect(() => {
     if (selectedIds.length > 0) return
     const bloccatiDaMe = posti.filter((p) => p.stato === 'bloccato_da_me').map((p) => p.id)
@@ -114,9 +133,7 @@ function App() {
         fetchPosti()
         setTimeout(() => setRefreshingMessage(false), 2000)
       }
-      if (newIds.length > 0) {
-        rinnovaBlocchi(sessionId, newIds).catch(() => {})
-      }
+      // Nessun rinnovo separato: POST /api/blocchi riporta già a 5 minuti la scadenza di tutti i posti selezionati
     },
     [sessionId, selectedIds, fetchPosti]
   )
@@ -218,65 +235,69 @@ function App() {
         </div>
       )}
 
-      <main className={styles.main}>
-        <div className={styles.mapColumn}>
-          <p className={styles.guidaSelezione}>
-            Clicca sui posti verdi per selezionarli, poi compila il form e conferma.
-          </p>
-          {refreshingMessage && posti.length > 0 && (
-            <p className={styles.refreshingMsg}>Aggiornamento disponibilità…</p>
-          )}
-          {!hintVisto && (
-            <div className={styles.hintBanner} role="status">
-              <span>Clicca su un posto per selezionarlo.</span>
+      <SalaAttesa sessionId={sessionId} onAmmesso={setAmmesso} />
+
+      {ammesso && (
+        <main className={styles.main}>
+          <div className={styles.mapColumn}>
+            <p className={styles.guidaSelezione}>
+              Clicca sui posti verdi per selezionarli, poi compila il form e conferma.
+            </p>
+            {refreshingMessage && posti.length > 0 && (
+              <p className={styles.refreshingMsg}>Aggiornamento disponibilità…</p>
+            )}
+            {!hintVisto && (
+              <div className={styles.hintBanner} role="status">
+                <span>Clicca su un posto per selezionarlo.</span>
+                <button
+                  type="button"
+                  className={styles.hintBannerBtn}
+                  onClick={() => {
+                    setHintVisto(true)
+                    try {
+                      sessionStorage.setItem('teatro-prenotazioni-hint-visto', '1')
+                    } catch {}
+                  }}
+                  aria-label="Chiudi"
+                >
+                  OK
+                </button>
+              </div>
+            )}
+            <TeatroMap
+              posti={posti}
+              selectedIds={selectedIds}
+              onSelectionChange={handleSelectionChange}
+              gruppiFile={spettacolo.gruppi_file}
+            />
+          </div>
+          <div className={styles.formColumn}>
+            {selectedIds.length > 0 && (
+              <p className={styles.notaBlocco}>
+                I posti selezionati sono riservati per 5 minuti. Completa la prenotazione prima della scadenza.
+              </p>
+            )}
+            <BookingForm
+              posti={posti}
+              selectedIds={selectedIds}
+              onSuccess={handleBookingSuccess}
+              onError={setError}
+              disabled={posti.length === 0}
+              sessionId={sessionId}
+            />
+            {selectedIds.length > 0 && (
               <button
                 type="button"
-                className={styles.hintBannerBtn}
-                onClick={() => {
-                  setHintVisto(true)
-                  try {
-                    sessionStorage.setItem('teatro-prenotazioni-hint-visto', '1')
-                  } catch {}
-                }}
-                aria-label="Chiudi"
+                className={styles.pulisciBtn}
+                onClick={() => handleSelectionChange([])}
               >
-                OK
+                Pulisci selezione
               </button>
-            </div>
-          )}
-          <TeatroMap
-            posti={posti}
-            selectedIds={selectedIds}
-            onSelectionChange={handleSelectionChange}
-            gruppiFile={spettacolo.gruppi_file}
-          />
-        </div>
-        <div className={styles.formColumn}>
-          {selectedIds.length > 0 && (
-            <p className={styles.notaBlocco}>
-              I posti selezionati sono riservati per 5 minuti. Completa la prenotazione prima della scadenza.
-            </p>
-          )}
-          <BookingForm
-            posti={posti}
-            selectedIds={selectedIds}
-            onSuccess={handleBookingSuccess}
-            onError={setError}
-            disabled={posti.length === 0}
-            sessionId={sessionId}
-          />
-          {selectedIds.length > 0 && (
-            <button
-              type="button"
-              className={styles.pulisciBtn}
-              onClick={() => handleSelectionChange([])}
-            >
-              Pulisci selezione
-            </button>
-          )}
-          <RecuperaPrenotazione />
-        </div>
-      </main>
+            )}
+            <RecuperaPrenotazione />
+          </div>
+        </main>
+      )}
 
       {showAdmin && (
         <AdminPanel
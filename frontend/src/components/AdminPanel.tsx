@@ -1,7 +1,7 @@
 import { useState, useCallback, useEffect, useMemo, useRef } from 'react'
 import {
   getAdminPosti,
-  getFile,
+  loginAdmin,
   setFilaRiservata,
   setPostoRiservato,
   getExportData,
@@ -61,6 +61,8 @@ interface AdminPanelProps {
 
 export function AdminPanel({ onClose, onFileChange }: AdminPanelProps) {
   const [password, setPassword] = useState('')
+  /** Token firmato da POST /api/admin/login: la password non viene più inviata a ogni richiesta */
+  const [token, setToken] = useState('')
   const [authenticated, setAuthenticated] = useState(false)
   const [tab, setTab] = useState<Tab>('spettacolo')
   const [error, setError] = useState('')
@@ -81,30 +83,43 @@ export function AdminPanel({ onClose, onFileChange }: AdminPanelProps) {
   const [newCountBadge, setNewCountBadge] = useState<number>(0)
   const prevExportTotalRef = useRef(0)
 
+  /** Token scaduto (401): si torna al form di accesso. */
+  const sessioneScaduta = useCallback((e: unknown) => {
+    if (!(e instanceof Error) || e.message !== 'Non autorizzato') return false
+    setToken('')
+    setAuthenticated(false)
+    setError('Sessione scaduta: accedi di nuovo.')
+    return true
+  }, [])
+
   const loadPosti = useCallback(() => {
-    if (!password) return
+    if (!token) return
     setLoading(true)
-    getAdminPosti(password)
+    getAdminPosti(token)
       .then(setPosti)
-      .catch((e) => setError((e instanceof Error ? e.message : 'Errore') + ' Riprova a ricaricare la pagina o controlla la connessione.'))
+      .catch((e) => {
+        if (sessioneScaduta(e)) return
+        setError((e instanceof Error ? e.message : 'Errore') + ' Riprova a ricaricare la pagina o controlla la connessione.')
+      })
       .finally(() => setLoading(false))
-  }, [password])
+  }, [token, sessioneScaduta])
 
   const loadImpostazioni = useCallback(() => {
-    if (!password) return
-    getImpostazioni(password)
+    if (!token) return
+    getImpostazioni(token)
       .then(setImpostazioniState)
-      .catch(() => {
+      .catch((e) => {
+        if (sessioneScaduta(e)) return
         setImpostazioniState(null)
         setError('Impossibile caricare le impostazioni. Riprova a ricaricare la pagina.')
       })
-  }, [password])
+  }, [token, sessioneScaduta])
 
   const loadExport = useCallback(() => {
-    if (!password) return
+    if (!token) return
     setExportLoading(true)
     setNewCountBadge(0)
-    getExportData(password)
+    getExportData(token)
       .then((data) => {
         setExportData(data)
         setLastExportAt(new Date())
@@ -114,12 +129,13 @@ export function AdminPanel({ onClose, onFileChange }: AdminPanelProps) {
         }
         prevExportTotalRef.current = total
       })
-      .catch(() => {
+      .catch((e) => {
+        if (sessioneScaduta(e)) return
         setExportData(null)
         setError('Impossibile caricare l\'elenco. Riprova a ricaricare la pagina o controlla la connessione.')
       })
       .finally(() => setExportLoading(false))
-  }, [password])
+  }, [token, sessioneScaduta])
 
   useEffect(() => {
     if (!toastMessage) return
@@ -130,13 +146,14 @@ export function AdminPanel({ onClose, onFileChange }: AdminPanelProps) {
   const checkAuth = useCallback(() => {
     if (!password) return
     setError('')
-    getFile(password)
-      .then(() => {
+    loginAdmin(password)
+      .then((r) => {
+        setToken(r.token)
+        setPassword('')
         setAuthenticated(true)
-        loadImpostazioni()
       })
       .catch((e) => setError((e instanceof Error ? e.message : 'Non autorizzato') + ' Riprova o controlla la connessione.'))
-  }, [password, loadImpostazioni])
+  }, [password])
 
   useEffect(() => {
     if (!authenticated) return
@@ -226,7 +243,7 @@ export function AdminPanel({ onClose, onFileChange }: AdminPanelProps) {
     const next = !postiInFila.some((p) => p.riservato_staff)
     setError('')
     try {
-      await setFilaRiservata(fila, next, password)
+      await setFilaRiservata(fila, next, token)
       loadPosti()
       onFileChange?.()
     } catch (e) {
@@ -238,7 +255,7 @@ export function AdminPanel({ onClose, onFileChange }: AdminPanelProps) {
     if (p.stato === 'occupato') return
     setError('')
     try {
-      await setPostoRiservato(p.id, !p.riservato_staff, password)
+      await setPostoRiservato(p.id, !p.riservato_staff, token)
       loadPosti()
       onFileChange?.()
     } catch (e) {
@@ -250,7 +267,7 @@ export function AdminPanel({ onClose, onFileChange }: AdminPanelProps) {
     setSaving(true)
     setError('')
     try {
-      await putImpostazioni(password, form)
+      await putImpostazioni(token, form)
       setSuccess('')
       setToastMessage('Salvato')
       loadImpostazioni()
@@ -265,7 +282,7 @@ export function AdminPanel({ onClose, onFileChange }: AdminPanelProps) {
     setSaving(true)
     setError('')
     try {
-      await putImpostazioni(password, form)
+      await putImpostazioni(token, form)
       setSuccess('')
       setToastMessage('Salvato')
       loadImpostazioni()
@@ -281,7 +298,7 @@ export function AdminPanel({ onClose, onFileChange }: AdminPanelProps) {
     if (!window.confirm(`Verranno creati ${n} posti. I posti esistenti saranno sostituiti (solo se non ci sono prenotazioni). Continuare?`)) return
     setError('')
     try {
-      const r = await generaPosti(password)
+      const r = await generaPosti(token)
       setToastMessage(`Creati ${r.creati} posti`)
       setTab('mappa')
       loadPosti()
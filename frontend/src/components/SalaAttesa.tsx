@@ -0,0 +1,139 @@
+import { useEffect, useState } from 'react'
+import { statoCoda, entraInCoda, ammissioneCoda, impostaAmmissione } from '../services/api'
+import styles from './SalaAttesa.module.css'
+
+const POLL_CODA_MS = 5000
+const RITENTA_MIN_MS = 2000
+const RITENTA_MAX_MS = 60000
+const CODA_STORAGE_KEY = 'teatro-prenotazioni-coda' + (typeof window !== 'undefined' ? window.location.search : '')
+
+type Coda = { token: string; numero: number }
+
+function leggiCoda(): Coda | null {
+  try {
+    const c = JSON.parse(sessionStorage.getItem(CODA_STORAGE_KEY) || 'null')
+    return c && typeof c.token === 'string' && typeof c.numero === 'number' ? c : null
+  } catch {
+    return null
+  }
+}
+
+function salvaCoda(c: Coda | null) {
+  try {
+    if (c) sessionStorage.setItem(CODA_STORAGE_KEY, JSON.stringify(c))
+    else sessionStorage.removeItem(CODA_STORAGE_KEY)
+  } catch {}
+}
+
+/**
+ * Sala d'attesa per le aperture delle vendite (attiva solo se il backend ha SALA_ATTESA=1).
+ * Prende un numero, controlla ogni pochi secondi lo stato della coda (risposta cacheabile,
+ * uguale per tutti) e quando tocca a questo numero ottiene il token di ammissione, che
+ * rinnova prima della scadenza. Non mostra nulla quando la sala non è attiva o si è ammessi.
+ * Se la sala non risponde prima di prendere il numero si procede senza; una volta in coda
+ * gli errori di rete non fanno perdere il numero: si riprova con attesa crescente.
+ */
+export function SalaAttesa({ sessionId, onAmmesso }: { sessionId: string; onAmmesso: (ammesso: boolean) => void }) {
+  const [posizione, setPosizione] = useState<number | null>(null)
+  const [ammesso, setAmmesso] = useState(false)
+  const [error, setError] = useState('')
+
+  useEffect(() => {
+    let attivo = true
+    let timer: ReturnType<typeof setTimeout> | undefined
+    let ritardo = RITENTA_MIN_MS
+
+    const ritenta = (passo: () => void) => {
+      if (!attivo) return
+      timer = setTimeout(passo, ritardo)
+      ritardo = Math.min(ritardo * 2, RITENTA_MAX_MS)
+    }
+
+    const ammetti = async (coda: Coda): Promise<boolean> => {
+      const r = await ammissioneCoda(sessionId, coda.token)
+      if (r.scaduto) {
+        // Token della coda non più valido: si rientra con un nuovo numero
+        salvaCoda(null)
+        entra()
+        return true
+      }
+      if (!r.ammissione) {
+        setPosizione(r.posizione ?? null)
+        return false
+      }
+      impostaAmmissione(r.ammissione)
+      setAmmesso(true)
+      onAmmesso(true)
+      // Rinnovo con lo stesso numero (già ammesso) a due terzi della durata
+      const rinnova = () => {
+        if (attivo) ammetti(coda).catch(() => ritenta(rinnova))
+      }
+      ritardo = RITENTA_MIN_MS
+      timer = setTimeout(rinnova, ((r.scade_tra ?? 1800) * 2000) / 3)
+      return true
+    }
+
+    const controlla = async (coda: Coda, subito: boolean) => {
+      if (!attivo) return
+      try {
+        let tocca = subito
+        if (!subito) {
+          const stato = await statoCoda()
+          if (!stato.attiva) return onAmmesso(true)
+          if (stato.ammessi_fino_a !== undefined) {
+            setPosizione(Math.max(0, coda.numero - stato.ammessi_fino_a))
+            tocca = coda.numero <= stato.ammessi_fino_a
+          }
+        }
+        if (tocca && (await ammetti(coda))) return
+        setError('')
+        ritardo = RITENTA_MIN_MS
+        timer = setTimeout(() => controlla(coda, false), POLL_CODA_MS)
+      } catch {
+        setError('Connessione instabile: nuovo tentativo a breve, il tuo posto in coda resta valido.')
+        ritenta(() => controlla(coda, subito))
+      }
+    }
+
+    const entra = async () => {
+      if (!attivo) return
+      // Sala d'attesa non raggiungibile: si procede come se non fosse attiva
+      const stato = await statoCoda().catch(() => null)
+      if (!stato || !stato.attiva) return onAmmesso(true)
+      try {
+        const r = await entraInCoda()
+        if (!r.attiva || !r.token || r.numero === undefined) return onAmmesso(true)
+        const coda = { token: r.token, numero: r.numero }
+        salvaCoda(coda)
+        controlla(coda, true)
+      } catch {
+        ritenta(entra)
+      }
+    }
+
+    const coda = leggiCoda()
+    if (coda) controlla(coda, true)
+    else entra()
+    return () => {
+      attivo = false
+      clearTimeout(timer)
+    }
+  }, [sessionId, onAmmesso])
+
+  if (ammesso) return null
+  return (
+    <div className={styles.wrapper} role="status" aria-live="polite">
+      <h2 className={styles.title}>Sala d'attesa</h2>
+      {posizione === null ? (
+        <p>Verifica disponibilità…</p>
+      ) : (
+        <>
+          <p>Molte persone stanno prenotando in questo momento: entrerai appena sarà il tuo turno.</p>
+          <p className={styles.posizione}>Persone davanti a te: {posizione}</p>
+          <p className={styles.nota}>Non chiudere né ricaricare la pagina: il tuo posto in coda resta valido.</p>
+        </>
+      )}
+      {error && <p className={styles.error}>{error}</p>}
+    </div>
+  )
+}
@@ -87,13 +87,13 @@ describe('api', () => {
   })
 
   describe('getFile (admin)', () => {
-    it('chiama GET /api/admin/file con password e restituisce file e riservate', async () => {
+    it('chiama GET /api/admin/file con il token e restituisce file e riservate', async () => {
       fetchMock.mockResolvedValue({
         ok: true,
         json: () => Promise.resolve({ file: ['A', 'B'], riservate: ['A'] }),
       })
-      const result = await api.getFile('admin123')
-      expect(fetchMock).toHaveBeenCalledWith('/api/admin/file?password=admin123')
+      const result = await api.getFile('tok')
+      expect(fetchMock).toHaveBeenCalledWith('/api/admin/file', { headers: { Authorization: 'Bearer tok' } })
       expect(result).toEqual({ file: ['A', 'B'], riservate: ['A'] })
     })
 
@@ -102,4 +102,70 @@ describe('api', () => {
       await expect(api.getFile('wrong')).rejects.toThrow('Non autorizzato')
     })
   })
+
+  describe('loginAdmin', () => {
+    it('invia la password una volta e restituisce il token', async () => {
+      fetchMock.mockResolvedValue({
+        ok: true,
+        json: () => Promise.resolve({ token: 'tok', scade_tra: 3600 }),
+      })
+      const result = await api.loginAdmin('admin123')
+      expect(fetchMock).toHaveBeenCalledWith('/api/admin/login', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ password: 'admin123' }),
+      })
+      expect(result).toEqual({ token: 'tok', scade_tra: 3600 })
+    })
+
+    it('lancia con il messaggio del server se la password è errata', async () => {
+      fetchMock.mockResolvedValue({ ok: false, json: () => Promise.resolve({ error: 'Password errata' }) })
+      await expect(api.loginAdmin('x')).rejects.toThrow('Password errata')
+    })
+  })
+
+  describe("sala d'attesa", () => {
+    afterEach(() => api.impostaAmmissione(''))
+
+    it('ammissioneCoda restituisce la posizione su 409', async () => {
+      fetchMock.mockResolvedValue({ status: 409, ok: false, json: () => Promise.resolve({ posizione: 12 }) })
+      expect(await api.ammissioneCoda('sess', 'coda')).toEqual({ posizione: 12 })
+    })
+
+    it('invia il token di ammissione con i blocchi', async () => {
+      fetchMock.mockResolvedValue({ ok: true, json: () => Promise.resolve({ ok: true, bloccati: [1] }) })
+      api.impostaAmmissione('amm')
+      await api.bloccaPosti('sess', [1])
+      expect(fetchMock.mock.calls[0][1].headers).toEqual({
+        'Content-Type': 'application/json',
+        'X-Session-Id': 'sess',
+        'X-Ammissione': 'amm',
+      })
+    })
+  })
+
+  describe('unisciPosti', () => {
+    it('sostituisce solo i posti presenti nel delta', () => {
+      const base = [
+        { id: 1, fila: 'A', numero: 1, disponibile: true, riservato_staff: false, stato: 'disponibile' as const },
+        { id: 2, fila: 'A', numero: 2, disponibile: true, riservato_staff: false, stato: 'disponibile' as const },
+      ]
+      const result = api.unisciPosti(base, [{ ...base[1], stato: 'bloccato' }])
+      expect(result.map((p) => p.stato)).toEqual(['disponibile', 'bloccato'])
+      expect(result[0]).toBe(base[0])
+    })
+
+    it('restituisce la stessa mappa con delta vuoto', () => {
+      const base = [{ id: 1, fila: 'A', numero: 1, disponibile: true, riservato_staff: false, stato: 'disponibile' as const }]
+      expect(api.unisciPosti(base, [])).toBe(base)
+    })
+  })
+
+  describe('decodificaStati', () => {
+    it('legge 2 bit per posto a partire dai bit meno significativi', () => {
+      // posti: disponibile, occupato, non_disponibile, bloccato | occupato
+      const stati = btoa(String.fromCharCode(0b11100100, 0b01))
+      expect(api.decodificaStati(stati, 5)).toEqual(['disponibile', 'occupato', 'non_disponibile', 'bloccato', 'occupato'])
+    })
+  })
 })
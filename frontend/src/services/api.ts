@@ -1,7 +1,57 @@
-const API_BASE = '/api';
+/** Evento scelto con ?evento=<id> nell'URL della pagina; senza parametro l'evento predefinito. */
+function apiBase(): string {
+  const evento = typeof window !== 'undefined' ? new URLSearchParams(window.location.search).get('evento') : null;
+  return evento && /^\d+$/.test(evento) ? `/api/eventi/${evento}` : '/api';
+}
+
+const API_BASE = apiBase();
+
+let ammissione = '';
+
+/** Token di ammissione della sala d'attesa, inviato con le chiamate di blocco e prenotazione. */
+export function impostaAmmissione(token: string): void {
+  ammissione = token;
+}
+
+function sessionHeaders(sessionId: string): Record<string, string> {
+  return ammissione ? { 'X-Session-Id': sessionId, 'X-Ammissione': ammissione } : { 'X-Session-Id': sessionId };
+}
+
+/** `apertura`: inizio delle vendite in secondi epoch (null se non ancora fissato dall'admin). */
+export type StatoCoda = { attiva: boolean; apertura?: number | null; ammessi_fino_a?: number; al_minuto?: number };
+
+/** Numeri ammessi finora dalla sala d'attesa (risposta uguale per tutti, cacheabile). */
+export async function statoCoda(): Promise<StatoCoda> {
+  const r = await fetch(`${API_BASE}/coda/stato`);
+  if (!r.ok) throw new Error('Sala d\'attesa non raggiungibile');
+  return r.json();
+}
+
+export async function entraInCoda(): Promise<StatoCoda & { token?: string; numero?: number }> {
+  const r = await fetch(`${API_BASE}/coda`, { method: 'POST' });
+  const data = await r.json().catch(() => ({}));
+  if (!r.ok) throw new Error(data.error || 'Errore ingresso in coda');
+  return data;
+}
 
-function sessionHeaders(sessionId: string): HeadersInit {
-  return { 'X-Session-Id': sessionId };
+/**
+ * Chiede l'ammissione con il token della coda: `ammissione` se è il proprio turno, altrimenti la posizione.
+ * `scaduto` se il token della coda non è più valido (si rientra con un nuovo numero); altri errori rigettano.
+ */
+export async function ammissioneCoda(
+  sessionId: string,
+  token: string
+): Promise<{ ammissione?: string; scade_tra?: number; posizione?: number; scaduto?: boolean }> {
+  const r = await fetch(`${API_BASE}/coda/ammissione`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', ...sessionHeaders(sessionId) },
+    body: JSON.stringify({ session_id: sessionId, token }),
+  });
+  const data = await r.json().catch(() => ({}));
+  if (r.status === 409) return { posizione: data.posizione };
+  if (r.status === 400) return { scaduto: true };
+  if (!r.ok) throw new Error(data.error || 'Errore sala d\'attesa');
+  return data;
 }
 
 export async function getSpettacolo(): Promise<{
@@ -22,6 +72,80 @@ export async function getPosti(sessionId: string = ''): Promise<import('../types
   return r.json();
 }
 
+const CODICI_STATO: import('../types').Posto['stato'][] = ['disponibile', 'occupato', 'non_disponibile', 'bloccato'];
+
+/** Decodifica il vettore di /api/posti/stato: 2 bit per posto, 4 posti per byte dai bit meno significativi. */
+export function decodificaStati(stati: string, n: number): import('../types').Posto['stato'][] {
+  const bin = atob(stati);
+  const out: import('../types').Posto['stato'][] = new Array(n);
+  for (let i = 0; i < n; i++) out[i] = CODICI_STATO[(bin.charCodeAt(i >> 2) >> ((i & 3) * 2)) & 3];
+  return out;
+}
+
+type PostoLayout = Pick<import('../types').Posto, 'id' | 'fila' | 'numero' | 'settore' | 'x' | 'y'>;
+let layoutPosti: { hash: string; posti: PostoLayout[] } | null = null;
+
+/**
+ * Come getPosti, ma scarica solo il vettore compatto degli stati: il layout (statico) viene
+ * richiesto solo quando cambia il suo hash ed è cacheabile dal browser. `disponibile` e
+ * `riservato_staff` sono ricavati dallo stato (la pagina pubblica usa solo `stato`).
+ */
+export async function getPostiCompatti(sessionId: string = ''): Promise<import('../types').Posto[]> {
+  const url = sessionId ? `${API_BASE}/posti/stato?session_id=${encodeURIComponent(sessionId)}` : `${API_BASE}/posti/stato`;
+  const r = await fetch(url, { headers: sessionId ? sessionHeaders(sessionId) : {} });
+  if (!r.ok) throw new Error('Errore caricamento posti');
+  const stato: { layout: string; n: number; stati: string; miei: number[] } = await r.json();
+  if (!layoutPosti || layoutPosti.hash !== stato.layout) {
+    const l = await fetch(`${API_BASE}/posti/layout?v=${stato.layout}`);
+    if (!l.ok) throw new Error('Errore caricamento posti');
+    layoutPosti = { hash: stato.layout, posti: (await l.json()).posti };
+  }
+  if (layoutPosti.posti.length !== stato.n) return getPosti(sessionId);
+  const stati = decodificaStati(stato.stati, stato.n);
+  const miei = new Set(stato.miei);
+  return layoutPosti.posti.map((p, i) => {
+    const s = miei.has(p.id) ? 'bloccato_da_me' : stati[i];
+    return { ...p, stato: s, disponibile: s !== 'non_disponibile', riservato_staff: false };
+  });
+}
+
+/** Sostituisce nella mappa i posti ricevuti da un delta (stream o /api/posti/changes). */
+export function unisciPosti(
+  posti: import('../types').Posto[],
+  aggiornati: import('../types').Posto[]
+): import('../types').Posto[] {
+  if (aggiornati.length === 0) return posti;
+  const byId = new Map(aggiornati.map((p) => [p.id, p]));
+  return posti.map((p) => byId.get(p.id) ?? p);
+}
+
+/**
+ * Apre lo stream SSE delle modifiche ai posti. Il browser si riconnette da solo
+ * (inviando Last-Event-ID); `onResync` indica che va ricaricata l'intera mappa.
+ * Ritorna la funzione che chiude lo stream.
+ */
+export function apriStreamPosti(
+  sessionId: string,
+  handlers: {
+    onPosti: (posti: import('../types').Posto[]) => void;
+    onResync: () => void;
+    onStato?: (connesso: boolean) => void;
+  }
+): () => void {
+  const es = new EventSource(`${API_BASE}/posti/stream?session_id=${encodeURIComponent(sessionId)}`);
+  es.addEventListener('posti', (e) => {
+    try {
+      handlers.onPosti(JSON.parse((e as MessageEvent).data).posti ?? []);
+    } catch {
+      handlers.onResync();
+    }
+  });
+  es.addEventListener('resync', () => handlers.onResync());
+  es.onopen = () => handlers.onStato?.(true);
+  es.onerror = () => handlers.onStato?.(false);
+  return () => es.close();
+}
+
 export async function bloccaPosti(
   sessionId: string,
   postoIds: number[]
@@ -108,8 +232,24 @@ export async function getPrenotazioni(): Promise<import('../types').Prenotazione
   return r.json();
 }
 
-export async function getFile(password: string): Promise<{ file: string[]; riservate: string[] }> {
-  const r = await fetch(`${API_BASE}/admin/file?password=${encodeURIComponent(password)}`);
+/** Scambia la password admin con un token firmato a scadenza (le altre chiamate admin usano il token). */
+export async function loginAdmin(password: string): Promise<{ token: string; scade_tra: number }> {
+  const r = await fetch('/api/admin/login', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ password }),
+  });
+  const data = await r.json().catch(() => ({}));
+  if (!r.ok) throw new Error(data.error || 'Non autorizzato');
+  return data;
+}
+
+function adminHeaders(token: string): Record<string, string> {
+  return { Authorization: `Bearer ${token}` };
+}
+
+export async function getFile(token: string): Promise<{ file: string[]; riservate: string[] }> {
+  const r = await fetch(`${API_BASE}/admin/file`, { headers: adminHeaders(token) });
   if (!r.ok) throw new Error('Non autorizzato');
   return r.json();
 }
@@ -117,11 +257,11 @@ export async function getFile(password: string): Promise<{ file: string[]; riser
 export async function setFilaRiservata(
   fila: string,
   riservato: boolean,
-  password: string
+  token: string
 ): Promise<{ aggiornati: number }> {
   const r = await fetch(`${API_BASE}/admin/file/${encodeURIComponent(fila)}`, {
     method: 'PUT',
-    headers: { 'Content-Type': 'application/json', 'X-Admin-Password': password },
+    headers: { 'Content-Type': 'application/json', ...adminHeaders(token) },
     body: JSON.stringify({ riservato_staff: riservato }),
   });
   const data = await r.json().catch(() => ({}));
@@ -129,9 +269,9 @@ export async function setFilaRiservata(
   return data;
 }
 
-export async function getAdminPosti(password: string): Promise<import('../types').Posto[]> {
+export async function getAdminPosti(token: string): Promise<import('../types').Posto[]> {
   const r = await fetch(`${API_BASE}/admin/posti`, {
-    headers: { 'X-Admin-Password': password },
+    headers: adminHeaders(token),
   });
   if (!r.ok) throw new Error('Non autorizzato');
   return r.json();
@@ -140,11 +280,11 @@ export async function getAdminPosti(password: string): Promise<import('../types'
 export async function setPostoRiservato(
   postoId: number,
   riservato: boolean,
-  password: string
+  token: string
 ): Promise<{ ok: boolean; riservato_staff: boolean }> {
   const r = await fetch(`${API_BASE}/admin/posti/${postoId}`, {
     method: 'PUT',
-    headers: { 'Content-Type': 'application/json', 'X-Admin-Password': password },
+    headers: { 'Content-Type': 'application/json', ...adminHeaders(token) },
     body: JSON.stringify({ riservato_staff: riservato }),
   });
   const data = await r.json().catch(() => ({}));
@@ -152,32 +292,32 @@ export async function setPostoRiservato(
   return data;
 }
 
-export async function getExportData(password: string): Promise<{
+export async function getExportData(token: string): Promise<{
   bySeat: import('../types').ExportBySeat[];
   byPerson: import('../types').ExportByPerson[];
 }> {
   const r = await fetch(`${API_BASE}/admin/export`, {
-    headers: { 'X-Admin-Password': password },
+    headers: adminHeaders(token),
   });
   if (!r.ok) throw new Error('Non autorizzato');
   return r.json();
 }
 
-export async function getImpostazioni(password: string): Promise<import('../types').Impostazioni> {
+export async function getImpostazioni(token: string): Promise<import('../types').Impostazioni> {
   const r = await fetch(`${API_BASE}/admin/impostazioni`, {
-    headers: { 'X-Admin-Password': password },
+    headers: adminHeaders(token),
   });
   if (!r.ok) throw new Error('Non autorizzato');
   return r.json();
 }
 
 export async function putImpostazioni(
-  password: string,
+  token: string,
   data: Partial<import('../types').Impostazioni>
 ): Promise<{ ok: boolean }> {
   const r = await fetch(`${API_BASE}/admin/impostazioni`, {
     method: 'PUT',
-    headers: { 'Content-Type': 'application/json', 'X-Admin-Password': password },
+    headers: { 'Content-Type': 'application/json', ...adminHeaders(token) },
     body: JSON.stringify(data),
   });
   const body = await r.json().catch(() => ({}));
@@ -185,10 +325,10 @@ export async function putImpostazioni(
   return body;
 }
 
-export async function generaPosti(password: string): Promise<{ ok: boolean; creati: number }> {
+export async function generaPosti(token: string): Promise<{ ok: boolean; creati: number }> {
   const r = await fetch(`${API_BASE}/admin/impostazioni/genera-posti`, {
     method: 'POST',
-    headers: { 'X-Admin-Password': password },
+    headers: adminHeaders(token),
   });
   const body = await r.json().catch(() => ({}));
   if (!r.ok) throw new Error(body.error || 'Errore');
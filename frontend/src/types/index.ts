@@ -13,10 +13,14 @@ export interface Posto {
   disponibile: boolean;
   riservato_staff: boolean;
   stato: 'disponibile' | 'occupato' | 'non_disponibile' | 'bloccato' | 'bloccato_da_me';
-  /** Presente quando stato === 'occupato' (per colore per persona) */
+  /** Solo da /api/admin/posti, quando stato === 'occupato' (per colore per persona) */
   prenotazione_nome?: string;
   prenotazione_nome_allieva?: string;
   prenotazione_email?: string;
+  /** Da layout sala, se definiti */
+  settore?: string | null;
+  x?: number | null;
+  y?: number | null;
 }
 
 export interface ExportBySeat {